@@ -1,12 +1,26 @@
 import sys
 import pyglet
 import resources.indices as ind
-from controller import controller, startup
+from controller import startup
 
 parameters = startup.get_parameters(sys.argv[1:])
-if parameters[ind.RUN_SIM]:
-    simulation = controller.Controller(
-        disp_par=parameters[ind.DISP_PAR],
+if not parameters[ind.RUN_SIM]:
+    sys.exit(0)
+elif parameters[ind.REGRESS]:
+    # No window will be created, so do not require a display.
+    pyglet.options['shadow_window'] = False
+    from controller import regression
+    sys.exit(regression.main(update=parameters[ind.REGRESS_UPDATE]))
+elif len(parameters[ind.ANALYZE]) > 0:
+    # No window will be created, so do not require a display.
+    pyglet.options['shadow_window'] = False
+    from model import analytics
+    sys.exit(analytics.main(parameters[ind.ANALYZE]))
+elif parameters[ind.RENDER_PATH] != None:
+    # No window will be created, so do not require a display.
+    pyglet.options['shadow_window'] = False
+    from controller import headless
+    simulation = headless.HeadlessController(
         planet_locx=parameters[ind.INIT_PLANET_LOCX],
         planet_locy=parameters[ind.INIT_PLANET_LOCY],
         moon_locx=parameters[ind.INIT_MOON_LOCX],
@@ -14,7 +28,52 @@ if parameters[ind.RUN_SIM]:
         moon_velx=parameters[ind.INIT_VELX],
         moon_vely=parameters[ind.INIT_VELY],
         win_width=parameters[ind.WIN_WIDTH],
+        win_height=parameters[ind.WIN_HEIGHT],
+        path_history=parameters[ind.PATH_HISTORY],
+        integrator=parameters[ind.INTEGRATOR],
+        step=parameters[ind.STEP_SIZE],
+        planets=parameters[ind.PLANETS],
+        moons=parameters[ind.MOONS],
+        telemetry=parameters[ind.TELEMETRY],
+        telemetry_format=parameters[ind.TELEMETRY_FMT],
+        precision=parameters[ind.PRECISION],
+        regularize=parameters[ind.REGULARIZE],
+        forces=parameters[ind.FORCES])
+    simulation.render(
+        parameters[ind.RENDER_PATH], parameters[ind.RENDER_TIME])
+elif len(parameters[ind.COMPARE]) > 0:
+    from controller import compare
+    simulation = compare.ComparisonController(
+        [parameters] + parameters[ind.COMPARE],
+        win_width=parameters[ind.WIN_WIDTH],
         win_height=parameters[ind.WIN_HEIGHT])
     pyglet.app.run()
 else:
-    sys.exit(0)
+    from controller import controller
+    simulation = controller.Controller(
+        disp_par=parameters[ind.DISP_PAR],
+        profile=parameters[ind.PROFILE],
+        trace_path=parameters[ind.TRACE_PATH],
+        planet_locx=parameters[ind.INIT_PLANET_LOCX],
+        planet_locy=parameters[ind.INIT_PLANET_LOCY],
+        moon_locx=parameters[ind.INIT_MOON_LOCX],
+        moon_locy=parameters[ind.INIT_MOON_LOCY],
+        moon_velx=parameters[ind.INIT_VELX],
+        moon_vely=parameters[ind.INIT_VELY],
+        win_width=parameters[ind.WIN_WIDTH],
+        win_height=parameters[ind.WIN_HEIGHT],
+        path_history=parameters[ind.PATH_HISTORY],
+        integrator=parameters[ind.INTEGRATOR],
+        step=parameters[ind.STEP_SIZE],
+        planets=parameters[ind.PLANETS],
+        moons=parameters[ind.MOONS],
+        telemetry=parameters[ind.TELEMETRY],
+        telemetry_format=parameters[ind.TELEMETRY_FMT],
+        serve_port=parameters[ind.SERVE_PORT],
+        serve_rate=parameters[ind.SERVE_RATE],
+        governor=parameters[ind.GOVERNOR],
+        cycles=parameters[ind.CYCLES],
+        precision=parameters[ind.PRECISION],
+        regularize=parameters[ind.REGULARIZE],
+        forces=parameters[ind.FORCES])
+    pyglet.app.run()
@@ -0,0 +1,292 @@
+import math
+import pyglet
+import model
+import resources.images
+import resources.indices as ind
+from pyglet import gl
+from pyglet.window import key, mouse
+from model.engine import Vector
+from model.stepper import Stepper, batches
+from view.camera import Camera
+from view.viewer import PaneGroup, PointGroup
+from resources import const
+
+class ComparisonController(pyglet.window.Window):
+    """Runs several scenarios side by side in one window.
+
+    The window is split into a grid of panes, one per scenario
+    (variant). Every variant has its own planets, moons and stepper,
+    but all of them are advanced by a single update per frame and
+    drawn from a single graphics batch, in which each pane is a
+    PaneGroup with its own camera. The cameras initially fit the
+    window of each scenario into its pane. The variants are advanced
+    with const.FRAME_DIVS substeps per frame (no governor), so runs
+    are the same every time.
+
+    Space starts and pauses all the runs and S stops them, putting
+    every scenario back at its start. Scrolling zooms the pane under
+    the mouse and dragging with the right button pans it.
+    """
+
+    def __init__(self, variants, win_width=const.MAIN_WIN_WIDTH,
+                 win_height=const.MAIN_WIN_HEIGHT):
+        """Initialization.
+
+        Args:
+            variants (list of dict): Startup parameters of each
+                scenario (see startup.get_parameters). The name of the
+                scenario is given by the ind.NAME entry.
+            win_width, win_height (int): Dimensions of the window (px).
+        """
+        config = pyglet.gl.Config(
+            double_buffer=True, sample_buffers=1, samples=4)
+        super().__init__(
+            width=win_width,
+            height=win_height,
+            caption=const.MAIN_WIN_TITLE,
+            config=config)
+        self.simstate = ind.STOPPED
+        self.run_time = 0
+        self.batch = pyglet.graphics.Batch()
+        scene_group = pyglet.graphics.OrderedGroup(0)
+        self.ui_group = pyglet.graphics.OrderedGroup(1)
+        columns = math.ceil(math.sqrt(len(variants)))
+        rows = math.ceil(len(variants) / columns)
+        width = win_width // columns
+        height = win_height // rows
+        self.panes = list()
+        for index, variant in enumerate(variants):
+            row, column = divmod(index, columns)
+            self.panes.append(_Pane(
+                variant, self.batch, column * width,
+                win_height - (row + 1) * height, width, height,
+                scene_group, self.ui_group))
+        # Pane borders.
+        borders = list()
+        for column in range(1, columns):
+            borders.extend((column * width, 0, column * width, win_height))
+        for row in range(1, rows):
+            borders.extend((0, row * height, win_width, row * height))
+        if borders:
+            self.batch.add(
+                len(borders) // 2, gl.GL_LINES, self.ui_group,
+                ("v2f", borders),
+                ("c4f", const.COMPARE_BORDER_CLR * (len(borders) // 2)))
+        pyglet.gl.glClearColor(*const.MAIN_WIN_CLEAR_CLR)
+
+#######################################
+# Pyglet event handlers.
+# These methods respond to events dispatched by the Pyglet main loop.
+
+    def on_draw(self):
+        """Handler for window paint events."""
+        for pane in self.panes:
+            pane.render(self.simstate)
+        self.clear()
+        gl.glEnable(gl.GL_BLEND)
+        gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+        gl.glMatrixMode(gl.GL_MODELVIEW)
+        gl.glLoadIdentity()
+        self.batch.draw()
+
+    def on_key_press(self, symbol, modifiers):
+        """Handler for key-press events.
+
+        Space starts and pauses the runs and S stops them. Other keys
+        are passed on (e.g., Escape closes the window).
+        """
+        if symbol == key.SPACE:
+            self.toggle_sim()
+        elif symbol == key.S:
+            self.stop_sim()
+        else:
+            super().on_key_press(symbol, modifiers)
+
+    def on_mouse_scroll(self, x, y, scroll_x, scroll_y):
+        """Handler for mouse-scroll events (zooms the pane)."""
+        pane = self.__get_pane(x, y)
+        if pane != None:
+            pane.camera.zoom_at(
+                x - pane.group.x, y - pane.group.y,
+                const.CAMERA_ZOOM_STEP ** scroll_y)
+
+    def on_mouse_drag(self, x, y, dx, dy, buttons, modifiers):
+        """Handler for mouse-drag events (pans the pane)."""
+        pane = self.__get_pane(x, y)
+        if pane != None and mouse.RIGHT & buttons:
+            pane.camera.pan(dx, dy)
+
+#######################################
+# Slots.
+
+    def update(self, dt):
+        """Advances all the scenarios by a frame.
+
+        Args:
+            dt (float): Frame time step in simulation seconds.
+
+        Returns:
+            Nothing.
+        """
+        self.run_time += dt
+        if self.run_time > const.SIMSEC_PER_YEAR:
+            self.run_time = 0
+        for pane in self.panes:
+            pane.stepper.advance(dt)
+
+    def toggle_sim(self):
+        """Starts and pauses all the runs."""
+        if self.simstate == ind.RUNNING:
+            pyglet.clock.unschedule(self.update)
+            self.simstate = ind.PAUSED
+        else:
+            self.simstate = ind.RUNNING
+            pyglet.clock.schedule_interval(self.update, 1 / const.FRAME_RATE)
+
+    def stop_sim(self):
+        """Stops all the runs and puts the scenarios back at their start."""
+        if self.simstate == ind.RUNNING:
+            pyglet.clock.unschedule(self.update)
+        self.simstate = ind.STOPPED
+        self.run_time = 0
+        for pane in self.panes:
+            pane.restore()
+
+#######################################
+# Generic methods.
+
+    def __get_pane(self, x, y):
+        """Returns the pane containing a window point, or None."""
+        for pane in self.panes:
+            group = pane.group
+            if group.x <= x < group.x + pane.camera.width and \
+                    group.y <= y < group.y + pane.camera.height:
+                return pane
+        return None
+
+class _Pane():
+    """Scenario shown in one pane of a ComparisonController."""
+
+    def __init__(self, variant, batch, left, bottom, width, height,
+                 scene_group, ui_group):
+        planets = variant[ind.PLANETS]
+        if planets == None:
+            planets = [(variant[ind.INIT_PLANET_LOCX],
+                        variant[ind.INIT_PLANET_LOCY], 0, 0,
+                        const.PLANET_MASS)]
+        moons = variant[ind.MOONS]
+        if moons == None:
+            moons = [(variant[ind.INIT_MOON_LOCX], variant[ind.INIT_MOON_LOCY],
+                      variant[ind.INIT_VELX], variant[ind.INIT_VELY],
+                      const.MOON_MASS)]
+        batched = list()
+        if batches(variant[ind.INTEGRATOR], variant[ind.PRECISION]):
+            moons, batched = moons[:1], moons[1:]
+        self.name = variant[ind.NAME]
+        self.batch = batch
+        self.camera = Camera(width, height)
+        # Fit the window of the scenario into the pane.
+        self.camera.center = Vector(
+            variant[ind.WIN_WIDTH] / 2, variant[ind.WIN_HEIGHT] / 2)
+        self.camera.zoom = min(width / variant[ind.WIN_WIDTH],
+                               height / variant[ind.WIN_HEIGHT])
+        self.group = PaneGroup(self.camera, left, bottom, scene_group)
+        self.path_group = pyglet.graphics.OrderedGroup(0, self.group)
+        body_group = pyglet.graphics.OrderedGroup(1, self.group)
+        self.batched_group = PointGroup(self.camera, body_group)
+        self.planets = [
+            model.planet.Planet(
+                resources.images.planet, locus=Vector(x, y), mass=mass,
+                batch=batch, velocity=Vector(velx, vely), group=body_group)
+            for x, y, velx, vely, mass in planets]
+        self.moons = [
+            model.moon.Moon(
+                images=[resources.images.moon,
+                        resources.images.crash_animation],
+                locus=Vector(x, y), velocity=Vector(velx, vely), mass=mass,
+                batch=batch, path_history=variant[ind.PATH_HISTORY],
+                group=body_group)
+            for x, y, velx, vely, mass in moons]
+        self.moon = self.moons[0]
+        self.start = (Vector(self.moon.locus.x, self.moon.locus.y),
+                      Vector(self.moon.velocity.x, self.moon.velocity.y))
+        self.stepper = Stepper(
+            self.moon, self.planets, gravity=const.GRAVITY,
+            integrator=variant[ind.INTEGRATOR], step=variant[ind.STEP_SIZE],
+            companions=self.moons[1:], precision=variant[ind.PRECISION],
+            regularize=variant[ind.REGULARIZE], forces=variant[ind.FORCES],
+            batched=batched)
+        self.energy = self.__energy()
+        self.path = None
+        self.batched = list()
+        self.label = pyglet.text.Label(
+            font_name=const.MOON_PAR_LBL_FONT,
+            font_size=const.MOON_PAR_LBL_SIZE,
+            multiline=True,
+            width=width,
+            x=left + const.MOON_PAR_LBL_LOCX,
+            y=bottom + height - const.MOON_PAR_LBL_LOCY,
+            anchor_x='left',
+            anchor_y='top',
+            batch=batch,
+            group=ui_group)
+
+    def render(self, state):
+        """Updates the path, batched moons and label of the pane for
+        painting.
+
+        Args:
+            state (int): Current state of the simulation.
+
+        Returns:
+            Nothing.
+        """
+        if self.path != None:
+            self.path.delete()
+            self.path = None
+        vertices = self.moon.path
+        count = len(vertices) // 2
+        if count >= 2:
+            # Line segments, so that the paths of all the panes can be
+            # drawn together.
+            lines = list()
+            colors = list()
+            for index in range(1, count):
+                lines.extend(vertices[2 * index - 2:2 * index + 2])
+                colors.extend(const.MOON_PATH_CLR[:3] + (index / count,))
+                colors.extend(const.MOON_PATH_CLR[:3] + ((index + 1) / count,))
+            self.path = self.batch.add(
+                len(lines) // 2, gl.GL_LINES, self.path_group,
+                ("v2f", lines), ("c4f", colors))
+        for vertex_list in self.batched:
+            vertex_list.delete()
+        self.batched = list()
+        if self.stepper.ensemble != None:
+            for positions, color in zip(
+                self.stepper.ensemble.positions(),
+                [const.MOON_BATCH_CLR, const.MOON_BATCH_CRASH_CLR]):
+                if len(positions) > 0:
+                    self.batched.append(self.batch.add(
+                        len(positions), gl.GL_POINTS, self.batched_group,
+                        ("v2f", positions.ravel().tolist()),
+                        ("c4f", color * len(positions))))
+        energy = self.__energy()
+        drift = 0 if self.energy == 0 else (energy - self.energy) / abs(
+            self.energy)
+        self.label.text = const.COMPARE_LBL_STRING.format(
+            self.name, self.stepper.time * const.DAY_PER_SIMSEC, drift)
+        self.label.color = const.MOON_PAR_LBL_RUN_CLR
+        if state != ind.RUNNING:
+            self.label.color = const.MOON_PAR_LBL_PS_CLR
+        if self.moon.crashed:
+            self.label.color = const.MOON_PAR_LBL_CRASH_CLR
+
+    def restore(self):
+        """Puts the scenario back at its start."""
+        self.moon.reset(*self.start)
+        self.stepper.restore()
+
+    def __energy(self):
+        """Returns the total energy of the moon."""
+        return model.engine.energy(
+            self.moon, self.planets, gravity=const.GRAVITY)[ind.TOTAL]
@@ -1,27 +1,95 @@
 import copy
+import sys
+import time
 import pyglet
 import model
 import view.viewer
 import resources.images
 import resources.indices as ind
-from pyglet.window import mouse
+from pyglet.window import key, mouse
 from model.engine import Vector
+from model.cache import TrajectoryCache
+from model.history import History
+from model.predictor import Predictor
+from model.stepper import Stepper, batches
+from controller.governor import Governor
+from controller.picking import HitGrid
+from controller.profiler import Profiler
+from controller.server import StateServer, snapshot
+from controller import telemetry
+from controller.telemetry import TelemetrySink
 from resources import const
 
 class Controller(pyglet.window.Window):
     """Manages the simulation, window and events."""
 
     def __init__(self,
-        disp_par=False,
+        disp_par=False, profile=False, trace_path=None,
         planet_locx=0, planet_locy=0,
         moon_locx=0, moon_locy=0, moon_velx=0, moon_vely=0,
-        win_width=const.MAIN_WIN_WIDTH, win_height=const.MAIN_WIN_HEIGHT):
+        win_width=const.MAIN_WIN_WIDTH, win_height=const.MAIN_WIN_HEIGHT,
+        path_history=const.MOON_PATH_HISTORY, integrator=ind.AUTO,
+        step=const.STEP_SIZE, planets=None, moons=None,
+        telemetry=None, telemetry_format=ind.NDJSON, serve_port=None,
+        serve_rate=const.SERVER_RATE, governor=True, cycles=False,
+        precision=None, regularize=False, forces=None):
         """Initialization.
 
         Args:
             disp_par (bool): Flag for whether the simulation
                 label should be drawn.
+            profile (bool): Flag for whether frame timing should be
+                recorded and drawn.
+            trace_path (str): If not None, the frame timing trace is
+                written to this file when the window is closed.
+            path_history (int): Max number of vertices in the
+                simplified history of the moon path.
+            integrator (int): Integrator used to advance the moon
+                (ind.AUTO, ind.RK4, ind.BS or ind.NBODY).
+            step (float): Fixed RK4 step size (simulation s), or None
+                to divide each frame into FRAME_DIVS steps.
+            planets (list of tuple): If not None, the planets as
+                (x, y, velx, vely, mass) tuples instead of the single
+                planet given by planet_locx and planet_locy.
+            moons (list of tuple): If not None, the moons as
+                (x, y, velx, vely, mass) tuples instead of the single
+                moon given by the moon arguments. The first moon is
+                the one that can be moved with the mouse, and only
+                its path is drawn.
+            telemetry (str): If not None, the target to which the moon
+                state is streamed every frame (see TelemetrySink).
+            telemetry_format (int): ind.NDJSON or ind.BINARY.
+            serve_port (int): If not None, the port on which the state
+                server (see StateServer) listens.
+            serve_rate (float): Rate at which the state server sends
+                the state to its clients (Hz).
+            governor (bool): Whether the RK4 substeps per frame are
+                adjusted to the frame budget and error (see Governor)
+                instead of fixed at FRAME_DIVS.
+            cycles (bool): Whether periodic orbits are replayed lap
+                after lap from their recorded cycle once it closes
+                (see TrajectoryCache).
+            precision (int): If not None, the companions are only
+                kept as states of this precision (ind.FLOAT32 or
+                ind.FLOAT64) and advanced together by a batched engine
+                (see Ensemble), unless the integrator does not allow
+                it (see stepper.batches).
+            regularize (bool): Whether close approaches to the planets
+                are integrated in regularized coordinates (see
+                Stepper).
+            forces (list of tuple): If not None, the (name, settings)
+                of the force models acting on the moons (see
+                forces.compose).
         """
+        if planets == None:
+            planets = [(planet_locx, planet_locy, 0, 0, const.PLANET_MASS)]
+        if moons == None:
+            moons = [(moon_locx, moon_locy, moon_velx, moon_vely,
+                      const.MOON_MASS)]
+        moon_locx, moon_locy, moon_velx, moon_vely = moons[0][:4]
+        batched = list()
+        if batches(integrator, precision):
+            moons, batched = moons[:1], moons[1:]
         config = pyglet.gl.Config(
             double_buffer=True, sample_buffers=1, samples=4)
         super().__init__(
@@ -32,27 +100,46 @@ class Controller(pyglet.window.Window):
         # Initialize the simulation master data object.
         self.simstate = ind.STOPPED
         self.simmode = ind.READY
-        self.simoptions = {ind.DISP_PAR: disp_par}
+        self.simoptions = {
+            ind.DISP_PAR: disp_par,
+            ind.PROFILE: profile,
+            ind.TRACE_PATH: trace_path}
+        self.profiler = Profiler(enabled=profile)
         self.resets = {
             ind.INIT_LOC: Vector(moon_locx, moon_locy),
             ind.INIT_VEL: Vector(moon_velx, moon_vely),
             ind.LAST_LOC: Vector(moon_locx, moon_locy),
             ind.LAST_VEL: Vector(moon_velx, moon_vely)}
+        # Latest drag position (world), applied once per frame.
+        self.drag = None
 
-        # Initialize the simulation objects and the graphics batch.
+        # Initialize the simulation objects and the graphics batches.
+        # The graphics batch is drawn through the camera, and the ui
+        # batch is drawn in window coordinates.
         self.graphics_batch = pyglet.graphics.Batch()
+        self.ui_batch = pyglet.graphics.Batch()
         self.planets = list()
-        self.planets.append(
-            model.planet.Planet(
-                resources.images.planet,
-                locus=Vector(planet_locx, planet_locy),
-                batch=self.graphics_batch))
-
-        self.moon = model.moon.Moon(
-            images=[resources.images.moon, resources.images.crash_animation],
-            locus=Vector(moon_locx, moon_locy),
-            velocity=Vector(moon_velx, moon_vely),
-            batch=self.graphics_batch)
+        for x, y, velx, vely, mass in planets:
+            self.planets.append(
+                model.planet.Planet(
+                    resources.images.planet,
+                    locus=Vector(x, y),
+                    mass=mass,
+                    batch=self.graphics_batch,
+                    velocity=Vector(velx, vely)))
+
+        self.moons = list()
+        for x, y, velx, vely, mass in moons:
+            self.moons.append(
+                model.moon.Moon(
+                    images=[resources.images.moon,
+                            resources.images.crash_animation],
+                    locus=Vector(x, y),
+                    velocity=Vector(velx, vely),
+                    mass=mass,
+                    batch=self.graphics_batch,
+                    path_history=path_history))
+        self.moon = self.moons[0]
 
         self.player = model.player.Player(
             start_img=resources.images.start_button,
@@ -61,11 +148,51 @@ class Controller(pyglet.window.Window):
             reset_img=resources.images.reset_button,
             x=win_width,
             y=win_height,
-            batch=self.graphics_batch)
+            batch=self.ui_batch)
         self.player.x -= self.player.width
         self.player.y -= self.player.height
 
+        # Runs that are stopped or reset and played again are replayed
+        # from the cache.
+        self.cache = TrajectoryCache(cycles=cycles)
+        self.stepper = Stepper(
+            self.moon, self.planets, gravity=const.GRAVITY,
+            integrator=integrator, step=step, profiler=self.profiler,
+            companions=self.moons[1:], cache=self.cache,
+            precision=precision, regularize=regularize, forces=forces,
+            batched=batched)
+        self.governor = None
+        if governor:
+            self.governor = Governor(self.stepper)
+        # The predictor assumes fixed planets, so its trajectories
+        # would be wrong once the nbody integrator has moved them.
+        self.predictor = None
+        if integrator != ind.NBODY:
+            self.predictor = Predictor(
+                self.planets, gravity=const.GRAVITY, integrator=integrator,
+                forces=forces)
         self.run_time = 0
+        self.telemetry = None
+        if telemetry != None:
+            self.telemetry = TelemetrySink(telemetry, telemetry_format)
+        self.history = History(const.HISTORY_CHANNELS)
+        self.server = None
+        if serve_port != None:
+            try:
+                self.server = StateServer(serve_port, history=self.history)
+            except Exception as err:
+                sys.stderr.write(str(err))
+                sys.exit(1)
+            pyglet.clock.schedule_interval(self.serve, 1 / serve_rate)
+
+        # Register the clickable objects in order of precedence. The
+        # ui grid uses window coordinates and takes precedence over
+        # the hit grid, which uses world coordinates.
+        self.ui_grid = HitGrid()
+        self.ui_grid.register(self.player)
+        self.hit_grid = HitGrid()
+        self.hit_grid.register(self.moon, ind.MOON)
+        self.hit_grid.register(self.moon, ind.ARROW)
 
         # Initialize the viewer.
         self.viewer = view.viewer.Viewer(self)
@@ -79,23 +206,59 @@ class Controller(pyglet.window.Window):
 
     def on_draw(self):
         """Handler for window paint events."""
+        profiler = self.profiler
+        self.__apply_drag()
+        self.viewer.camera.update()
+        self.viewer.cull(self.moons + self.planets)
         if self.simstate in [ind.STOPPED, ind.PAUSED] and not self.moon.crashed:
-            self.viewer.render_arrow(self.moon)
-        self.viewer.render_path(self.moon)
-        energy = model.engine.energy(
-            self.moon, self.planets, gravity=const.GRAVITY)
+            with profiler.section(const.PROF_ARROW):
+                self.viewer.render_arrow(self.moon)
+            if self.predictor != None:
+                self.predictor.request(self.moon)
+                self.viewer.render_prediction(self.predictor.result())
+        with profiler.section(const.PROF_PATH):
+            self.viewer.render_path(self.moon)
+            if self.stepper.ensemble != None:
+                self.viewer.render_batched(
+                    *self.stepper.ensemble.positions())
+        with profiler.section(const.PROF_ENERGY):
+            energy = model.engine.energy(
+                self.moon, self.planets, gravity=const.GRAVITY)
         if self.simoptions[ind.DISP_PAR]:
-            self.viewer.render_label(
-                energy, self.moon, pyglet.clock.get_fps(),
-                self.simstate, self.simmode,
-                self.run_time, self.planets[0].locus)
-        self.viewer.paint(self, self.graphics_batch)
+            with profiler.section(const.PROF_LABEL):
+                self.viewer.render_label(
+                    energy, self.moon, pyglet.clock.get_fps(),
+                    self.simstate, self.simmode,
+                    self.run_time, self.planets[0].locus,
+                    None if self.governor == None else self.governor.divs())
+        if self.simoptions[ind.PROFILE]:
+            self.viewer.render_profile(profiler.stats())
+        with profiler.section(const.PROF_PAINT):
+            self.viewer.paint(self, self.graphics_batch, self.ui_batch)
+        profiler.end_frame()
+
+    def on_close(self):
+        """Handler for window close events."""
+        if self.predictor != None:
+            self.predictor.close()
+        if self.telemetry != None:
+            self.telemetry.close()
+        if self.server != None:
+            pyglet.clock.unschedule(self.serve)
+            self.server.close()
+        if self.simoptions[ind.TRACE_PATH] != None:
+            self.profiler.export_trace(self.simoptions[ind.TRACE_PATH])
+        super().on_close()
 
     def on_mouse_press(self, x, y, button, modifiers):
         """Handler for mouse-down events."""
         if button != mouse.LEFT:
             return
-        clicked_object, info = self.__get_clicked(x, y)
+        clicked_object, info = self.ui_grid.query(x, y)
+        if clicked_object == None:
+            pos = self.viewer.camera.to_world(x, y)
+            x, y = pos.x, pos.y
+            clicked_object, info = self.__get_clicked(x, y)
         if clicked_object == None:
             return
         clicked_object.click(x=x, y=y, info=info)
@@ -104,19 +267,45 @@ class Controller(pyglet.window.Window):
         """Handler for for mouse-up events."""
         if button != mouse.LEFT:
             return
+        self.__apply_drag()
         if self.simmode in [ind.MOVE_MOON, ind.MOVE_ARROW]:
             self.resets[ind.LAST_LOC] = copy.deepcopy(self.moon.locus)
             self.resets[ind.LAST_VEL] = copy.deepcopy(self.moon.velocity)
         self.simmode = ind.READY
 
     def on_mouse_drag(self, x, y, dx, dy, buttons, modifiers):
-        """Handler for mouse-drag events."""
+        """Handler for mouse-drag events.
+
+        Dragging with the left button moves the moon or its velocity
+        arrow, and dragging with the right button pans the view. Mice
+        may send several drag events per frame, so only the latest
+        position is kept and applied once, before the next paint (see
+        __apply_drag).
+        """
+        if mouse.RIGHT & buttons:
+            self.viewer.camera.pan(dx, dy)
         if not mouse.LEFT & buttons:
             return
-        if self.simmode == ind.MOVE_MOON:
-            self.move_moon(x, y)
-        elif self.simmode == ind.MOVE_ARROW:
-            self.move_arrow(x, y)
+        if self.simmode in [ind.MOVE_MOON, ind.MOVE_ARROW]:
+            self.drag = self.viewer.camera.to_world(x, y)
+
+    def on_mouse_scroll(self, x, y, scroll_x, scroll_y):
+        """Handler for mouse-scroll events (zooms the view)."""
+        self.viewer.camera.zoom_at(x, y, const.CAMERA_ZOOM_STEP ** scroll_y)
+
+    def on_key_press(self, symbol, modifiers):
+        """Handler for key-press events.
+
+        F toggles following the moon and Home resets the view. Other
+        keys are passed on (e.g., Escape closes the window).
+        """
+        camera = self.viewer.camera
+        if symbol == key.F:
+            camera.follow(None if camera.target == self.moon else self.moon)
+        elif symbol == key.HOME:
+            camera.reset()
+        else:
+            super().on_key_press(symbol, modifiers)
 
 #######################################
 # Slots.
@@ -135,15 +324,57 @@ class Controller(pyglet.window.Window):
         This method is scheduled via Pyglet when the simulation is
         running, and unscheduled when not. The run time is also
         update in units of simulation seconds. If the run time is
-        greater than 1 year in real time, it is reset to 0.
+        greater than 1 year in real time, it is reset to 0. The moon
+        is advanced by the stepper, which uses the analytic orbit when
+        the scene qualifies, and the substeps of the RK4 steps are
+        adjusted by the governor.
         """
-        subdt = dt / const.FRAME_DIVS
-        self.run_time += dt
-        if self.run_time > const.SIMSEC_PER_YEAR:
-            self.run_time = 0
-        for step in range(0, const.FRAME_DIVS):
-            model.engine.update(
-                subdt, self.moon, self.planets, gravity=const.GRAVITY)
+        with self.profiler.section(const.PROF_UPDATE):
+            self.run_time += dt
+            if self.run_time > const.SIMSEC_PER_YEAR:
+                self.run_time = 0
+            start = time.perf_counter()
+            self.stepper.advance(dt)
+            if self.governor != None:
+                self.governor.update(time.perf_counter() - start)
+            # The history is only read by the state server.
+            values = None
+            if self.server != None:
+                values = telemetry.sample(
+                    self.run_time, self.moon, self.planets)
+                self.history.add(
+                    self.stepper.time * const.DAY_PER_SIMSEC,
+                    (self.moon.locus.x, self.moon.locus.y) + values[1:])
+            if self.telemetry != None:
+                self.telemetry.record(
+                    self.run_time, self.moon, self.planets, values=values)
+
+    def serve(self, dt):
+        """Runs the commands of the state server clients and sends them
+        the new state.
+
+        Args:
+            dt (float): Time since the last call (unused).
+
+        Returns:
+            Nothing.
+
+        This method is scheduled via Pyglet at the server rate when
+        the state server is enabled. The commands mirror the player
+        buttons: play and pause only toggle the simulation if it is
+        not already in that state.
+        """
+        for command in self.server.commands():
+            running = self.simstate == ind.RUNNING
+            if command == "toggle" or command == "play" and not running \
+                    or command == "pause" and running:
+                self.toggle_sim()
+            elif command == "stop":
+                self.stop_sim()
+            elif command == "reset":
+                self.reset_sim()
+        self.server.publish(snapshot(
+            self.simstate, self.run_time, self.moon, self.planets))
 
     def toggle_sim(self):
         """Starts and pauses the simulation.
@@ -178,6 +409,8 @@ class Controller(pyglet.window.Window):
         self.simmode = ind.READY
         self.moon.reset(self.resets[ind.INIT_LOC], self.resets[ind.INIT_VEL])
         self.run_time = 0
+        self.stepper.restore()
+        self.history.clear()
 
     def reset_sim(self):
         """Stops simulation and resets moon to last start state.
@@ -194,6 +427,8 @@ class Controller(pyglet.window.Window):
         self.simmode = ind.READY
         self.moon.reset(self.resets[ind.LAST_LOC], self.resets[ind.LAST_VEL])
         self.run_time = 0
+        self.stepper.restore()
+        self.history.clear()
 
     def move_moon(self, x, y):
         """Repositions the moon based on bouse input.
@@ -209,6 +444,8 @@ class Controller(pyglet.window.Window):
             self.simmode = ind.MOVE_MOON
             self.moon.reset(locus=Vector(x, y))
             self.run_time = 0
+            self.stepper.reset()
+            self.history.clear()
 
     def move_arrow(self, x, y):
         """Changes the velocity of the moon  based on mouse input.
@@ -230,6 +467,8 @@ class Controller(pyglet.window.Window):
             mouse_rel = mouse_abs - self.moon.locus
             self.moon.change_velocity(mouse_rel)
             self.run_time = 0
+            self.stepper.reset()
+            self.history.clear()
 
 #######################################
 # Generic methods.
@@ -247,13 +486,36 @@ class Controller(pyglet.window.Window):
         self.player.sig_reset_clicked = self.reset_sim
         self.moon.sig_moon_clicked = self.move_moon
         self.moon.sig_arrow_clicked = self.move_arrow
+        self.moon.sig_moved = self.hit_grid.moved
+
+    def __apply_drag(self):
+        """Applies the latest drag position, if any.
+
+        Args:
+            None.
+        Returns:
+            Nothing.
+
+        Moving the moon or its arrow resets its path, the stepper and
+        the history and updates the hit grid (through sig_moved), and
+        the arrow and prediction follow at the next paint, so all of
+        this is done once per frame however many drag events came in.
+        """
+        if self.drag == None:
+            return
+        pos = self.drag
+        self.drag = None
+        if self.simmode == ind.MOVE_MOON:
+            self.move_moon(pos.x, pos.y)
+        elif self.simmode == ind.MOVE_ARROW:
+            self.move_arrow(pos.x, pos.y)
 
     def __get_clicked(self, x, y):
         """Routes a mouse position to the object that contains it.
             
         Args:
-            x (int): Mouse x-coordinate.
-            y (int): Mouse y-coordinate.
+            x (float): Mouse x-coordinate (world).
+            y (float): Mouse y-coordinate (world).
 
         Returns:
             tuple (two elements): First element is the object that
@@ -261,13 +523,7 @@ class Controller(pyglet.window.Window):
                 specific to the object and may be None.
 
         If no responsive object contains the mouse point, then the
-        renturn value is (None, None).
+        renturn value is (None, None). Routing is done through the
+        hit_grid index, which only checks objects near the point.
         """
-        if model.engine.inrect(x, y, self.moon):
-            return self.moon, ind.MOON
-        elif self.moon.chk_in_arrow(x, y):
-            return self.moon, ind.ARROW
-        elif model.engine.inrect(x, y, self.player):
-            return self.player, None
-        else:
-            return None, None
+        return self.hit_grid.query(x, y)
@@ -0,0 +1,116 @@
+from resources import const
+
+class Governor():
+    """Chooses the number of RK4 substeps per frame.
+
+    The governor is given the physics time of each frame and the
+    error estimate of the stepper (see Stepper.estimate_error), and
+    moves the substeps per frame along the levels min_divs,
+    min_divs * const.GOVERNOR_FACTOR, ... up to max_divs to hold both
+    a target physics time per frame and an error tolerance:
+
+    * If the smoothed frame time exceeds the target, the substeps are
+      lowered, whatever the error, so slow machines and heavy scenes
+      lose accuracy instead of frames.
+    * If the error exceeds the tolerance, the substeps are raised, as
+      long as the frame time expected at the next level is well
+      within the target.
+    * If the largest error since the last change, scaled to the
+      previous level, is well within the tolerance, the substeps are
+      lowered to save time. The error of a frame of RK4 substeps
+      scales with divs ** -4.
+
+    Levels are only lowered after const.GOVERNOR_HOLD frames at the
+    current level, so measurement noise does not make them flicker.
+    """
+
+    def __init__(self, stepper, target=const.GOVERNOR_FRAME_TIME,
+                 tol=const.GOVERNOR_ERROR_TOL,
+                 min_divs=const.GOVERNOR_MIN_DIVS,
+                 max_divs=const.GOVERNOR_MAX_DIVS):
+        """Initialization.
+
+        Args:
+            stepper (Stepper): Stepper whose substeps are governed.
+                Its error estimate is turned on.
+            target (float): Target physics time per frame (s).
+            tol (float): Error tolerance of the moon position per
+                frame (px).
+            min_divs, max_divs (int): Bounds of the substeps.
+        """
+        self.stepper = stepper
+        self.target = target
+        self.tol = tol
+        self.levels = [min_divs]
+        while self.levels[-1] < max_divs:
+            self.levels.append(
+                min(max_divs, self.levels[-1] * const.GOVERNOR_FACTOR))
+        # Start at the level closest to the stepper substeps.
+        self.level = min(
+            range(len(self.levels)),
+            key=lambda level: abs(self.levels[level] - stepper.divs))
+        self.frame_time = None
+        self.held = 0
+        self.peak = 0
+        self.active = False
+        stepper.estimate_error = True
+        stepper.set_divs(self.levels[self.level])
+
+#######################################
+# Methods.
+
+    def update(self, frame_time):
+        """Adjusts the substeps after a frame.
+
+        Args:
+            frame_time (float): Time the stepper took to advance the
+                frame (s).
+
+        Returns:
+            Nothing.
+
+        Frames that were not advanced with substeps (analytic orbits,
+        N-body mode, fixed step sizes, crashes) leave the level as it
+        is and make the governor inactive until the next one.
+        """
+        error = self.stepper.error
+        self.active = error != None
+        if not self.active:
+            return
+        if self.frame_time == None:
+            self.frame_time = frame_time
+        else:
+            self.frame_time += const.GOVERNOR_SMOOTHING * (
+                frame_time - self.frame_time)
+        self.held += 1
+        self.peak = max(self.peak, error)
+        divs = self.levels[self.level]
+        if self.frame_time > self.target:
+            if self.held >= const.GOVERNOR_HOLD:
+                self.__set_level(self.level - 1)
+        elif error > self.tol:
+            if self.level + 1 < len(self.levels) and self.frame_time * \
+                    self.levels[self.level + 1] / divs <= \
+                    self.target * const.GOVERNOR_HEADROOM:
+                self.__set_level(self.level + 1)
+        elif self.level > 0 and self.held >= const.GOVERNOR_HOLD:
+            lower = self.levels[self.level - 1]
+            if self.peak * (divs / lower) ** 4 <= \
+                    self.tol * const.GOVERNOR_MARGIN:
+                self.__set_level(self.level - 1)
+
+    def divs(self):
+        """Returns the current substeps per frame, or None if inactive."""
+        return self.levels[self.level] if self.active else None
+
+    def __set_level(self, level):
+        """Moves to a level within the bounds."""
+        level = max(0, min(len(self.levels) - 1, level))
+        if level == self.level:
+            return
+        # Physics time is proportional to the substeps.
+        self.frame_time *= self.levels[level] / self.levels[self.level]
+        self.level = level
+        self.held = 0
+        self.peak = 0
+        self.stepper.set_divs(self.levels[level])
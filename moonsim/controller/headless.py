@@ -0,0 +1,169 @@
+import os
+import resources.indices as ind
+from model.body import Body
+from model.engine import Vector
+from model.stepper import Stepper, batches
+from controller.telemetry import TelemetrySink
+from resources import const
+
+class HeadlessController():
+    """Manages a simulation without a window or OpenGL context.
+
+    The simulation objects are display-free Body objects, so this
+    class can be used on machines without a display or GPU. Note
+    that the model package imports pyglet sprites, so the pyglet
+    shadow window must be disabled before importing this module if
+    there is no display, i.e.,
+
+        pyglet.options['shadow_window'] = False
+    """
+
+    def __init__(self,
+        planet_locx=0, planet_locy=0,
+        moon_locx=0, moon_locy=0, moon_velx=0, moon_vely=0,
+        win_width=const.MAIN_WIN_WIDTH, win_height=const.MAIN_WIN_HEIGHT,
+        path_history=const.MOON_PATH_HISTORY, integrator=ind.AUTO,
+        step=const.STEP_SIZE, planets=None, moons=None,
+        telemetry=None, telemetry_format=ind.NDJSON, precision=None,
+        regularize=False, forces=None):
+        """Initialization.
+
+        Args:
+            planet_locx, planet_locy (float): Planet position (px).
+            moon_locx, moon_locy (float): Moon position (px).
+            moon_velx, moon_vely (float): Moon velocity (px/s).
+            win_width, win_height (int): Dimensions of the
+                simulated window (px).
+            path_history (int): Max number of vertices in the
+                simplified history of the moon path.
+            integrator (int): Integrator used to advance the moon
+                (ind.AUTO, ind.RK4, ind.BS or ind.NBODY).
+            step (float): Fixed RK4 step size (simulation s), or None
+                to divide each frame into FRAME_DIVS steps.
+            planets (list of tuple): If not None, the planets as
+                (x, y, velx, vely, mass) tuples instead of the single
+                planet given by planet_locx and planet_locy.
+            moons (list of tuple): If not None, the moons as
+                (x, y, velx, vely, mass) tuples instead of the single
+                moon given by the moon arguments. The first moon is
+                the main moon, the others are companions.
+            telemetry (str): If not None, the target to which the moon
+                state is streamed every frame (see TelemetrySink).
+            telemetry_format (int): ind.NDJSON or ind.BINARY.
+            precision (int): If not None, the companions are only
+                kept as states of this precision (ind.FLOAT32 or
+                ind.FLOAT64) and advanced together by a batched engine
+                (see Ensemble), unless the integrator does not allow
+                it (see stepper.batches).
+            regularize (bool): Whether close approaches to the planets
+                are integrated in regularized coordinates (see
+                Stepper).
+            forces (list of tuple): If not None, the (name, settings)
+                of the force models acting on the moons (see
+                forces.compose).
+        """
+        self.win_width = win_width
+        self.win_height = win_height
+        if planets == None:
+            planets = [(planet_locx, planet_locy, 0, 0, const.PLANET_MASS)]
+        if moons == None:
+            moons = [(moon_locx, moon_locy, moon_velx, moon_vely,
+                      const.MOON_MASS)]
+        batched = list()
+        if batches(integrator, precision):
+            moons, batched = moons[:1], moons[1:]
+        self.planets = list()
+        for x, y, velx, vely, mass in planets:
+            self.planets.append(
+                Body(
+                    locus=Vector(x, y),
+                    velocity=Vector(velx, vely),
+                    mass=mass,
+                    width=const.PLANET_WIDTH))
+        self.moons = list()
+        for x, y, velx, vely, mass in moons:
+            self.moons.append(
+                Body(
+                    locus=Vector(x, y),
+                    velocity=Vector(velx, vely),
+                    mass=mass,
+                    path_history=path_history))
+        self.moon = self.moons[0]
+        self.stepper = Stepper(
+            self.moon, self.planets, gravity=const.GRAVITY,
+            integrator=integrator, step=step, companions=self.moons[1:],
+            precision=precision, regularize=regularize, forces=forces,
+            batched=batched)
+        self.run_time = 0
+        self.telemetry = None
+        if telemetry != None:
+            self.telemetry = TelemetrySink(telemetry, telemetry_format)
+
+#######################################
+# Generic methods.
+
+    def update(self, dt):
+        """Updates the moon as Controller.update does.
+
+        Args:
+            dt (float): Frame time step in simulation seconds.
+
+        Returns:
+            Nothing.
+
+        Unlike in the window, the RK4 substeps are not adjusted by a
+        governor, trajectories are not taken from a trajectory cache
+        and no history is kept, so headless runs do not depend on the
+        speed of the machine or on earlier runs.
+        """
+        self.run_time += dt
+        if self.run_time > const.SIMSEC_PER_YEAR:
+            self.run_time = 0
+        self.stepper.advance(dt)
+        if self.telemetry != None:
+            self.telemetry.record(self.run_time, self.moon, self.planets)
+
+    def render(self, path, days=const.RENDER_DAYS):
+        """Runs the simulation and renders it to PNG images.
+
+        Args:
+            path (str): If path ends with '.png', a single
+                long-exposure image of the whole run is written to
+                it. Otherwise, every frame is written to the
+                directory path.
+            days (float): Length of the run in days.
+
+        Returns:
+            int: Number of frames rendered.
+
+        Frames are produced at const.FRAME_RATE per simulation
+        second, the same as when running in a window. Frame
+        encoding is done on background threads.
+        """
+        # Imported here so the controller can be used without numpy.
+        from view.raster import Rasterizer, FrameWriter, to_rgba8, write_png
+
+        frames = int(days / const.DAY_PER_SIMSEC * const.FRAME_RATE)
+        exposure = path.lower().endswith(".png")
+        raster = Rasterizer(self.win_width, self.win_height)
+        writer = None if exposure else FrameWriter()
+        try:
+            for frame in range(frames):
+                raster.render(
+                    self.moon, self.planets, self.moons[1:],
+                    None if self.stepper.ensemble == None
+                    else self.stepper.ensemble.positions())
+                if exposure:
+                    raster.expose()
+                else:
+                    name = const.RASTER_FRAME_NAME.format(frame)
+                    writer.write(os.path.join(path, name), raster.frame)
+                self.update(1 / const.FRAME_RATE)
+        finally:
+            if writer != None:
+                writer.close()
+            if self.telemetry != None:
+                self.telemetry.close()
+        if exposure and frames > 0:
+            write_png(path, to_rgba8(raster.exposure))
+        return frames
@@ -0,0 +1,145 @@
+from resources import const
+
+class HitGrid():
+    """Uniform-grid index for routing mouse clicks to objects.
+
+    Clickable objects are registered together with an info value
+    that is passed back to them when they are clicked (e.g., ind.MOON
+    or ind.ARROW for the two clickable parts of the moon). Registered
+    objects must provide two methods:
+
+        hit_bounds(info): Returns an axis-aligned Rect containing
+            the clickable part.
+        hit_test(x, y, info): Returns True if the point (x, y) lies
+            in the clickable part.
+
+    Each registration is stored in the grid cells its bounds overlap.
+    The bounds are only recomputed after the object signals that it
+    has moved, and only when a click has to be routed, so objects
+    moving every simulation step cost no more than setting a flag.
+    If the clickable parts of several registrations contain the same
+    point, the one registered first wins.
+    """
+
+    def __init__(self, cell_size=const.PICK_CELL_SIZE):
+        """Initialization.
+
+        Args:
+            cell_size (float): Width and height of grid cells (px).
+        """
+        self.cell_size = cell_size
+        self.__cells = dict()
+        self.__entries = dict()
+        self.__dirty = list()
+        self.__count = 0
+
+#######################################
+# Slots.
+
+    def moved(self, obj):
+        """Indicates that a registered object has moved or changed.
+
+        Args:
+            obj: Registered object.
+
+        Returns:
+            Nothing.
+        """
+        for entry in self.__entries.get(id(obj), ()):
+            if not entry.dirty:
+                entry.dirty = True
+                self.__dirty.append(entry)
+
+#######################################
+# Generic methods.
+
+    def register(self, obj, info=None):
+        """Adds a clickable object (or part of one) to the index.
+
+        Args:
+            obj: Object with hit_bounds and hit_test methods.
+            info: Value passed to the object methods and returned
+                with the object when it is clicked.
+
+        Returns:
+            Nothing.
+        """
+        entry = _Entry(obj, info, self.__count)
+        self.__count += 1
+        self.__entries.setdefault(id(obj), list()).append(entry)
+        self.__dirty.append(entry)
+
+    def unregister(self, obj):
+        """Removes all registrations of an object from the index."""
+        for entry in self.__entries.pop(id(obj), ()):
+            self.__place(entry, ())
+            entry.dirty = False
+
+    def query(self, x, y):
+        """Routes a point to the registered object that contains it.
+
+        Args:
+            x (int or float): X-coordinate of the point.
+            y (int or float): Y-coordinate of the point.
+
+        Returns:
+            tuple (two elements): The object containing the point and
+                its registration info, or (None, None) if no
+                registered object contains the point.
+        """
+        self.__refresh()
+        key = (int(x // self.cell_size), int(y // self.cell_size))
+        for entry in self.__cells.get(key, ()):
+            if entry.obj.hit_test(x, y, entry.info):
+                return entry.obj, entry.info
+        return None, None
+
+    def __refresh(self):
+        """Moves entries of objects that have moved to their new cells."""
+        for entry in self.__dirty:
+            if not entry.dirty:
+                continue
+            entry.dirty = False
+            bounds = entry.obj.hit_bounds(entry.info)
+            col0 = int(bounds.x // self.cell_size)
+            col1 = int((bounds.x + bounds.width) // self.cell_size)
+            row0 = int(bounds.y // self.cell_size)
+            row1 = int((bounds.y + bounds.height) // self.cell_size)
+            span = (col0, col1, row0, row1)
+            if span != entry.span:
+                cells = [
+                    (col, row)
+                    for col in range(col0, col1 + 1)
+                    for row in range(row0, row1 + 1)]
+                self.__place(entry, cells)
+                entry.span = span
+        self.__dirty = list()
+
+    def __place(self, entry, cells):
+        """Moves an entry from its current cells to new cells.
+
+        Cell lists are kept in registration order.
+        """
+        for key in entry.cells:
+            bucket = self.__cells[key]
+            bucket.remove(entry)
+            if not bucket:
+                del self.__cells[key]
+        for key in cells:
+            bucket = self.__cells.setdefault(key, list())
+            index = len(bucket)
+            while index > 0 and bucket[index - 1].order > entry.order:
+                index -= 1
+            bucket.insert(index, entry)
+        entry.cells = cells
+
+class _Entry():
+    """Registration of one clickable object part in a HitGrid."""
+
+    def __init__(self, obj, info, order):
+        self.obj = obj
+        self.info = info
+        self.order = order
+        self.cells = ()
+        self.span = None
+        self.dirty = True
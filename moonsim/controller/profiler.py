@@ -0,0 +1,156 @@
+import collections
+import json
+import os
+import threading
+import time
+from resources import const
+
+class Profiler():
+    """Lightweight timing of hot-path sections of each frame.
+
+    Sections are timed with the section method, i.e.,
+
+        with profiler.section(const.PROF_ENGINE):
+            model.engine.update(...)
+
+    The time spent in each section is summed over a frame. When the
+    frame ends (end_frame), the totals are added to a rolling window
+    from which p50, p95 and max times are reported. Each timed call
+    is also kept in a bounded trace that can be exported in the
+    Chrome trace-event format (chrome://tracing, Perfetto). When the
+    profiler is disabled, sections cost a single method call.
+    """
+
+    def __init__(self, enabled=True, window=const.PROF_WINDOW,
+                 trace_length=const.PROF_TRACE_LENGTH):
+        """Initialization.
+
+        Args:
+            enabled (bool): Whether timing is recorded.
+            window (int): Number of frames in the rolling statistics.
+            trace_length (int): Max number of calls kept in the trace.
+        """
+        self.enabled = enabled
+        self.window = window
+        self.frames = collections.OrderedDict()
+        self.current = dict()
+        self.trace = collections.deque(maxlen=trace_length)
+        self.origin = time.perf_counter()
+        self.__sections = dict()
+        self.__null = _NullSection()
+
+#######################################
+# Methods.
+
+    def section(self, name):
+        """Returns a context manager that times the named section."""
+        if not self.enabled:
+            return self.__null
+        try:
+            return self.__sections[name]
+        except KeyError:
+            section = _Section(self, name)
+            self.__sections[name] = section
+            return section
+
+    def record(self, name, start, duration):
+        """Records a timed call to a section.
+
+        Args:
+            name (str): Name of the section.
+            start (float): perf_counter time the call started (s).
+            duration (float): Duration of the call (s).
+
+        Returns:
+            Nothing.
+        """
+        self.current[name] = self.current.get(name, 0) + duration
+        self.trace.append(
+            (name, start, duration, threading.get_ident()))
+
+    def end_frame(self):
+        """Adds the section totals of the current frame to the window.
+
+        Sections that were not entered during the frame are recorded
+        as taking no time.
+        """
+        if not self.enabled:
+            return
+        for name in self.current:
+            if name not in self.frames:
+                self.frames[name] = collections.deque(maxlen=self.window)
+        for name, times in self.frames.items():
+            times.append(self.current.get(name, 0))
+        self.current = dict()
+
+    def stats(self):
+        """Returns the rolling per-frame statistics of each section.
+
+        Returns:
+            OrderedDict: Keys are section names in the order they were
+                first timed, values are (p50, p95, max) tuples of the
+                time spent per frame (s).
+        """
+        stats = collections.OrderedDict()
+        for name, times in self.frames.items():
+            ordered = sorted(times)
+            if not ordered:
+                continue
+            stats[name] = (
+                percentile(ordered, 50),
+                percentile(ordered, 95),
+                ordered[-1])
+        return stats
+
+    def export_trace(self, path):
+        """Writes the trace as Chrome trace-event JSON.
+
+        Args:
+            path (str): Path of the JSON file to write.
+
+        Returns:
+            Nothing.
+        """
+        pid = os.getpid()
+        events = [
+            {"name": name, "ph": "X", "pid": pid, "tid": tid,
+             "ts": (start - self.origin) * 1e6, "dur": duration * 1e6}
+            for name, start, duration, tid in self.trace]
+        with open(path, "w") as trace_file:
+            json.dump(
+                {"traceEvents": events, "displayTimeUnit": "ms"},
+                trace_file)
+
+class _Section():
+    """Context manager timing one section for a Profiler."""
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter()
+        self.profiler.record(self.name, self.start, end - self.start)
+        return False
+
+class _NullSection():
+    """Context manager that does nothing (profiler disabled)."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+#######################################
+# Core functions.
+
+def percentile(ordered, percent):
+    """Nearest-rank percentile of a sorted, non-empty list."""
+    rank = int(round(percent / 100 * (len(ordered) - 1)))
+    return ordered[rank]
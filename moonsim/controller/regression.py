@@ -0,0 +1,324 @@
+import json
+import math
+import os
+import statistics
+import sys
+import time
+import resources.indices as ind
+from controller.headless import HeadlessController
+from resources import const
+
+# Moon start states (x, y offsets from the planet in px and velocity
+# in px/s) of the regression scenarios.
+SCENARIOS = {
+    "perigee": (const.DEL_MOON_PER_LOCX, const.DEL_MOON_PER_LOCY,
+                const.MOON_PER_VELX, const.MOON_PER_VELY),
+    "apogee": (const.DEL_MOON_APO_LOCX, const.DEL_MOON_APO_LOCY,
+               const.MOON_APO_VELX, const.MOON_APO_VELY),
+    "crash": (const.DEL_MOON_PER_LOCX, const.DEL_MOON_PER_LOCY,
+              const.MOON_PER_VELX, const.REGRESS_CRASH_VELY)}
+# Integrators (integrator, fixed step size) the scenarios are run with.
+INTEGRATORS = {
+    "auto": (ind.AUTO, None),
+    "rk4": (ind.RK4, None),
+    "rk4-step": (ind.RK4, const.REGRESS_STEP / const.HR_PER_SIMSEC),
+    "nbody": (ind.NBODY, None),
+    "bs": (ind.BS, None)}
+
+def main(update=False, path=None):
+    """Runs the regression cases and checks them against the goldens.
+
+    Args:
+        update (bool): If True, the results are written as the new
+            golden trajectories and speed baselines instead of being
+            checked.
+        path (str): Golden file, const.REGRESS_GOLDEN next to the
+            resources by default.
+
+    Returns:
+        int: Exit status, 0 if all cases passed and 1 otherwise.
+
+    Every scenario is run with every integrator for
+    const.REGRESS_DAYS, one frame at a time as in the window. A case
+    fails if the moon strays more than const.REGRESS_POS_TOL from its
+    golden trajectory, if a crash happens at a different time (by
+    more than const.REGRESS_TIME_TOL), if the energy drifts more than
+    the tolerance of the integrator (const.REGRESS_ENERGY_TOL), or if
+    the frames run per second fall short of the baseline by more than
+    const.REGRESS_SPEED_BUDGET (const.REGRESS_CRASH_SPEED_BUDGET for
+    cases with a crash). Cases of the nbody integrator are
+    skipped without numpy. Every scenario is also checked with
+    first_step_error.
+    """
+    if path == None:
+        path = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            "resources", const.REGRESS_GOLDEN)
+    golden = dict()
+    if not update:
+        try:
+            with open(path, "r") as source:
+                golden = json.load(source)
+        except (OSError, ValueError) as err:
+            sys.stderr.write(const.BADGOLDEN_STR.format(path, err))
+            return 1
+    results = dict()
+    checked = 0
+    failed = 0
+    for scenario in SCENARIOS:
+        for integrator in INTEGRATORS:
+            name = "{}/{}".format(scenario, integrator)
+            try:
+                result = run_case(scenario, integrator)
+            except ImportError:
+                print(const.REGRESS_SKIP_STR.format(name))
+                continue
+            results[name] = result
+            checked += 1
+            if update:
+                print(const.REGRESS_UPDATE_STR.format(
+                    name, result["steps_per_sec"]))
+                continue
+            problems = check_case(result, golden.get(name), integrator)
+            failed += len(problems) > 0
+            print(const.REGRESS_RESULT_STR.format(
+                name, "FAIL" if problems else "ok",
+                result["energy_drift"], result["steps_per_sec"],
+                result["relative_speed"]))
+            for problem in problems:
+                print("    " + problem)
+        if not update:
+            name = "{}/first-step".format(scenario)
+            error = first_step_error(scenario)
+            checked += 1
+            failed += error > const.REGRESS_POS_TOL
+            print(const.REGRESS_FIRST_STEP_STR.format(
+                name, "FAIL" if error > const.REGRESS_POS_TOL else "ok",
+                error))
+    if update:
+        # One case per line keeps the diffs of new goldens readable.
+        with open(path, "w") as target:
+            target.write("{\n" + ",\n".join(
+                "{}: {}".format(json.dumps(name), json.dumps(result))
+                for name, result in results.items()) + "\n}\n")
+        return 0
+    print(const.REGRESS_SUMMARY_STR.format(checked - failed, failed))
+    return 1 if failed else 0
+
+def run_case(scenario, integrator, days=const.REGRESS_DAYS):
+    """Runs one scenario with one integrator.
+
+    Returns:
+        dict: 'trajectory', the moon position every
+            const.REGRESS_SAMPLE_FRAMES frames, 'crash_time', the
+            time of the crash event (None if no crash),
+            'energy_drift', the max relative change of the total
+            energy before any crash, and 'steps_per_sec' and
+            'relative_speed', the speed of the case measured by
+            measure_speed.
+    """
+    sim = start_case(scenario, integrator)
+    com_frame = INTEGRATORS[integrator][0] == ind.NBODY
+    bodies = sim.planets + sim.moons
+    energy0 = system_energy(bodies, com_frame=com_frame)
+    drift = 0
+    trajectory = list()
+    frames = int(days / const.DAY_PER_SIMSEC * const.FRAME_RATE)
+    for first in range(0, frames, const.REGRESS_SAMPLE_FRAMES):
+        trajectory.append((sim.moon.locus.x, sim.moon.locus.y))
+        if not sim.moon.crashed:
+            drift = max(drift, abs(
+                system_energy(bodies, com_frame=com_frame) / energy0 - 1))
+        for frame in range(min(const.REGRESS_SAMPLE_FRAMES, frames - first)):
+            sim.update(1 / const.FRAME_RATE)
+    crashes = [event.time for event in sim.stepper.events
+               if event.kind == ind.CRASH]
+    steps_per_sec, relative_speed = measure_speed(scenario, integrator)
+    return {
+        "trajectory": trajectory,
+        "crash_time": crashes[0] if crashes else None,
+        "energy_drift": drift,
+        "steps_per_sec": steps_per_sec,
+        "relative_speed": relative_speed}
+
+def start_case(scenario, integrator, step=None):
+    """Returns a new headless simulation of one scenario with one
+    integrator.
+
+    Args:
+        step (float): If not None, the fixed step size used instead
+            of the one of the integrator.
+
+    Raises ImportError for the nbody integrator without numpy.
+    """
+    dx, dy, velx, vely = SCENARIOS[scenario]
+    method, integrator_step = INTEGRATORS[integrator]
+    if step == None:
+        step = integrator_step
+    if method == ind.NBODY:
+        import numpy
+    center_x = const.MAIN_WIN_WIDTH / 2
+    center_y = const.MAIN_WIN_HEIGHT / 2
+    return HeadlessController(
+        planet_locx=center_x, planet_locy=center_y,
+        moon_locx=center_x + dx, moon_locy=center_y + dy,
+        moon_velx=velx, moon_vely=vely, integrator=method, step=step)
+
+def measure_speed(scenario, integrator):
+    """Measures the speed of one scenario with one integrator.
+
+    Returns:
+        tuple (two elements): Frames run per second of wall time, and
+            the same rate relative to the reference_rate of the
+            machine, which is what the speed budget is checked
+            against, so baselines carry over between machines and
+            load levels. Both are medians over the rounds.
+
+    The case is timed in const.REGRESS_SPEED_ROUNDS rounds, each
+    running the first const.REGRESS_SPEED_FRAMES frames of the case
+    (up to any crash) over and over for at least
+    const.REGRESS_SPEED_ROUND_TIME, followed by a run of the
+    reference workload. Each round is thus compared with a reference
+    taken under the same load, and no case, however fast or short
+    before its crash, is timed on a handful of frames.
+    """
+    rates = list()
+    ratios = list()
+    for count in range(const.REGRESS_SPEED_ROUNDS):
+        frames = 0
+        elapsed = 0
+        while elapsed < const.REGRESS_SPEED_ROUND_TIME:
+            sim = start_case(scenario, integrator)
+            start = time.perf_counter()
+            for frame in range(const.REGRESS_SPEED_FRAMES):
+                sim.update(1 / const.FRAME_RATE)
+                frames += 1
+                if sim.moon.crashed:
+                    break
+            elapsed += time.perf_counter() - start
+        rates.append(frames / elapsed)
+        ratios.append(rates[-1] / reference_rate(repeats=1))
+    return (statistics.median(rates), statistics.median(ratios))
+
+def first_step_error(scenario):
+    """Checks the frames within the first step of a fixed-step run.
+
+    Returns:
+        float: Max distance (px) between the moon of an RK4 run with
+            const.REGRESS_FIRST_STEP steps and the moon of an RK4 run
+            with frame substeps, over the frames up to the end of the
+            first step. These frames are interpolated within a single
+            step, so they show whether the dense output starts from
+            the state the step was taken from.
+    """
+    step = const.REGRESS_FIRST_STEP / const.HR_PER_SIMSEC
+    stepped = start_case(scenario, "rk4", step=step)
+    reference = start_case(scenario, "rk4")
+    error = 0
+    for frame in range(math.ceil(step * const.FRAME_RATE)):
+        stepped.update(1 / const.FRAME_RATE)
+        reference.update(1 / const.FRAME_RATE)
+        error = max(error, math.hypot(
+            stepped.moon.locus.x - reference.moon.locus.x,
+            stepped.moon.locus.y - reference.moon.locus.y))
+    return error
+
+def check_case(result, golden, integrator):
+    """Compares the result of a case with its golden.
+
+    Returns:
+        list of str: Descriptions of the problems found.
+    """
+    if golden == None:
+        return ["no golden trajectory (run with --regress-update)"]
+    problems = list()
+    if len(golden["trajectory"]) != len(result["trajectory"]):
+        problems.append("trajectory has {} samples, golden has {}".format(
+            len(result["trajectory"]), len(golden["trajectory"])))
+    else:
+        error = max(
+            math.hypot(x - gx, y - gy) for (x, y), (gx, gy) in
+            zip(result["trajectory"], golden["trajectory"]))
+        if error > const.REGRESS_POS_TOL:
+            problems.append(
+                "moon is {:.3g} px off the golden trajectory".format(error))
+    crash, golden_crash = result["crash_time"], golden["crash_time"]
+    if (crash == None) != (golden_crash == None):
+        problems.append("crash at {}, golden crash at {}".format(
+            crash, golden_crash))
+    elif crash != None and abs(crash - golden_crash) > \
+            const.REGRESS_TIME_TOL:
+        problems.append("crash at {:.9g} s, golden crash at {:.9g} s".format(
+            crash, golden_crash))
+    if result["energy_drift"] > const.REGRESS_ENERGY_TOL[integrator]:
+        problems.append("energy drift {:.3g} exceeds {:.3g}".format(
+            result["energy_drift"], const.REGRESS_ENERGY_TOL[integrator]))
+    # The close approach before a crash makes the speed of the crash
+    # cases vary more.
+    if golden["crash_time"] == None:
+        budget = const.REGRESS_SPEED_BUDGET
+    else:
+        budget = const.REGRESS_CRASH_SPEED_BUDGET
+    budget = golden["relative_speed"] * (1 - budget)
+    if result["relative_speed"] < budget:
+        problems.append(
+            "relative speed {:.3g} is below the budget of {:.3g}".format(
+                result["relative_speed"], budget))
+    return problems
+
+def reference_rate(repeats=const.REGRESS_REFERENCE_REPEATS):
+    """Returns the speed of the machine on a fixed workload.
+
+    Args:
+        repeats (int): Number of runs of the workload.
+
+    Returns:
+        float: Best rate over the runs of a pure-Python floating-point loop that does not use the
+            simulation code (which would hide its own regressions),
+            in iterations per second.
+    """
+    best = 0
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        x, y = 1.0, 0.0
+        for count in range(const.REGRESS_REFERENCE_LOOPS):
+            r = math.hypot(x, y)
+            x, y = x - y / (r * r * r) * 1e-3, y + x / (r * r * r) * 1e-3
+        best = max(best, const.REGRESS_REFERENCE_LOOPS /
+                   (time.perf_counter() - start))
+    return best
+
+def system_energy(bodies, gravity=const.GRAVITY, com_frame=False):
+    """Returns the total energy of a set of bodies.
+
+    Args:
+        bodies (list of Body): Bodies of the system.
+        gravity (float): Gravity constant.
+        com_frame (bool): If True, the kinetic energy is taken in the
+            centre-of-mass frame, so it does not depend on the frame
+            the N-body integrator works in. Fixed planets break
+            momentum conservation, so they need the rest frame.
+
+    Returns:
+        float: Kinetic plus potential energy. Pairs of overlapping
+            bodies, which exert no force on each other, have no
+            potential energy.
+    """
+    com_velx, com_vely = 0, 0
+    if com_frame:
+        total = sum(body.mass for body in bodies)
+        com_velx = sum(
+            body.mass * body.velocity.x for body in bodies) / total
+        com_vely = sum(
+            body.mass * body.velocity.y for body in bodies) / total
+    kinetic = sum(
+        body.mass * ((body.velocity.x - com_velx) ** 2 +
+                     (body.velocity.y - com_vely) ** 2) / 2
+        for body in bodies)
+    potential = 0
+    for index, body in enumerate(bodies):
+        for other in bodies[index + 1:]:
+            dist = (other.locus - body.locus).mag()
+            if dist > (body.width + other.width) / 2:
+                potential -= gravity * body.mass * other.mass / dist
+    return kinetic + potential
@@ -0,0 +1,389 @@
+import json
+import marshal
+import os
+import resources.indices as ind
+from resources import const
+
+# Scenario formats by file extension.
+FORMATS = (".json", ".toml")
+# Conversion factors to simulation units.
+LENGTH_UNITS = {"px": 1, "km": 1 / const.KM_PER_PX}
+TIME_UNITS = {
+    "s": 1,
+    "hr": 1 / const.HR_PER_SIMSEC,
+    "day": 1 / const.DAY_PER_SIMSEC}
+MASS_UNITS = {"moon": 1, "kg": 1 / const.KG_PER_MOON_MASS}
+# Integrators that can be named in a scenario.
+INTEGRATORS = {
+    "auto": ind.AUTO,
+    "rk4": ind.RK4,
+    "nbody": ind.NBODY,
+    "bs": ind.BS}
+# State precisions of the batched companions.
+PRECISIONS = {
+    "float32": ind.FLOAT32,
+    "float64": ind.FLOAT64}
+# Settings of the force models (see model.forces): the powers of the
+# length and time units they are given in, and their kind.
+FORCES = {
+    "gravity": {},
+    "j2": {"j2": (0, 0, "number")},
+    "drag": {
+        "density": (-1, 0, "positive"),
+        "height": (1, 0, "positive"),
+        "ceiling": (0, 0, "positive")},
+    "thrust": {"acceleration": (1, -2, "pair")}}
+# Force model settings without a default.
+FORCE_REQUIRED = ("j2", "density", "acceleration")
+# Settings of a scenario that set each startup parameter, as (table,
+# key) with None for the top level. The positions are measured from
+# the origin of the scenario, so they also set it.
+SETTINGS = {
+    ind.WIN_WIDTH: [("window", "width")],
+    ind.WIN_HEIGHT: [("window", "height")],
+    ind.CENTERED: [("window", "origin"), (None, "planets"), (None, "moons")],
+    ind.PLANETS: [(None, "planets")],
+    ind.MOONS: [(None, "moons")],
+    ind.INTEGRATOR: [(None, "integrator")],
+    ind.STEP_SIZE: [(None, "step")],
+    ind.PRECISION: [(None, "precision")],
+    ind.FORCES: [(None, "forces")],
+    ind.RENDER_PATH: [("output", "render")],
+    ind.RENDER_TIME: [("output", "duration")],
+    ind.PATH_HISTORY: [("output", "trail")],
+    ind.DISP_PAR: [("output", "display")],
+    ind.PROFILE: [("output", "profile"), ("output", "trace")],
+    ind.TRACE_PATH: [("output", "trace")]}
+
+def load(path, cache=True, defaults=True):
+    """Loads a scenario file.
+
+    Args:
+        path (str): Path of a JSON (.json) or TOML (.toml) scenario.
+        cache (bool): Whether to use and update the compiled cache.
+        defaults (bool): Whether the parameters that the scenario
+            does not set are returned with their default values.
+            Without them, the scenario can be loaded on top of other
+            settings.
+
+    Returns:
+        dict: Startup parameters (see startup.get_parameters) set by
+            the scenario.
+
+    The validated scenario is cached in marshal format under the
+    __pycache__ directory next to the file, and reloaded from there
+    while the file is unchanged, so launching many runs of the same
+    scenario only parses and validates it once. Raises an Exception
+    with a BADSCENARIO_STR message if the scenario is invalid.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError as err:
+        raise Exception(const.BADSCENARIO_STR.format(path, err.strerror))
+    stamp = (const.SCENARIO_CACHE_MAGIC, stat.st_mtime_ns, stat.st_size)
+    cached = cache_path(path)
+    compiled = read_cache(cached, stamp) if cache else None
+    if compiled == None:
+        data = parse(path)
+        compiled = (compile_scenario(data, path), explicit(data))
+        if cache:
+            write_cache(cached, stamp, compiled)
+    parameters, keys = compiled
+    if defaults:
+        return parameters
+    return {key: parameters[key] for key in keys}
+
+def parse(path):
+    """Reads a scenario file into a dict."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise Exception(const.BADSCENARIO_STR.format(
+            path, "the file must end with " + " or ".join(FORMATS)))
+    try:
+        if extension == ".toml":
+            # Imported here since tomllib needs Python 3.11.
+            import tomllib
+            with open(path, "rb") as source:
+                data = tomllib.load(source)
+        else:
+            with open(path, "r") as source:
+                data = json.load(source)
+    except OSError as err:
+        raise Exception(const.BADSCENARIO_STR.format(path, err.strerror))
+    except ValueError as err:
+        raise Exception(const.BADSCENARIO_STR.format(path, err))
+    if not isinstance(data, dict):
+        raise Exception(const.BADSCENARIO_STR.format(
+            path, "the scenario must be a table of settings"))
+    return data
+
+def compile_scenario(data, path="<scenario>"):
+    """Validates a scenario and converts it to startup parameters.
+
+    Args:
+        data (dict): Parsed scenario.
+        path (str): Name of the scenario used in error messages.
+
+    Returns:
+        dict: Startup parameters set by the scenario. Positions and
+            velocities are converted to simulation units, and the
+            planets and moons are lists of (x, y, velx, vely, mass)
+            tuples. The planets are None (the standard planet) if the
+            scenario does not set them.
+    """
+    reader = _Reader(data, path)
+    reader.check_keys(
+        data, ("units", "window", "planets", "moons", "integrator", "step",
+               "precision", "forces", "output"))
+    units = reader.table("units", ("length", "time", "mass"))
+    length = reader.choice(units, "length", LENGTH_UNITS, "px", "units")
+    time = reader.choice(units, "time", TIME_UNITS, "s", "units")
+    mass = reader.choice(units, "mass", MASS_UNITS, "moon", "units")
+    velocity = length / time
+    window = reader.table("window", ("width", "height", "origin"))
+    parameters = {
+        ind.WIN_WIDTH: reader.integer(
+            window, "width", const.MAIN_WIN_WIDTH, "window",
+            const.MAIN_WIN_MINX, const.MAIN_WIN_MAXX),
+        ind.WIN_HEIGHT: reader.integer(
+            window, "height", const.MAIN_WIN_HEIGHT, "window",
+            const.MAIN_WIN_MINY, const.MAIN_WIN_MAXY),
+        ind.CENTERED: reader.choice(
+            window, "origin", {"center": True, "corner": False},
+            "center", "window")}
+    for key, name, default_mass in [
+        (ind.PLANETS, "planets", const.PLANET_MASS),
+        (ind.MOONS, "moons", const.MOON_MASS)]:
+        bodies = list()
+        for index, body in enumerate(reader.bodies(name)):
+            where = "{}[{}]".format(name, index)
+            x, y = reader.vector(body, "position", None, where)
+            velx, vely = reader.vector(body, "velocity", (0, 0), where)
+            bodies.append((
+                x * length, y * length, velx * velocity, vely * velocity,
+                reader.number(body, "mass", default_mass / mass, where,
+                              positive=True) * mass))
+        parameters[key] = bodies
+    if not parameters[ind.MOONS]:
+        reader.fail("moons", "at least one moon is required")
+    if "planets" not in data:
+        # The standard planet, as without a scenario.
+        parameters[ind.PLANETS] = None
+    elif not parameters[ind.PLANETS]:
+        reader.fail("planets", "at least one planet is required")
+    parameters[ind.INTEGRATOR] = reader.choice(
+        data, "integrator", INTEGRATORS, "auto")
+    step = reader.number(data, "step", None, positive=True)
+    parameters[ind.STEP_SIZE] = None if step == None else step * time
+    if "precision" in data:
+        parameters[ind.PRECISION] = reader.choice(
+            data, "precision", PRECISIONS, None)
+    if "forces" in data:
+        parameters[ind.FORCES] = reader.forces(length, time)
+        if parameters[ind.FORCES] and \
+                parameters[ind.INTEGRATOR] == ind.NBODY:
+            reader.fail("forces", "not supported by the nbody integrator")
+    output = reader.table(
+        "output", ("render", "duration", "trail", "display", "profile",
+                   "trace"))
+    duration = reader.number(
+        output, "duration", None, "output", positive=True)
+    parameters.update({
+        ind.RENDER_PATH: reader.string(output, "render", None, "output"),
+        ind.RENDER_TIME: const.RENDER_DAYS if duration == None else
+            duration * time * const.DAY_PER_SIMSEC,
+        ind.PATH_HISTORY: reader.integer(
+            output, "trail", const.MOON_PATH_HISTORY, "output", 0),
+        ind.DISP_PAR: reader.boolean(output, "display", False, "output"),
+        ind.PROFILE: reader.boolean(output, "profile", False, "output"),
+        ind.TRACE_PATH: reader.string(output, "trace", None, "output")})
+    if parameters[ind.TRACE_PATH] != None:
+        parameters[ind.PROFILE] = True
+    return parameters
+
+def explicit(data):
+    """Returns the startup parameters that a valid scenario sets.
+
+    Args:
+        data (dict): Parsed scenario.
+
+    Returns:
+        list: Keys of the parameters (see SETTINGS).
+    """
+    return [key for key, settings in SETTINGS.items()
+            if any(name in (data if table == None else data.get(table, {}))
+                   for table, name in settings)]
+
+def cache_path(path):
+    """Returns the path of the compiled cache of a scenario file."""
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(
+        directory, "__pycache__", name + const.SCENARIO_CACHE_SUFFIX)
+
+def read_cache(path, stamp):
+    """Returns a cached scenario, or None if missing or out of date."""
+    try:
+        with open(path, "rb") as source:
+            cached_stamp, compiled = marshal.load(source)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if cached_stamp != stamp:
+        return None
+    return compiled
+
+def write_cache(path, stamp, compiled):
+    """Writes a compiled scenario to its cache (errors are ignored).
+
+    The cache is written to a temporary file and then moved into
+    place, so concurrent runs never read a partial cache.
+    """
+    temp = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temp, "wb") as target:
+            marshal.dump((stamp, compiled), target)
+        os.replace(temp, path)
+    except OSError:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+
+class _Reader():
+    """Reads typed values from a parsed scenario, failing with the key."""
+
+    def __init__(self, data, path):
+        self.data = data
+        self.path = path
+
+    def fail(self, key, reason):
+        """Raises the error for a bad value."""
+        raise Exception(const.BADSCENARIO_STR.format(
+            self.path, "{}: {}".format(key, reason)))
+
+    def check_keys(self, table, allowed, where=None):
+        """Fails on keys that are not part of the format."""
+        for key in table:
+            if key not in allowed:
+                self.fail(self.__name(key, where), "unknown setting")
+
+    def table(self, key, allowed):
+        """Returns an optional top-level table (empty if missing)."""
+        table = self.data.get(key, dict())
+        if not isinstance(table, dict):
+            self.fail(key, "must be a table")
+        self.check_keys(table, allowed, key)
+        return table
+
+    def bodies(self, key):
+        """Returns a list of body tables."""
+        bodies = self.data.get(key, list())
+        if not isinstance(bodies, list):
+            self.fail(key, "must be a list of bodies")
+        for index, body in enumerate(bodies):
+            where = "{}[{}]".format(key, index)
+            if not isinstance(body, dict):
+                self.fail(where, "must be a table")
+            self.check_keys(body, ("position", "velocity", "mass"), where)
+        return bodies
+
+    def forces(self, length, time):
+        """Returns the force models as a list of (name, settings).
+
+        The settings are converted to simulation units with the length
+        and time unit factors.
+        """
+        models = list()
+        for name, table in self.table("forces", FORCES).items():
+            where = "forces." + name
+            if not isinstance(table, dict):
+                self.fail(where, "must be a table")
+            self.check_keys(table, FORCES[name], where)
+            settings = dict()
+            for key, (length_power, time_power, kind) in \
+                    FORCES[name].items():
+                if key not in table:
+                    if key in FORCE_REQUIRED:
+                        self.fail(self.__name(key, where), "is required")
+                    continue
+                factor = length ** length_power * time ** time_power
+                if kind == "pair":
+                    x, y = self.vector(table, key, None, where)
+                    settings[key] = (x * factor, y * factor)
+                else:
+                    settings[key] = self.number(
+                        table, key, None, where,
+                        positive=kind == "positive") * factor
+            models.append((name, settings))
+        return models
+
+    def number(self, table, key, default, where=None, positive=False):
+        """Returns a finite number (bools are not numbers)."""
+        if key not in table:
+            return default
+        value = table[key]
+        name = self.__name(key, where)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            self.fail(name, "must be a number")
+        if value != value or abs(value) == float("inf"):
+            self.fail(name, "must be finite")
+        if positive and value <= 0:
+            self.fail(name, "must be positive")
+        return float(value)
+
+    def integer(self, table, key, default, where=None, low=None,
+                high=None):
+        """Returns an integer within optional bounds."""
+        if key not in table:
+            return default
+        value = table[key]
+        name = self.__name(key, where)
+        if isinstance(value, bool) or not isinstance(value, int):
+            self.fail(name, "must be an integer")
+        if low != None and value < low:
+            self.fail(name, "must be at least {}".format(low))
+        if high != None and value > high:
+            self.fail(name, "must be at most {}".format(high))
+        return value
+
+    def boolean(self, table, key, default, where=None):
+        """Returns true or false."""
+        if key not in table:
+            return default
+        if not isinstance(table[key], bool):
+            self.fail(self.__name(key, where), "must be true or false")
+        return table[key]
+
+    def string(self, table, key, default, where=None):
+        """Returns a string."""
+        if key not in table:
+            return default
+        if not isinstance(table[key], str):
+            self.fail(self.__name(key, where), "must be a string")
+        return table[key]
+
+    def choice(self, table, key, choices, default, where=None):
+        """Returns the value mapped to one of the named choices."""
+        name = table.get(key, default)
+        if not isinstance(name, str) or name not in choices:
+            self.fail(self.__name(key, where),
+                      "must be one of " + ", ".join(choices))
+        return choices[name]
+
+    def vector(self, table, key, default, where=None):
+        """Returns an (x, y) pair of numbers."""
+        name = self.__name(key, where)
+        if key not in table:
+            if default == None:
+                self.fail(name, "is required")
+            return default
+        value = table[key]
+        if not isinstance(value, list) or len(value) != 2:
+            self.fail(name, "must be a pair of numbers [x, y]")
+        pair = {"x": value[0], "y": value[1]}
+        return (self.number(pair, "x", None, name),
+                self.number(pair, "y", None, name))
+
+    def __name(self, key, where):
+        """Returns the full name of a setting."""
+        return key if where == None else "{}.{}".format(where, key)
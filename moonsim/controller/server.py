@@ -0,0 +1,368 @@
+import asyncio
+import base64
+import hashlib
+import json
+import queue
+import struct
+import threading
+import urllib.parse
+import resources.indices as ind
+from controller import telemetry
+from resources import const
+
+# Commands accepted from clients.
+COMMANDS = ("play", "pause", "toggle", "stop", "reset")
+# WebSocket opcodes.
+_TEXT, _CLOSE, _PING, _PONG = 0x1, 0x8, 0x9, 0xA
+# Key suffix of the WebSocket handshake (RFC 6455).
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+class StateServer():
+    """Local HTTP and WebSocket server for remote dashboards.
+
+    The server runs an asyncio event loop on a background thread, so
+    neither the pyglet loop nor the physics ever wait for clients.
+    The controller hands it state snapshots (flat dicts of JSON
+    values) with publish, and picks up client commands with
+    commands. Both methods only touch thread-safe queues.
+
+    HTTP endpoints:
+
+        GET  /state     The latest snapshot as JSON.
+        GET  /history   Rows of the run history (see History.query)
+                        with the optional start, end (days) and
+                        points query parameters.
+        POST /command   Body {"command": <name>}, <name> in COMMANDS.
+        GET  /ws        WebSocket upgrade.
+
+    WebSocket clients first receive {"type": "full", "seq", "state"}
+    with the whole snapshot, and then {"type": "delta", "seq",
+    "changes", "removed"} messages with only the keys that changed
+    since the previous snapshot. They can send commands as
+    {"command": <name>} text messages. A client that falls more than
+    const.SERVER_CLIENT_QUEUE messages behind has its queue cleared
+    and is sent a full snapshot again.
+    """
+
+    def __init__(self, port, host=const.SERVER_HOST, history=None):
+        """Initialization.
+
+        Args:
+            port (int): TCP port to listen on (0 for any free port).
+            host (str): Address to listen on.
+            history (History): Run history served at /history, if
+                any.
+
+        Raises an Exception with a BADSERVER_STR message if the server
+        cannot listen on the address.
+        """
+        self.host = host
+        self.port = port
+        self.history = history
+        self.seq = 0
+        self.__snapshot = dict()
+        self.__commands = queue.SimpleQueue()
+        self.__clients = set()
+        self.__connections = set()
+        self.__loop = asyncio.new_event_loop()
+        self.__ready = threading.Event()
+        self.__error = None
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+        self.__ready.wait()
+        if self.__error != None:
+            raise Exception(const.BADSERVER_STR.format(
+                host, port, self.__error))
+
+#######################################
+# Methods.
+
+    def publish(self, snapshot):
+        """Sends a new state snapshot to the clients.
+
+        Args:
+            snapshot (dict): Flat dict of JSON values.
+
+        Returns:
+            Nothing.
+        """
+        self.__loop.call_soon_threadsafe(self.__broadcast, dict(snapshot))
+
+    def commands(self):
+        """Returns the commands received since the last call."""
+        received = list()
+        while True:
+            try:
+                received.append(self.__commands.get_nowait())
+            except queue.Empty:
+                return received
+
+    def close(self):
+        """Disconnects the clients and stops the server thread."""
+        if self.__loop.is_running():
+            self.__loop.call_soon_threadsafe(self.__stop.set)
+        self.__thread.join(const.SERVER_CLOSE_TIMEOUT)
+
+    def __run(self):
+        """Background thread: runs the event loop until closed."""
+        asyncio.set_event_loop(self.__loop)
+        try:
+            self.__loop.run_until_complete(self.__serve())
+        finally:
+            self.__loop.close()
+
+    async def __serve(self):
+        """Listens until the stop event is set."""
+        self.__stop = asyncio.Event()
+        try:
+            server = await asyncio.start_server(
+                self.__handle, self.host, self.port)
+        except OSError as err:
+            self.__error = err.strerror
+            self.__ready.set()
+            return
+        self.port = server.sockets[0].getsockname()[1]
+        self.__ready.set()
+        async with server:
+            await self.__stop.wait()
+        # Closing the connections ends their handlers.
+        for writer in self.__connections:
+            writer.close()
+        tasks = asyncio.all_tasks() - {asyncio.current_task()}
+        if tasks:
+            await asyncio.wait(tasks, timeout=const.SERVER_CLOSE_TIMEOUT)
+
+    def __broadcast(self, snapshot):
+        """Queues the delta of a snapshot for every client."""
+        previous = self.__snapshot
+        self.__snapshot = snapshot
+        changes = {key: value for key, value in snapshot.items()
+                   if key not in previous or previous[key] != value}
+        removed = [key for key in previous if key not in snapshot]
+        if not changes and not removed:
+            return
+        self.seq += 1
+        delta = encode({
+            "type": "delta", "seq": self.seq,
+            "changes": changes, "removed": removed})
+        for client in self.__clients:
+            if client.resync:
+                continue
+            try:
+                client.queue.put_nowait(delta)
+            except asyncio.QueueFull:
+                # The client is too slow: resend the whole state.
+                client.resync = True
+                while not client.queue.empty():
+                    client.queue.get_nowait()
+                client.queue.put_nowait(None)
+
+    def __full(self):
+        """Returns the full snapshot message."""
+        return encode({
+            "type": "full", "seq": self.seq, "state": self.__snapshot})
+
+    async def __handle(self, reader, writer):
+        """Serves one HTTP connection."""
+        self.__connections.add(writer)
+        try:
+            method, path, query, headers, body = await read_request(
+                reader)
+            if path == "/ws" and headers.get("upgrade", "").lower() == \
+                    "websocket":
+                await self.__websocket(reader, writer, headers)
+            elif method == "GET" and path == "/state":
+                await respond(writer, 200, self.__full())
+            elif method == "GET" and path == "/history" and \
+                    self.history != None:
+                await respond(writer, *self.__history(query))
+            elif method == "POST" and path == "/command":
+                await respond(writer, *self.__command(body))
+            else:
+                await respond(writer, 404, encode({"error": "not found"}))
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError, ValueError):
+            pass
+        finally:
+            self.__connections.discard(writer)
+            writer.close()
+
+    def __history(self, query):
+        """Returns the run history over the requested range.
+
+        Returns:
+            tuple: HTTP status and JSON response.
+        """
+        try:
+            start = float(query.get("start", ["-inf"])[0])
+            end = float(query.get("end", ["inf"])[0])
+            points = int(query.get("points", [const.HISTORY_POINTS])[0])
+        except ValueError:
+            return 400, encode(
+                {"error": "start and end must be numbers, points an integer"})
+        tier, rows = self.history.query(start, end, points)
+        return 200, encode({
+            "channels": self.history.channels, "tier": tier,
+            "span": self.history.span(), "rows": rows})
+
+    def __command(self, body):
+        """Queues a command sent as JSON.
+
+        Returns:
+            tuple: HTTP status and JSON response.
+        """
+        try:
+            name = json.loads(body).get("command")
+        except (ValueError, AttributeError):
+            name = None
+        if name not in COMMANDS:
+            return 400, encode(
+                {"error": "command must be one of " + ", ".join(COMMANDS)})
+        self.__commands.put(name)
+        return 202, encode({"command": name})
+
+    async def __websocket(self, reader, writer, headers):
+        """Completes the WebSocket handshake and serves the client."""
+        key = headers.get("sec-websocket-key", "")
+        accept = base64.b64encode(
+            hashlib.sha1((key + _WS_GUID).encode()).digest()).decode()
+        writer.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+            "Sec-WebSocket-Accept: {}\r\n\r\n").format(accept).encode())
+        client = _Client(writer)
+        self.__clients.add(client)
+        sender = asyncio.ensure_future(self.__send(client))
+        try:
+            while True:
+                opcode, payload = await read_frame(reader)
+                if opcode == _CLOSE:
+                    writer.write(frame(_CLOSE, payload[:2]))
+                    break
+                elif opcode == _PING:
+                    writer.write(frame(_PONG, payload))
+                elif opcode == _TEXT:
+                    writer.write(frame(_TEXT, self.__command(payload)[1]))
+        finally:
+            self.__clients.discard(client)
+            sender.cancel()
+
+    async def __send(self, client):
+        """Writes the queued messages of a client."""
+        client.writer.write(frame(_TEXT, self.__full()))
+        while True:
+            message = await client.queue.get()
+            if message == None:
+                client.resync = False
+                message = self.__full()
+            client.writer.write(frame(_TEXT, message))
+            await client.writer.drain()
+
+class _Client():
+    """WebSocket client with its queue of pending messages."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.queue = asyncio.Queue(maxsize=const.SERVER_CLIENT_QUEUE)
+        self.resync = False
+
+#######################################
+# Core functions.
+
+def encode(message):
+    """Encodes a message as compact JSON."""
+    return json.dumps(message, separators=(",", ":")).encode()
+
+async def read_request(reader):
+    """Reads an HTTP request.
+
+    Returns:
+        tuple: Method, path, dict of query parameter lists, dict of
+            headers (lower-case names) and body bytes.
+    """
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    method, path, _ = lines[0].split(" ", 2)
+    headers = dict()
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > const.SERVER_MAX_MESSAGE:
+        raise ValueError("request too large")
+    body = await reader.readexactly(length)
+    url = urllib.parse.urlsplit(path)
+    return method, url.path, urllib.parse.parse_qs(url.query), headers, body
+
+async def respond(writer, status, body):
+    """Writes an HTTP response with a JSON body."""
+    reasons = {200: "OK", 202: "Accepted", 400: "Bad Request",
+               404: "Not Found"}
+    writer.write((
+        "HTTP/1.1 {} {}\r\nContent-Type: application/json\r\n"
+        "Content-Length: {}\r\nConnection: close\r\n\r\n").format(
+            status, reasons[status], len(body)).encode() + body)
+    await writer.drain()
+
+async def read_frame(reader):
+    """Reads a (masked) client WebSocket frame.
+
+    Returns:
+        tuple: Opcode and unmasked payload bytes. Fragmented messages
+            are not supported.
+    """
+    first, second = await reader.readexactly(2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack("!Q", await reader.readexactly(8))
+    if length > const.SERVER_MAX_MESSAGE or not first & 0x80:
+        raise ValueError("unsupported frame")
+    mask = await reader.readexactly(4) if second & 0x80 else bytes(4)
+    payload = await reader.readexactly(length)
+    return opcode, bytes(
+        byte ^ mask[index % 4] for index, byte in enumerate(payload))
+
+def frame(opcode, payload):
+    """Returns an unmasked server WebSocket frame."""
+    length = len(payload)
+    if length < 126:
+        head = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        head = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return head + payload
+
+def snapshot(simstate, run_time, moon, planets):
+    """Returns the state of a simulation as a flat dict.
+
+    Args:
+        simstate (int): ind.RUNNING, ind.PAUSED or ind.STOPPED.
+        run_time (float): Simulation run time (s).
+        moon (Moon or Body): Moon being simulated.
+        planets (list of Planet or Body): Planets of the scene.
+
+    Returns:
+        dict: The state ('running', 'paused' or 'stopped'), whether
+            the moon crashed, the moon and planet positions (px) and
+            the telemetry fields (see telemetry.sample).
+    """
+    states = {
+        ind.RUNNING: "running", ind.PAUSED: "paused",
+        ind.STOPPED: "stopped"}
+    state = {
+        "state": states[simstate],
+        "crashed": moon.crashed,
+        "moon_x": moon.locus.x,
+        "moon_y": moon.locus.y}
+    for index, planet in enumerate(planets):
+        state["planet{}_x".format(index)] = planet.locus.x
+        state["planet{}_y".format(index)] = planet.locus.y
+    state.update(zip(
+        const.TELEMETRY_FIELDS,
+        telemetry.sample(run_time, moon, planets)))
+    return state
@@ -1,6 +1,8 @@
+import os
 import sys
 import getopt
 import resources.indices as ind
+from controller import scenario, telemetry
 from resources import const, license, help_screen
 
 def show_version():
@@ -26,6 +28,104 @@ def assign_args(par, args):
     else:
         raise Exception(const.BADWINDIMMSG_STR)
 
+def assign_time(par, arg):
+    try:
+        days = float(arg)
+    except ValueError:
+        raise Exception(const.BADRENDERTIME_STR)
+    if days <= 0:
+        raise Exception(const.BADRENDERTIME_STR)
+    par[ind.RENDER_TIME] = days
+
+def assign_trail(par, arg):
+    try:
+        vertices = int(arg)
+    except ValueError:
+        raise Exception(const.BADTRAIL_STR)
+    if vertices < 0:
+        raise Exception(const.BADTRAIL_STR)
+    par[ind.PATH_HISTORY] = vertices
+
+def assign_integrator(par, arg):
+    if arg not in scenario.INTEGRATORS:
+        raise Exception(const.BADINTEGRATOR_STR)
+    par[ind.INTEGRATOR] = scenario.INTEGRATORS[arg]
+
+def assign_precision(par, arg):
+    if arg not in scenario.PRECISIONS:
+        raise Exception(const.BADPRECISION_STR)
+    par[ind.PRECISION] = scenario.PRECISIONS[arg]
+
+def assign_step(par, arg):
+    try:
+        hours = float(arg)
+    except ValueError:
+        raise Exception(const.BADSTEP_STR)
+    if hours <= 0:
+        raise Exception(const.BADSTEP_STR)
+    par[ind.STEP_SIZE] = hours / const.HR_PER_SIMSEC
+
+def assign_telemetry(par, arg):
+    if not telemetry.check_target(arg):
+        raise Exception(const.BADTELEMETRY_STR)
+    par[ind.TELEMETRY] = arg
+
+def assign_telemetry_format(par, arg):
+    formats = {"ndjson": ind.NDJSON, "binary": ind.BINARY}
+    if arg not in formats:
+        raise Exception(const.BADTELEMETRYFMT_STR)
+    par[ind.TELEMETRY_FMT] = formats[arg]
+
+def assign_serve(par, arg):
+    try:
+        port = int(arg)
+    except ValueError:
+        raise Exception(const.BADSERVE_STR)
+    if port < 0 or port > 65535:
+        raise Exception(const.BADSERVE_STR)
+    par[ind.SERVE_PORT] = port
+
+def assign_serve_rate(par, arg):
+    try:
+        rate = float(arg)
+    except ValueError:
+        raise Exception(const.BADSERVE_STR)
+    if rate <= 0:
+        raise Exception(const.BADSERVE_STR)
+    par[ind.SERVE_RATE] = rate
+
+def assign_compare(par, arg):
+    if len(par[ind.COMPARE]) + 1 >= const.COMPARE_MAX:
+        raise Exception(const.BADCOMPARE_STR.format(const.COMPARE_MAX))
+    # The scenario is loaded on top of the other settings later.
+    par[ind.COMPARE].append(arg)
+
+def center_positions(par):
+    par[ind.INIT_MOON_LOCX] += par[ind.WIN_WIDTH] / 2
+    par[ind.INIT_MOON_LOCY] += par[ind.WIN_HEIGHT] / 2
+    par[ind.INIT_PLANET_LOCX] += par[ind.WIN_WIDTH] / 2
+    par[ind.INIT_PLANET_LOCY] += par[ind.WIN_HEIGHT] / 2
+    if par[ind.CENTERED]:
+        for key in [ind.PLANETS, ind.MOONS]:
+            if par[key] != None:
+                par[key] = [
+                    (x + par[ind.WIN_WIDTH] / 2,
+                     y + par[ind.WIN_HEIGHT] / 2, velx, vely, mass)
+                    for x, y, velx, vely, mass in par[key]]
+
+def check_forces(par):
+    if not par[ind.FORCES]:
+        return
+    if par[ind.INTEGRATOR] == ind.NBODY:
+        raise Exception(const.BADFORCES_STR.format(
+            par[ind.NAME], "the nbody integrator"))
+    if par[ind.REGULARIZE]:
+        raise Exception(const.BADFORCES_STR.format(
+            par[ind.NAME], "--regularize"))
+
+def scenario_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
 def get_parameters(argv):
     parameters = {
         ind.RUN_SIM: True,
@@ -37,10 +137,39 @@ def get_parameters(argv):
         ind.INIT_VELX: const.MOON_PER_VELX,
         ind.INIT_VELY: const.MOON_PER_VELY,
         ind.WIN_WIDTH: const.MAIN_WIN_WIDTH,
-        ind.WIN_HEIGHT: const.MAIN_WIN_HEIGHT}
+        ind.WIN_HEIGHT: const.MAIN_WIN_HEIGHT,
+        ind.RENDER_PATH: None,
+        ind.RENDER_TIME: const.RENDER_DAYS,
+        ind.PATH_HISTORY: const.MOON_PATH_HISTORY,
+        ind.PROFILE: False,
+        ind.TRACE_PATH: None,
+        ind.INTEGRATOR: ind.AUTO,
+        ind.STEP_SIZE: const.STEP_SIZE,
+        ind.PLANETS: None,
+        ind.MOONS: None,
+        ind.CENTERED: True,
+        ind.TELEMETRY: None,
+        ind.TELEMETRY_FMT: ind.NDJSON,
+        ind.SERVE_PORT: None,
+        ind.SERVE_RATE: const.SERVER_RATE,
+        ind.REGRESS: False,
+        ind.REGRESS_UPDATE: False,
+        ind.GOVERNOR: True,
+        ind.CYCLES: False,
+        ind.PRECISION: None,
+        ind.REGULARIZE: False,
+        ind.COMPARE: list(),
+        ind.NAME: const.COMPARE_MAIN_NAME,
+        ind.ANALYZE: list(),
+        ind.FORCES: None}
     try:
         opts, args = getopt.getopt(
             argv, const.STARTUP_SHORT, const.STARTUP_LONG)
+        # Scenario settings come first so that options override them.
+        for opt, arg in opts:
+            if opt in ["-s", "--scenario"]:
+                parameters.update(scenario.load(arg))
+                parameters[ind.NAME] = scenario_name(arg)
         if len(args) > 0:
             assign_args(parameters, args)
         for opt, arg in opts:
@@ -63,10 +192,58 @@ def get_parameters(argv):
                 parameters[ind.INIT_MOON_LOCY] = const.DEL_MOON_APO_LOCY
                 parameters[ind.INIT_VELX] = const.MOON_APO_VELX
                 parameters[ind.INIT_VELY] = const.MOON_APO_VELY
-        parameters[ind.INIT_MOON_LOCX] += parameters[ind.WIN_WIDTH] / 2
-        parameters[ind.INIT_MOON_LOCY] += parameters[ind.WIN_HEIGHT] / 2
-        parameters[ind.INIT_PLANET_LOCX] += parameters[ind.WIN_WIDTH] / 2
-        parameters[ind.INIT_PLANET_LOCY] += parameters[ind.WIN_HEIGHT] / 2
+            elif opt in ["-r", "--render"]:
+                parameters[ind.RENDER_PATH] = arg
+            elif opt in ["-t", "--time"]:
+                assign_time(parameters, arg)
+            elif opt == "--trail":
+                assign_trail(parameters, arg)
+            elif opt == "--profile":
+                parameters[ind.PROFILE] = True
+            elif opt == "--trace":
+                parameters[ind.PROFILE] = True
+                parameters[ind.TRACE_PATH] = arg
+            elif opt == "--integrator":
+                assign_integrator(parameters, arg)
+            elif opt == "--step":
+                assign_step(parameters, arg)
+            elif opt == "--telemetry":
+                assign_telemetry(parameters, arg)
+            elif opt == "--telemetry-format":
+                assign_telemetry_format(parameters, arg)
+            elif opt == "--serve":
+                assign_serve(parameters, arg)
+            elif opt == "--serve-rate":
+                assign_serve_rate(parameters, arg)
+            elif opt == "--regress":
+                parameters[ind.REGRESS] = True
+            elif opt == "--regress-update":
+                parameters[ind.REGRESS] = True
+                parameters[ind.REGRESS_UPDATE] = True
+            elif opt == "--fixed-divs":
+                parameters[ind.GOVERNOR] = False
+            elif opt == "--cycles":
+                parameters[ind.CYCLES] = True
+            elif opt == "--precision":
+                assign_precision(parameters, arg)
+            elif opt == "--regularize":
+                parameters[ind.REGULARIZE] = True
+            elif opt == "--compare":
+                assign_compare(parameters, arg)
+            elif opt == "--analyze":
+                parameters[ind.ANALYZE].append(arg)
+        # Compared scenarios override the settings of the main run
+        # that they set.
+        variants = list()
+        for path in parameters[ind.COMPARE]:
+            variant = dict(parameters)
+            variant.update(scenario.load(path, defaults=False))
+            variant[ind.NAME] = scenario_name(path)
+            variants.append(variant)
+        for par in [parameters] + variants:
+            check_forces(par)
+            center_positions(par)
+        parameters[ind.COMPARE] = variants
         return parameters
     except getopt.GetoptError:
         sys.stderr.write(const.BADCMDMSG_STR)
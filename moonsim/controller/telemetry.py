@@ -0,0 +1,216 @@
+import json
+import queue
+import socket
+import struct
+import sys
+import threading
+import time
+import resources.indices as ind
+from resources import const
+
+class TelemetrySink():
+    """Streams moon telemetry to a pipe or socket without blocking.
+
+    Samples are put on a bounded queue by record, which never waits,
+    and are encoded and sent by a background thread. If the reader
+    falls behind, samples are downsampled: the stride between recorded
+    samples doubles whenever the queue is more than half full and
+    halves again once it has drained. Samples that still do not fit
+    in the queue are dropped. Every sample carries a sequence number,
+    so readers can tell where samples were skipped.
+
+    Targets are '-' for stdout, 'unix:<path>' for a UNIX socket and
+    'tcp:<host>:<port>' for a TCP socket. Sockets are connected (and
+    reconnected after errors) by the background thread, and samples
+    are dropped while there is no connection.
+
+    NDJSON samples are objects with 'seq' and the const.TELEMETRY_FIELDS
+    keys. Binary samples are packed with const.TELEMETRY_STRUCT, i.e.,
+    the sequence number followed by the fields as little-endian
+    doubles. Fields are in the units of the parameter label: days,
+    km, km/h and TJ.
+    """
+
+    def __init__(self, target, fmt=ind.NDJSON,
+                 queue_size=const.TELEMETRY_QUEUE_SIZE):
+        """Initialization.
+
+        Args:
+            target (str): Where to send the samples (see above).
+            fmt (int): ind.NDJSON or ind.BINARY.
+            queue_size (int): Max number of samples waiting to be
+                sent.
+        """
+        self.target = target
+        self.fmt = fmt
+        self.stride = 1
+        self.dropped = 0
+        self.sent = 0
+        self.__count = 0
+        self.__seq = 0
+        self.__queue = queue.Queue(maxsize=queue_size)
+        self.__struct = struct.Struct(const.TELEMETRY_STRUCT)
+        self.__stream = None
+        self.__thread = threading.Thread(target=self.__work, daemon=True)
+        self.__thread.start()
+
+#######################################
+# Methods.
+
+    def record(self, run_time, moon, planets, gravity=const.GRAVITY,
+               values=None):
+        """Records a sample of the moon state.
+
+        Args:
+            run_time (float): Simulation run time (s).
+            moon (Moon or Body): Moon being simulated.
+            planets (list of Planet or Body): Planets of the scene.
+                Distances are measured from the first planet.
+            gravity (float): Gravity constant.
+            values (tuple of float): If not None, the sample of this
+                state already computed by the caller (see sample).
+
+        Returns:
+            Nothing.
+        """
+        self.__count += 1
+        if self.__count % self.stride != 0:
+            return
+        waiting = self.__queue.qsize()
+        if waiting > self.__queue.maxsize // 2:
+            self.stride = min(2 * self.stride, const.TELEMETRY_MAX_STRIDE)
+        elif waiting == 0 and self.stride > 1:
+            self.stride //= 2
+        self.__seq += 1
+        if values == None:
+            values = sample(run_time, moon, planets, gravity)
+        try:
+            self.__queue.put_nowait((self.__seq, values))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=const.TELEMETRY_CLOSE_TIMEOUT):
+        """Sends the waiting samples and stops the background thread.
+
+        Args:
+            timeout (float): Max time to wait for the samples to be
+                sent (s).
+        """
+        try:
+            self.__queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self.__thread.join(timeout)
+
+    def __work(self):
+        """Background thread loop."""
+        retry = 0
+        while True:
+            items = [self.__queue.get()]
+            while len(items) < const.TELEMETRY_BATCH:
+                try:
+                    items.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+            closing = items[-1] is None
+            if closing:
+                items.pop()
+            if self.__stream == None and time.monotonic() >= retry:
+                try:
+                    self.__stream = self.__connect()
+                except (OSError, ValueError):
+                    retry = time.monotonic() + const.TELEMETRY_RETRY
+            if self.__stream != None and items:
+                try:
+                    self.__stream.write(self.__encode(items))
+                    self.__stream.flush()
+                    self.sent += len(items)
+                except (OSError, ValueError):
+                    self.__close_stream()
+                    retry = time.monotonic() + const.TELEMETRY_RETRY
+                    self.dropped += len(items)
+            else:
+                self.dropped += len(items)
+            if closing:
+                self.__close_stream()
+                return
+
+    def __connect(self):
+        """Opens the target as a binary stream."""
+        if self.target == "-":
+            return sys.stdout.buffer
+        kind, _, address = self.target.partition(":")
+        if kind == "unix":
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(address)
+        elif kind == "tcp":
+            host, _, port = address.rpartition(":")
+            sock = socket.create_connection((host, int(port)))
+        else:
+            raise ValueError(const.BADTELEMETRY_STR)
+        return sock.makefile("wb")
+
+    def __close_stream(self):
+        """Closes the stream (stdout is only flushed)."""
+        stream, self.__stream = self.__stream, None
+        if stream == None:
+            return
+        try:
+            if stream is sys.stdout.buffer:
+                stream.flush()
+            else:
+                stream.close()
+        except (OSError, ValueError):
+            pass
+
+    def __encode(self, items):
+        """Encodes a batch of samples."""
+        if self.fmt == ind.BINARY:
+            return b"".join(
+                self.__struct.pack(seq, *values) for seq, values in items)
+        lines = list()
+        for seq, values in items:
+            record = {"seq": seq}
+            record.update(zip(const.TELEMETRY_FIELDS, values))
+            lines.append(json.dumps(record))
+        lines.append("")
+        return "\n".join(lines).encode()
+
+#######################################
+# Core functions.
+
+def sample(run_time, moon, planets, gravity=const.GRAVITY):
+    """Returns the telemetry fields for a moon state.
+
+    Returns:
+        tuple of float: Values of the const.TELEMETRY_FIELDS, in the
+            units of the parameter label.
+    """
+    # Imported here so startup can check targets before the pyglet
+    # options are set (the model package imports pyglet sprites).
+    import model.engine
+
+    energy = model.engine.energy(moon, planets, gravity=gravity)
+    vel_conv = const.KM_PER_PX / const.HR_PER_SIMSEC
+    origin = planets[0].locus
+    return (
+        run_time * const.DAY_PER_SIMSEC,
+        (moon.locus - origin).mag() * const.KM_PER_PX,
+        moon.velocity.mag() * vel_conv,
+        moon.velocity.x * vel_conv,
+        moon.velocity.y * vel_conv,
+        energy[ind.TOTAL] * const.TJ_PER_SIMENERGY,
+        energy[ind.KINETIC] * const.TJ_PER_SIMENERGY,
+        energy[ind.POTENTIAL] * const.TJ_PER_SIMENERGY)
+
+def check_target(target):
+    """Determines whether a telemetry target is well formed."""
+    if target == "-":
+        return True
+    kind, _, address = target.partition(":")
+    if kind == "unix":
+        return len(address) > 0
+    if kind == "tcp":
+        host, _, port = address.rpartition(":")
+        return len(host) > 0 and port.isdigit()
+    return False
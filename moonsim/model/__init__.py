@@ -2,3 +2,4 @@ import model.engine
 import model.moon
 import model.planet
 import model.player
+import model.body
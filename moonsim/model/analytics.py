@@ -0,0 +1,322 @@
+import sys
+import numpy as np
+from resources import const
+
+# Layout of the samples of binary telemetry files (see
+# controller.telemetry): a sequence number followed by the fields.
+SAMPLE_DTYPE = np.dtype(
+    [("seq", "<u8")] + [(field, "<f8") for field in const.TELEMETRY_FIELDS])
+
+class Run():
+    """Recorded samples of a moon run, in simulation units.
+
+    The samples are arrays over time: the time (s), the distance from
+    the first planet (px), the speed (px/s), the total energy as in
+    engine.energy and, if it was recorded, the angular momentum about
+    the first planet. Without it, the angular momentum is estimated at
+    the periapses, where the velocity is perpendicular to the radius
+    (see orbits). The crash time is None if the moon did not crash.
+    """
+
+    def __init__(self, time, distance, speed, energy, momentum=None,
+                 crash_time=None):
+        """Initialization.
+
+        Args:
+            time (numpy.ndarray): Increasing sample times (s).
+            distance (numpy.ndarray): Distances from the first
+                planet (px).
+            speed (numpy.ndarray): Speeds of the moon (px/s).
+            energy (numpy.ndarray): Total energies of the moon.
+            momentum (numpy.ndarray): Angular momenta about the first
+                planet, or None.
+            crash_time (float): Time of the crash (s), or None.
+        """
+        self.time = time
+        self.distance = distance
+        self.speed = speed
+        self.energy = energy
+        self.momentum = momentum
+        self.crash_time = crash_time
+
+    def end(self):
+        """Returns the number of samples before the crash, if any."""
+        if self.crash_time == None:
+            return len(self.time)
+        return int(np.searchsorted(self.time, self.crash_time))
+
+    def __len__(self):
+        return len(self.time)
+
+#######################################
+# Core functions.
+
+def from_states(times, states, planets, gravity=const.GRAVITY,
+                mass=const.MOON_MASS, radius=0, crash_time=None):
+    """Returns the run of recorded moon states.
+
+    Args:
+        times (array-like): Increasing sample times (s).
+        states (array-like): Flat x, y, velx, vely of every sample,
+            or an (n, 4) array of them.
+        planets (list of Planet or Body): Planets setting up the
+            gravitational field. Distances and angular momenta are
+            measured from the first one.
+        gravity (float): Gravity constant.
+        mass (float): Mass of the moon.
+        radius (float): Radius of the moon. As in engine.energy,
+            planets that the moon overlaps add no potential energy.
+        crash_time (float): Time of the crash (s), or None.
+
+    Returns:
+        Run: The samples of the run.
+    """
+    time = np.asarray(times, dtype=np.float64)
+    x, y, velx, vely = np.asarray(
+        states, dtype=np.float64).reshape(-1, 4).T
+    origin = planets[0].locus
+    dx = x - origin.x
+    dy = y - origin.y
+    speed = np.hypot(velx, vely)
+    energy = mass * speed ** 2 / 2
+    for planet in planets:
+        r = np.hypot(x - planet.locus.x, y - planet.locus.y)
+        outside = r > planet.width / 2 + radius
+        energy[outside] -= gravity * planet.mass / r[outside]
+    return Run(time, np.hypot(dx, dy), speed, energy,
+               momentum=mass * (dx * vely - dy * velx), crash_time=crash_time)
+
+def from_trajectory(trajectory, planets, gravity=const.GRAVITY,
+                    mass=const.MOON_MASS, radius=0):
+    """Returns the run of a cached Trajectory (see model.cache).
+
+    The times and states of the trajectory are read in place. Only
+    the recorded states are used, i.e., the first lap of a trajectory
+    with a cycle.
+    """
+    time = np.frombuffer(trajectory.times, dtype=np.float64)
+    return from_states(
+        time, np.frombuffer(trajectory.states, dtype=np.float64), planets,
+        gravity=gravity, mass=mass, radius=radius,
+        crash_time=float(time[-1]) if trajectory.crashed else None)
+
+def load(path):
+    """Returns the run recorded in a binary telemetry file.
+
+    Args:
+        path (str): File written with --telemetry-format binary.
+
+    Returns:
+        Run: The samples of the file, without angular momenta.
+
+    The file is memory-mapped, so only the fields that are used are
+    read, and a partial last sample is ignored. The run time of the
+    samples restarts at 0 after a year, which is undone here. A run
+    that ends with the moon at rest ended in a crash, at the first of
+    these samples.
+    """
+    samples = np.memmap(path, dtype=SAMPLE_DTYPE, mode="r")
+    time = samples["time"] / const.DAY_PER_SIMSEC
+    wraps = np.cumsum(np.diff(time) < 0)
+    time[1:] += wraps * const.SIMSEC_PER_YEAR
+    speed = samples["speed"] / (const.KM_PER_PX / const.HR_PER_SIMSEC)
+    moving = np.flatnonzero(speed != 0)
+    crash_time = None
+    if len(moving) == 0 and len(time) > 0:
+        crash_time = float(time[0])
+    elif len(moving) > 0 and moving[-1] < len(speed) - 1:
+        crash_time = float(time[moving[-1] + 1])
+    return Run(time, samples["distance"] / const.KM_PER_PX, speed,
+               samples["total_energy"] / const.TJ_PER_SIMENERGY,
+               crash_time=crash_time)
+
+def orbits(run):
+    """Returns the elements of each orbit of a run.
+
+    Args:
+        run (Run): Samples of the run.
+
+    Returns:
+        dict: Arrays over the orbits, keyed by the
+            const.ANALYTICS_FIELDS, in the units of the parameter
+            label (days, km).
+
+    An orbit runs from a periapsis (a minimum of the distance) to the
+    next one. The apsides are located between samples by parabolic
+    interpolation, so the period and apsis distances do not depend on
+    the sampling much. The semi-major axis and eccentricity follow
+    from the apsis distances, as for a Keplerian orbit. The drifts are
+    those of the energy and angular momentum at the end of each orbit
+    relative to the start of the run (or to the first periapsis, for
+    estimated angular momenta). Samples after a crash are ignored.
+    """
+    end = run.end()
+    time = run.time[:end]
+    distance = run.distance[:end]
+    peri, peri_time, peri_dist = _extrema(time, distance, minimum=True)
+    apo, apo_time, apo_dist = _extrema(time, distance, minimum=False)
+    if len(peri) < 2:
+        return {field: np.empty(0) for field in const.ANALYTICS_FIELDS}
+    # The apoapsis of each orbit is the first one after its periapsis.
+    following = np.searchsorted(apo, peri[:-1])
+    apoapsis = np.full(len(peri) - 1, np.nan)
+    found = following < len(apo)
+    found[found] = apo[following[found]] < peri[1:][found]
+    apoapsis[found] = apo_dist[following[found]]
+    periapsis = peri_dist[:-1]
+    energy = run.energy[peri[1:]]
+    if run.momentum is not None:
+        momentum = run.momentum[peri[1:]] / run.momentum[0] - 1
+    else:
+        estimate = distance[peri] * run.speed[peri]
+        momentum = estimate[1:] / estimate[0] - 1
+    return {
+        "start": peri_time[:-1] * const.DAY_PER_SIMSEC,
+        "period": np.diff(peri_time) * const.DAY_PER_SIMSEC,
+        "periapsis": periapsis * const.KM_PER_PX,
+        "apoapsis": apoapsis * const.KM_PER_PX,
+        "semi_major_axis": (periapsis + apoapsis) / 2 * const.KM_PER_PX,
+        "eccentricity": (apoapsis - periapsis) / (apoapsis + periapsis),
+        "energy_drift": (energy - run.energy[0]) / abs(run.energy[0]),
+        "momentum_drift": momentum}
+
+def summary(run, elements=None):
+    """Returns statistics of a whole run.
+
+    Args:
+        run (Run): Samples of the run.
+        elements (dict): Orbits of the run (see orbits), computed if
+            None.
+
+    Returns:
+        dict: Number of samples and orbits, duration, mean period,
+            semi-major axis and eccentricity, lowest periapsis,
+            highest apoapsis, energy and angular momentum drifts and
+            crash time, in the units of the parameter label. The
+            drifts are the largest relative changes over the samples
+            before the crash. Missing values are NaN.
+    """
+    if elements == None:
+        elements = orbits(run)
+    end = run.end()
+    count = len(elements["period"])
+    duration = 0.0
+    if len(run) > 0:
+        duration = (run.time[-1] - run.time[0]) * const.DAY_PER_SIMSEC
+    energy = run.energy[:end]
+    energy_drift = np.nan
+    if end > 0:
+        energy_drift = np.max(np.abs(energy - energy[0])) / abs(energy[0])
+    momentum_drift = np.nan
+    if run.momentum is not None and end > 0:
+        momentum = run.momentum[:end]
+        momentum_drift = np.max(np.abs(momentum / momentum[0] - 1))
+    elif count > 0:
+        momentum_drift = np.max(np.abs(elements["momentum_drift"]))
+    return {
+        "samples": len(run),
+        "duration": duration,
+        "orbits": count,
+        "period": _mean(elements["period"]),
+        "semi_major_axis": _mean(elements["semi_major_axis"]),
+        "eccentricity": _mean(elements["eccentricity"]),
+        "periapsis": np.min(elements["periapsis"]) if count else np.nan,
+        "apoapsis": np.nanmax(elements["apoapsis"]) if count else np.nan,
+        "energy_drift": energy_drift,
+        "momentum_drift": momentum_drift,
+        "crash_time": np.nan if run.crash_time == None else
+                      run.crash_time * const.DAY_PER_SIMSEC}
+
+def crash_statistics(crash_times, count):
+    """Returns statistics of the crashes of many moons or runs.
+
+    Args:
+        crash_times (iterable of float): Crash times (s), e.g., the
+            values of Ensemble.crash_times.
+        count (int): Number of moons or runs, crashed or not.
+
+    Returns:
+        dict: Number of moons or runs, number and fraction of
+            crashes, and first, median, mean and last crash times
+            (days, NaN without crashes).
+    """
+    times = np.fromiter(crash_times, dtype=np.float64)
+    times *= const.DAY_PER_SIMSEC
+    crashed = len(times) > 0
+    return {
+        "count": count,
+        "crashed": len(times),
+        "fraction": len(times) / count if count > 0 else np.nan,
+        "first": np.min(times) if crashed else np.nan,
+        "median": np.median(times) if crashed else np.nan,
+        "mean": np.mean(times) if crashed else np.nan,
+        "last": np.max(times) if crashed else np.nan}
+
+def main(paths):
+    """Prints the orbits and statistics of telemetry files.
+
+    Args:
+        paths (list of str): Binary telemetry files.
+
+    Returns:
+        int: Exit status, 0 if all the files were read and 1
+            otherwise.
+
+    With several files, the crash statistics over the runs follow.
+    """
+    crash_times = list()
+    for path in paths:
+        try:
+            run = load(path)
+        except (OSError, ValueError) as err:
+            sys.stderr.write(const.BADANALYZE_STR.format(path, err))
+            return 1
+        elements = orbits(run)
+        print(const.ANALYTICS_TITLE_STR.format(path))
+        print(const.ANALYTICS_HEADER_STR)
+        for index, values in enumerate(zip(
+                *(elements[field] for field in const.ANALYTICS_FIELDS))):
+            print(const.ANALYTICS_ORBIT_STR.format(index + 1, *values))
+        print(const.ANALYTICS_SUMMARY_STR.format(**summary(run, elements)))
+        if run.crash_time != None:
+            crash_times.append(run.crash_time)
+    if len(paths) > 1:
+        print(const.ANALYTICS_CRASH_STR.format(
+            **crash_statistics(crash_times, len(paths))))
+    return 0
+
+#######################################
+# Generic functions.
+
+def _extrema(time, distance, minimum):
+    """Returns the local minima or maxima of the distance.
+
+    Returns:
+        tuple (three elements): Indices of the extreme samples, and
+            the times and distances of the extrema interpolated by
+            the parabola through each sample and its neighbours.
+    """
+    change = np.diff(distance)
+    if minimum:
+        index = np.flatnonzero((change[:-1] < 0) & (change[1:] >= 0)) + 1
+    else:
+        index = np.flatnonzero((change[:-1] > 0) & (change[1:] <= 0)) + 1
+    t0, t1, t2 = time[index - 1], time[index], time[index + 1]
+    r0, r1, r2 = distance[index - 1], distance[index], distance[index + 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope0 = (r1 - r0) / (t1 - t0)
+        slope2 = (r2 - r1) / (t2 - t1)
+        # r(t1 + u) = r1 + slope * u + curve * u^2.
+        curve = (slope2 - slope0) / (t2 - t0)
+        slope = (slope0 * (t2 - t1) + slope2 * (t1 - t0)) / (t2 - t0)
+        shift = np.clip(-slope / (2 * curve), t0 - t1, t2 - t1)
+        value = r1 + shift * (slope + curve * shift)
+    flat = ~np.isfinite(shift) | ~np.isfinite(value)
+    shift[flat] = 0
+    value[flat] = r1[flat]
+    return index, t1 + shift, value
+
+def _mean(values):
+    """Returns the mean of the finite values (NaN if there are none)."""
+    values = values[np.isfinite(values)]
+    return np.mean(values) if len(values) > 0 else np.nan
@@ -0,0 +1,93 @@
+from model.engine import Vector
+from model.trail import Trail
+from resources import const
+
+class Body():
+    """Display-free stand-in for the moon and planet sprites.
+
+    Provides the locus, velocity, mass, width, height and crash
+    members that the engine functions use so that simulations can
+    be run without an OpenGL context (e.g., on batch servers).
+    """
+
+    def __init__(self, locus, velocity=None, mass=const.MOON_MASS,
+                 width=const.MOON_WIDTH, path_segment=5, path_length=200,
+                 path_history=const.MOON_PATH_HISTORY):
+        """Initialization.
+
+        Args:
+            locus (Vector): Initial position vector.
+            velocity (Vector): Initial velocity vector.
+            mass (float): Mass of the body.
+            width (float): Diameter of the body (px).
+            path_segment (int): Min length of path segment.
+            path_length (int): Max number of segments in path.
+            path_history (int): Max number of vertices used to keep
+                a simplified history of older path segments.
+        """
+        if velocity == None:
+            velocity = Vector(0, 0)
+        self.trail = Trail(
+            locus, segment=path_segment, length=path_length,
+            history=path_history)
+        self.mass = mass
+        self.width = width
+        self.height = width
+        self.__locus = Vector(locus.x, locus.y)
+        self.velocity = Vector(velocity.x, velocity.y)
+        self.crashed = False
+
+#######################################
+# Methods.
+
+    def reset(self, locus=None, velocity=None):
+        """Reset the body location and velocity.
+
+        Args:
+            locus (Vector): New body locus.
+            velocity (Vector): New body velocity.
+
+        Returns:
+            Nothing.
+
+        If locus or velocity is None, then no change is made to the
+        corresponding member.
+        """
+        self.crashed = False
+        if locus != None:
+            self.locus = locus
+        if velocity != None:
+            self.velocity = Vector(velocity.x, velocity.y)
+        self.trail.reset(self.__locus)
+
+    def crash(self):
+        """Indicate that the body has crashed.
+
+        Args:
+            None.
+
+        Returns:
+            Nothing.
+        """
+        self.velocity = Vector(0, 0)
+        self.crashed = True
+
+    @property
+    def path(self):
+        """Getter for the flattened path vertices."""
+        return self.trail.vertices()
+
+    @property
+    def locus(self):
+        """Getter for the locus vector."""
+        return self.__locus
+
+    @locus.setter
+    def locus(self, value):
+        """Setter for the locus vector.
+
+        This method will also update the body path.
+        """
+        self.__locus.x = value.x
+        self.__locus.y = value.y
+        self.trail.add(self.__locus.x, self.__locus.y)
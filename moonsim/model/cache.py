@@ -0,0 +1,239 @@
+import array
+import bisect
+import collections
+import math
+import model.forces
+from model.engine import Vector
+from model.events import Event
+from resources import const
+
+class TrajectoryCache():
+    """Least-recently-used store of computed moon trajectories.
+
+    Trajectories are keyed by everything the motion of a moon depends
+    on (see key), so a run that is stopped or reset and played again
+    unchanged can be replayed from the cache instead of integrated
+    again (see Stepper). The states of the trajectories are counted
+    against a byte budget, and the least recently used trajectories
+    are dropped when it is exceeded.
+
+    If cycles is set, the steppers also look for the closure of the
+    recorded orbits (see Trajectory.find_cycle), after which the
+    trajectory is complete: later laps are replayed from the recorded
+    cycle with their phase offset, so a periodic run of any length
+    costs a lookup per frame and a fixed amount of memory.
+    """
+
+    def __init__(self, budget=const.CACHE_BYTES, cycles=False):
+        """Initialization.
+
+        Args:
+            budget (int): Max number of bytes of trajectory states.
+            cycles (bool): Whether periodic orbits are detected.
+        """
+        self.budget = budget
+        self.cycles = cycles
+        self.nbytes = 0
+        self.__entries = collections.OrderedDict()
+
+#######################################
+# Methods.
+
+    def lookup(self, key, locus, velocity):
+        """Returns the trajectory of a key, or a new empty one.
+
+        Args:
+            key (tuple): Key of the run (see key).
+            locus (Vector): Moon position at the start of the run.
+            velocity (Vector): Moon velocity at the start of the run.
+
+        Returns:
+            Trajectory: The cached trajectory, marked as the most
+                recently used, or a new one holding the start state.
+        """
+        trajectory = self.__entries.get(key)
+        if trajectory != None:
+            self.__entries.move_to_end(key)
+            return trajectory
+        trajectory = Trajectory(key)
+        trajectory.append(0, locus, velocity)
+        self.__entries[key] = trajectory
+        return trajectory if self.charge(trajectory) else None
+
+    def charge(self, trajectory):
+        """Accounts for the states added to a trajectory.
+
+        Args:
+            trajectory (Trajectory): Trajectory that has grown.
+
+        Returns:
+            bool: False if the trajectory is not (or no longer) in the
+                cache, e.g., because it outgrew the whole budget, in
+                which case it should not be extended any further.
+        """
+        if self.__entries.get(trajectory.key) is not trajectory:
+            return False
+        self.__entries.move_to_end(trajectory.key)
+        self.nbytes += trajectory.nbytes() - trajectory.charged
+        trajectory.charged = trajectory.nbytes()
+        while self.nbytes > self.budget:
+            key, oldest = self.__entries.popitem(last=False)
+            self.nbytes -= oldest.charged
+            if oldest is trajectory:
+                return False
+        return True
+
+    def clear(self):
+        """Removes all the trajectories."""
+        self.__entries.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+class Trajectory():
+    """Moon states at the frame times of a run.
+
+    Times are measured from the start of the run. Between two states,
+    the motion is recovered by engine.interpolate, as for the steps
+    of the stepper. The events of the run are kept with it. Once a
+    cycle is found, the motion from cycle_start repeats with period.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.times = array.array("d")
+        self.states = array.array("d")
+        self.events = list()
+        self.crashed = False
+        self.charged = 0
+        self.period = None
+        self.cycle_start = None
+
+    def append(self, time, locus, velocity):
+        """Adds the moon state at a time after the last one."""
+        self.times.append(time)
+        self.states.extend((locus.x, locus.y, velocity.x, velocity.y))
+
+    def end(self):
+        """Returns the time of the last state."""
+        return self.times[-1]
+
+    def locate(self, time):
+        """Maps a time of the run to the recorded motion.
+
+        Returns:
+            tuple: The time in the recorded motion with the same
+                state, and the time up to which the recorded motion
+                can be followed from it, or None if the time is past
+                the recorded motion.
+        """
+        if self.period == None:
+            return (time, self.end()) if time < self.end() else None
+        if time < self.cycle_start:
+            return time, self.cycle_start
+        cycle_end = self.cycle_start + self.period
+        return (self.cycle_start + math.fmod(time - self.cycle_start,
+                                             self.period), cycle_end)
+
+    def find_cycle(self, event):
+        """Checks whether an event closes the orbit.
+
+        Args:
+            event (Event): Apsis passage just recorded (run time).
+
+        Returns:
+            bool: True if the moon state at the event is within
+                const.CYCLE_LOC_TOL and const.CYCLE_VEL_TOL of the
+                state at the start of the run, or at the first event
+                of the same kind and planet, with at least one event
+                of another kind in between (so that a whole lap has
+                passed). The period and cycle_start are then set.
+        """
+        candidates = [self.state(0)]
+        for first in self.events:
+            if first.kind == event.kind and first.planet == event.planet:
+                if first is not event:
+                    candidates.append(
+                        (first.time, first.locus, first.velocity))
+                break
+        for time, locus, velocity in candidates:
+            lap = any(
+                other.kind != event.kind and time < other.time < event.time
+                for other in self.events)
+            if lap and \
+                    (event.locus - locus).mag() <= const.CYCLE_LOC_TOL and \
+                    (event.velocity - velocity).mag() <= const.CYCLE_VEL_TOL:
+                self.cycle_start = time
+                self.period = event.time - time
+                return True
+        return False
+
+    def state(self, index):
+        """Returns the index-th state as a (time, locus, velocity)."""
+        x, y, velx, vely = self.states[4 * index:4 * index + 4]
+        return self.times[index], Vector(x, y), Vector(velx, vely)
+
+    def segments(self, start, end, offset=0):
+        """Returns the steps between the states covering a time range.
+
+        Args:
+            start (float): Start of the range.
+            end (float): End of the range (at most the end time).
+            offset (float): Added to the times of the steps.
+
+        Returns:
+            list of tuple: (t0, locus0, velocity0, t1, locus1,
+                velocity1) steps in the format of the stepper.
+        """
+        first = max(0, bisect.bisect_right(self.times, start) - 1)
+        last = bisect.bisect_left(self.times, end)
+        segments = list()
+        previous = self.state(first)
+        for index in range(first + 1, last + 1):
+            current = self.state(index)
+            segments.append(
+                (previous[0] + offset, previous[1], previous[2],
+                 current[0] + offset, current[1], current[2]))
+            previous = current
+        return segments
+
+    def events_in(self, start, end, offset=0):
+        """Returns the events in (start, end], with offset times."""
+        return [
+            Event(event.time + offset, event.kind, event.planet,
+                  event.locus, event.velocity)
+            for event in self.events if start < event.time <= end]
+
+    def nbytes(self):
+        """Returns the number of bytes used by the states."""
+        return self.times.itemsize * (len(self.times) + len(self.states))
+
+#######################################
+# Core functions.
+
+def key(moon, planets, gravity, integrator, step, regularize=False,
+        forces=None):
+    """Returns the cache key of a run.
+
+    Args:
+        moon (Moon or Body): Moon at the start of the run.
+        planets (list of Planet or Body): Planets of the scene.
+        gravity (float): Gravity constant.
+        integrator (int): Integrator of the stepper.
+        step (float): Fixed step size of the stepper, or None.
+        regularize (bool): Whether close approaches are regularized.
+        forces (list of tuple): Force models of the stepper (see
+            forces.compose), or None.
+
+    Returns:
+        tuple: Hashable key. The substeps per frame are left out, so
+            runs that only differ in them share their trajectory.
+    """
+    return (
+        gravity, integrator, step, regularize, model.forces.key(forces),
+        moon.width,
+        moon.locus.x, moon.locus.y, moon.velocity.x, moon.velocity.y,
+        tuple((planet.locus.x, planet.locus.y, planet.velocity.x,
+               planet.velocity.y, planet.mass, planet.width)
+              for planet in planets))
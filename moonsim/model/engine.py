@@ -1,6 +1,7 @@
 import math
 import pyglet
 import resources.indices as ind
+from resources import const
 
 #######################################
 # Core Classes.
@@ -111,6 +112,414 @@ def energy(moon, planets, gravity=0):
     te = ke + pe
     return {ind.TOTAL: te, ind.KINETIC: ke, ind.POTENTIAL: pe}
 
+def acceleration(locus, planets, gravity=0, radius=0):
+    """Determines the gravitational acceleration at a point.
+
+    Args:
+        locus (Vector): Position of the moon.
+        planets (list of Planet): Planets setting up the
+            gravitational field.
+        gravity (float): Gravity constant.
+        radius (float): Radius of the moon. Planets closer than the
+            sum of their radius and the moon radius exert no force.
+
+    Returns:
+        Vector: Acceleration of the moon.
+    """
+    acc = Vector(0, 0)
+    for planet in planets:
+        r = planet.locus - locus
+        r_mag = r.mag()
+        if r_mag > (planet.width / 2 + radius):
+            acc += gravity * planet.mass * r / r_mag ** 3
+    return acc
+
+def collided(locus, planets, radius=0):
+    """Determines whether a moon at locus has hit a planet.
+
+    Args:
+        locus (Vector): Position of the moon.
+        planets (list of Planet): Planets to check.
+        radius (float): Radius of the moon.
+
+    Returns:
+        bool: True if the moon overlaps any of the planets.
+    """
+    for planet in planets:
+        r = planet.locus - locus
+        if r.mag() <= (planet.width / 2 + radius):
+            return True
+    return False
+
+def step(locus, velocity, dt, planets, gravity=0, radius=0, field=None):
+    """Advances a position and velocity over one time step.
+
+    Args:
+        locus (Vector): Position of the moon.
+        velocity (Vector): Velocity of the moon.
+        dt (float): Time step in seconds.
+        planets (list of Planet): Planets setting up the
+            gravitational field.
+        gravity (float): Gravity constant.
+        radius (float): Radius of the moon.
+        field (function): If not None, the acceleration function
+            (see forces.compose) used instead of the gravity of the
+            planets.
+
+    Returns:
+        tuple (two elements): New position and velocity Vectors.
+
+    Uses the fourth-order Runge-Kutta algorithm. The arguments are
+    not changed, so this can be used to try out steps of different
+    sizes from the same state.
+    """
+    if field != None:
+        return _field_step(locus, velocity, dt, field)
+    rkv1 = acceleration(locus, planets, gravity, radius) * dt
+    rkx1 = velocity * dt
+
+    rkv2 = acceleration(locus + rkx1 / 2, planets, gravity, radius) * dt
+    rkx2 = (velocity + rkv1 / 2) * dt
+
+    rkv3 = acceleration(locus + rkx2 / 2, planets, gravity, radius) * dt
+    rkx3 = (velocity + rkv2 / 2) * dt
+
+    rkv4 = acceleration(locus + rkx3, planets, gravity, radius) * dt
+    rkx4 = (velocity + rkv3) * dt
+
+    return (locus + (rkx1 + 2 * rkx2 + 2 * rkx3 + rkx4) / 6,
+            velocity + (rkv1 + 2 * rkv2 + 2 * rkv3 + rkv4) / 6)
+
+def bs_step(locus, velocity, dt, planets, gravity=0, radius=0,
+            tol=const.BS_TOL, order=const.BS_ORDER, field=None):
+    """Takes one adaptive Bulirsch-Stoer step.
+
+    Args:
+        locus (Vector): Position of the moon.
+        velocity (Vector): Velocity of the moon.
+        dt (float): Size of the step to try (s).
+        planets (list of Planet): Planets setting up the
+            gravitational field.
+        gravity (float): Gravity constant.
+        radius (float): Radius of the moon.
+        tol (float): Error tolerance of the step, relative to the size
+            of each coordinate plus one.
+        order (int): Column of the extrapolation table at which
+            convergence is expected, between 1 and
+            len(const.BS_SEQUENCE) - 2.
+        field (function): If not None, the acceleration function
+            (see forces.compose) used instead of the gravity of the
+            planets.
+
+    Returns:
+        tuple (five elements): New position and velocity Vectors, the
+            size of the step taken (dt or smaller, if dt was rejected),
+            and the step size and order suggested for the next step.
+
+    The step is divided into const.BS_SEQUENCE[k] modified midpoint
+    substeps for k = 0, 1, ..., and the results are extrapolated to a
+    zero substep size (Richardson extrapolation in the square of the
+    substep size, whose error expansion only has even powers). The
+    step is accepted as soon as two successive extrapolations agree
+    within the tolerance around the expected column, and is retried
+    with a smaller size if they do not within one more column. The
+    next order and step size minimize the force evaluations per unit
+    time, as in Hairer, Norsett and Wanner, Solving Ordinary
+    Differential Equations I, section II.9. The arguments are not
+    changed.
+    """
+    state = (locus.x, locus.y, velocity.x, velocity.y)
+    scale = [tol * (1 + abs(value)) for value in state]
+    sequence = const.BS_SEQUENCE
+    # Force evaluations needed to reach each column.
+    cost = [sequence[0] + 1]
+    for count in sequence[1:]:
+        cost.append(cost[-1] + count)
+    order = max(1, min(len(sequence) - 2, order))
+    if field == None:
+        field = _gravity_field(planets, gravity, radius)
+    while True:
+        table = list()
+        sizes = list()
+        work = list()
+        for k, count in enumerate(sequence[:order + 2]):
+            row = [_midpoint(state, dt, count, field)]
+            for j in range(k):
+                ratio = (count / sequence[k - j - 1]) ** 2 - 1
+                previous = table[k - 1][j]
+                row.append(tuple(
+                    a + (a - b) / ratio for a, b in zip(row[j], previous)))
+            table.append(row)
+            if k == 0:
+                sizes.append(dt)
+                work.append(cost[0] / dt)
+                continue
+            error = max(
+                abs(a - b) / s for a, b, s in zip(row[k], row[k - 1], scale))
+            factor = const.BS_MAX_SCALE
+            if error > 0:
+                factor = const.BS_SAFETY * error ** (-1 / (2 * k + 1))
+                factor = max(const.BS_MIN_SCALE,
+                             min(const.BS_MAX_SCALE, factor))
+            sizes.append(dt * factor)
+            work.append(cost[k] / sizes[k])
+            if error <= 1 and k >= order - 1:
+                # Prefer the cheapest of the orders around the one
+                # that converged.
+                best = k
+                if k > 1 and work[k - 1] < const.BS_WORK_RATIO * work[k]:
+                    best = k - 1
+                next_size = sizes[best]
+                if best == k and k + 1 < len(sequence) - 1 and \
+                        work[k] < const.BS_WORK_RATIO * work[k - 1]:
+                    best = k + 1
+                    next_size = sizes[k] * cost[k + 1] / cost[k]
+                x, y, velx, vely = row[k]
+                return Vector(x, y), Vector(velx, vely), dt, next_size, best
+        # No convergence: retry with the size expected to converge.
+        dt = sizes[min(order, len(sizes) - 1)]
+        order = max(1, order - 1)
+
+def bulirsch_stoer(locus, velocity, dt, planets, gravity=0, radius=0,
+                   tol=const.BS_TOL):
+    """Advances a position and velocity with Bulirsch-Stoer steps.
+
+    Args:
+        locus (Vector): Position of the moon.
+        velocity (Vector): Velocity of the moon.
+        dt (float): Time to advance (s).
+        planets (list of Planet): Planets setting up the
+            gravitational field.
+        gravity (float): Gravity constant.
+        radius (float): Radius of the moon.
+        tol (float): Error tolerance of each step (see bs_step).
+
+    Returns:
+        tuple (two elements): New position and velocity Vectors.
+
+    The steps are sized by bs_step, so long intervals at tight
+    tolerances, e.g., for reference solutions, take far fewer force
+    evaluations than RK4 steps of the same accuracy. Crashes are not
+    detected (see events.EventDetector).
+    """
+    time = 0
+    size = dt
+    order = const.BS_ORDER
+    while time < dt:
+        last = size >= dt - time
+        locus, velocity, taken, size, order = bs_step(
+            locus, velocity, min(size, dt - time), planets, gravity, radius,
+            tol, order)
+        time = dt if last and taken == dt - time else time + taken
+    return locus, velocity
+
+def _midpoint(state, dt, count, field):
+    """Modified midpoint method with Gragg's smoothing.
+
+    Returns:
+        tuple: (x, y, velx, vely) after count substeps of dt / count.
+    """
+    h = dt / count
+    x0, y0, vx0, vy0 = state
+    ax, ay = field(x0, y0, vx0, vy0)
+    x1, y1 = x0 + h * vx0, y0 + h * vy0
+    vx1, vy1 = vx0 + h * ax, vy0 + h * ay
+    for step in range(1, count):
+        ax, ay = field(x1, y1, vx1, vy1)
+        x0, y0, x1, y1 = x1, y1, x0 + 2 * h * vx1, y0 + 2 * h * vy1
+        vx0, vy0, vx1, vy1 = vx1, vy1, vx0 + 2 * h * ax, vy0 + 2 * h * ay
+    ax, ay = field(x1, y1, vx1, vy1)
+    return ((x0 + x1 + h * vx1) / 2, (y0 + y1 + h * vy1) / 2,
+            (vx0 + vx1 + h * ax) / 2, (vy0 + vy1 + h * ay) / 2)
+
+def _acceleration(x, y, planets, gravity, radius):
+    """Same as acceleration on plain coordinates, for speed."""
+    ax, ay = 0, 0
+    for planet in planets:
+        rx = planet.locus.x - x
+        ry = planet.locus.y - y
+        r = math.sqrt(rx * rx + ry * ry)
+        if r > planet.width / 2 + radius:
+            factor = gravity * planet.mass / (r * r * r)
+            ax += factor * rx
+            ay += factor * ry
+    return ax, ay
+
+def _gravity_field(planets, gravity, radius):
+    """Returns _acceleration as an acceleration function of states."""
+    def field(x, y, velx, vely):
+        return _acceleration(x, y, planets, gravity, radius)
+    return field
+
+def _field_step(locus, velocity, dt, field):
+    """Same as step with an acceleration function, on plain floats."""
+    x, y, vx, vy = locus.x, locus.y, velocity.x, velocity.y
+    ax1, ay1 = field(x, y, vx, vy)
+    vx2, vy2 = vx + ax1 * dt / 2, vy + ay1 * dt / 2
+    ax2, ay2 = field(x + vx * dt / 2, y + vy * dt / 2, vx2, vy2)
+    vx3, vy3 = vx + ax2 * dt / 2, vy + ay2 * dt / 2
+    ax3, ay3 = field(x + vx2 * dt / 2, y + vy2 * dt / 2, vx3, vy3)
+    vx4, vy4 = vx + ax3 * dt, vy + ay3 * dt
+    ax4, ay4 = field(x + vx3 * dt, y + vy3 * dt, vx4, vy4)
+    return (Vector(x + (vx + 2 * vx2 + 2 * vx3 + vx4) * dt / 6,
+                   y + (vy + 2 * vy2 + 2 * vy3 + vy4) * dt / 6),
+            Vector(vx + (ax1 + 2 * ax2 + 2 * ax3 + ax4) * dt / 6,
+                   vy + (ay1 + 2 * ay2 + 2 * ay3 + ay4) * dt / 6))
+
+def close_planet(locus, planets, gravity=0, distance=const.LC_DISTANCE):
+    """Finds the planet a moon is making a close approach to.
+
+    Args:
+        locus (Vector): Position of the moon.
+        planets (list of Planet): Planets setting up the
+            gravitational field.
+        gravity (float): Gravity constant.
+        distance (float): Max distance from the planet center, in
+            planet radii.
+
+    Returns:
+        int: Index of the dominant planet (the one exerting the
+            largest force on the moon) if the moon is within distance
+            of it, otherwise None.
+    """
+    dominant, largest, dominant_r = None, 0, 0
+    for index, planet in enumerate(planets):
+        r = (planet.locus - locus).mag()
+        if r == 0:
+            return index
+        force = gravity * planet.mass / (r * r)
+        if force > largest:
+            dominant, largest, dominant_r = index, force, r
+    if dominant == None or \
+            dominant_r > distance * planets[dominant].width / 2:
+        return None
+    return dominant
+
+def lc_step(locus, velocity, ds, planets, index, gravity=0, radius=0,
+            dt=None):
+    """Takes one RK4 step in Levi-Civita regularized coordinates.
+
+    Args:
+        locus (Vector): Position of the moon.
+        velocity (Vector): Velocity of the moon.
+        ds (float): Step of the fictitious time s, with dt/ds equal to
+            the distance to the planet, so the time step shrinks in
+            proportion to the distance.
+        planets (list of Planet): Planets setting up the
+            gravitational field.
+        index (int): Index of the planet the coordinates are centered
+            on (see close_planet). The other planets perturb the
+            motion.
+        gravity (float): Gravity constant.
+        radius (float): Radius of the moon.
+        dt (float): If not None, ds is only a first guess and is
+            adjusted so that the step lasts exactly dt seconds.
+
+    Returns:
+        tuple (three elements): New position and velocity Vectors and
+            the time step taken (s).
+
+    The position relative to the planet, as a complex number z, is
+    written as the square of u, and time is replaced by s. The
+    equations of motion then become
+
+        u'' = h u / 2 + r conj(u) P / 2,   h' = 2 Re(conj(u u') P),
+        t' = r = |u| ** 2,
+
+    where h is the Kepler energy per unit mass, P the acceleration
+    by the other planets and primes are derivatives in s. Without
+    other planets, u is a harmonic oscillator: the singularity of
+    the force at the planet is gone and RK4 steps of constant ds
+    stay accurate through close approaches, where steps of constant
+    dt lose accuracy as fast as the force grows.
+    """
+    planet = planets[index]
+    mu = gravity * planet.mass
+    others = planets[:index] + planets[index + 1:]
+    x = locus.x - planet.locus.x
+    y = locus.y - planet.locus.y
+    r = math.sqrt(x * x + y * y)
+    if x >= 0:
+        u1 = math.sqrt((r + x) / 2)
+        u2 = y / (2 * u1) if u1 > 0 else 0
+    else:
+        u2 = math.copysign(math.sqrt((r - x) / 2), y)
+        u1 = y / (2 * u2)
+    state = (
+        u1, u2, (u1 * velocity.x + u2 * velocity.y) / 2,
+        (u1 * velocity.y - u2 * velocity.x) / 2,
+        (velocity.x ** 2 + velocity.y ** 2) / 2 - mu / r, 0)
+
+    def derivatives(state):
+        u1, u2, w1, w2, h, t = state
+        r = u1 * u1 + u2 * u2
+        px, py = _acceleration(
+            planet.locus.x + u1 * u1 - u2 * u2, planet.locus.y + 2 * u1 * u2,
+            others, gravity, radius)
+        return (
+            w1, w2,
+            (h * u1 + r * (u1 * px + u2 * py)) / 2,
+            (h * u2 + r * (u1 * py - u2 * px)) / 2,
+            2 * ((u1 * w1 - u2 * w2) * px + (u1 * w2 + u2 * w1) * py),
+            r)
+
+    end = _rk4(derivatives, state, ds)
+    if dt != None:
+        # Newton's method on the step length, with dt/ds = r.
+        for iteration in range(const.LC_MAX_ITER):
+            error = end[5] - dt
+            if abs(error) <= const.LC_TIME_TOL * dt:
+                break
+            ds -= error / (end[0] ** 2 + end[1] ** 2)
+            end = _rk4(derivatives, state, ds)
+    u1, u2, w1, w2, h, t = end
+    r = u1 * u1 + u2 * u2
+    return (
+        Vector(planet.locus.x + u1 * u1 - u2 * u2,
+               planet.locus.y + 2 * u1 * u2),
+        Vector(2 * (u1 * w1 - u2 * w2) / r, 2 * (u1 * w2 + u2 * w1) / r),
+        dt if dt != None else t)
+
+def _rk4(derivatives, state, h):
+    """Takes an RK4 step of size h for a tuple of variables."""
+    k1 = derivatives(state)
+    k2 = derivatives(tuple(y + h / 2 * k for y, k in zip(state, k1)))
+    k3 = derivatives(tuple(y + h / 2 * k for y, k in zip(state, k2)))
+    k4 = derivatives(tuple(y + h * k for y, k in zip(state, k3)))
+    return tuple(
+        y + h / 6 * (a + 2 * b + 2 * c + d)
+        for y, a, b, c, d in zip(state, k1, k2, k3, k4))
+
+def interpolate(locus0, velocity0, locus1, velocity1, dt, t):
+    """Interpolates the state of the moon within a time step.
+
+    Args:
+        locus0 (Vector): Position at the start of the step.
+        velocity0 (Vector): Velocity at the start of the step.
+        locus1 (Vector): Position at the end of the step.
+        velocity1 (Vector): Velocity at the end of the step.
+        dt (float): Length of the step in seconds.
+        t (float): Time since the start of the step (0 <= t <= dt).
+
+    Returns:
+        tuple (two elements): Interpolated position and velocity
+            Vectors.
+
+    Uses the cubic Hermite polynomial matching the positions and
+    velocities at both ends of the step (dense output), so the
+    interpolated path is continuous and smooth across steps. The
+    position error is fourth order in dt, which keeps it far below a
+    pixel for steps much longer than a frame.
+    """
+    s = t / dt
+    s2 = s * s
+    s3 = s2 * s
+    pos = ((2 * s3 - 3 * s2 + 1) * locus0 + (s3 - 2 * s2 + s) * dt * velocity0
+           + (3 * s2 - 2 * s3) * locus1 + (s3 - s2) * dt * velocity1)
+    vel = ((6 * s2 - 6 * s) * (locus0 - locus1) / dt
+           + (3 * s2 - 4 * s + 1) * velocity0 + (3 * s2 - 2 * s) * velocity1)
+    return pos, vel
+
 def update(dt, moon, planets, gravity=0):
     """Updates the current postion and velocity of the moon.
         
@@ -125,43 +534,19 @@ def update(dt, moon, planets, gravity=0):
 
     The moon is update over the timestep dt using the inverse square
     law of gravitation given the field set up by the planets. The
-    integration uses the fourth-order Runge-Kutta algorithm.
+    integration uses the fourth-order Runge-Kutta algorithm (see
+    step). If the moon overlaps a planet at the start of the step,
+    it crashes instead.
     """
     if moon.crashed:
         return 0
-    rkv1 = Vector(0, 0)
-    for planet in planets:
-        r = planet.locus - moon.locus
-        if r.mag() > (planet.width / 2 + moon.width / 2):
-            rkv1 += gravity * planet.mass * r.norm() * dt / r.mag() ** 2
-        else:
-            moon.crash()
-            return 0
-    rkx1 = moon.velocity * dt
-
-    rkv2 = Vector(0, 0)
-    for planet in planets:
-        r = planet.locus - moon.locus + rkx1 / 2
-        if r.mag() > (planet.width / 2 + moon.width / 2):
-            rkv2 += gravity * planet.mass * r.norm() * dt / r.mag() ** 2
-    rkx2 = (moon.velocity + rkv1 / 2) * dt
-
-    rkv3 = Vector(0 ,0)
-    for planet in planets:
-        r = planet.locus - moon.locus + rkx2 / 2
-        if r.mag() > (planet.width / 2 + moon.width / 2):
-            rkv3 += gravity * planet.mass * r.norm() * dt / r.mag() ** 2
-    rkx3 = (moon.velocity + rkv2 / 2) * dt
-
-    rkv4 = Vector(0 ,0)
-    for planet in planets:
-        r = planet.locus - moon.locus + rkx3
-        if r.mag() > (planet.width / 2 + moon.width / 2):
-            rkv4 += gravity * planet.mass * r.norm() * dt / r.mag() ** 2
-    rkx4 = (moon.velocity + rkv3) * dt
-
-    moon.velocity += (rkv1 + 2 * rkv2 + 2 * rkv3 + rkv4) / 6
-    moon.locus += (rkx1 + 2 * rkx2 + 2 * rkx3 + rkx4) / 6
+    if collided(moon.locus, planets, moon.width / 2):
+        moon.crash()
+        return 0
+    locus, velocity = step(
+        moon.locus, moon.velocity, dt, planets, gravity, moon.width / 2)
+    moon.velocity = velocity
+    moon.locus = locus
 
 def inrect(x, y, rect):
     """Determines whether a point lies in a rectangle.
@@ -0,0 +1,164 @@
+import model.engine
+import resources.indices as ind
+from resources import const
+
+class Event():
+    """Timestamped event in the motion of the moon."""
+
+    def __init__(self, time, kind, planet, locus, velocity):
+        """Initialization.
+
+        Args:
+            time (float): Simulation time of the event (s).
+            kind (int): ind.CRASH, ind.PERIAPSIS or ind.APOAPSIS.
+            planet (int): Index of the planet the event refers to.
+            locus (Vector): Moon position at the event.
+            velocity (Vector): Moon velocity at the event.
+        """
+        self.time = time
+        self.kind = kind
+        self.planet = planet
+        self.locus = locus
+        self.velocity = velocity
+
+class EventDetector():
+    """Finds crashes and apsis passages within integration steps.
+
+    Two event functions are followed for each planet: the distance
+    between the planet and moon surfaces, which becomes negative at a
+    crash, and the radial velocity of the moon, which changes sign
+    from negative to positive at periapsis and from positive to
+    negative at apoapsis. A sign change over a step brackets an event,
+    which is then located with the Illinois (regula falsi) method on
+    the dense output of the step (see engine.interpolate), so locating
+    an event costs no extra force evaluations.
+    """
+
+    def __init__(self, planets, gravity=0, radius=0,
+                 tol=const.EVENT_TIME_TOL, field=None):
+        """Initialization.
+
+        Args:
+            planets (list of Planet): Planets setting up the
+                gravitational field.
+            gravity (float): Gravity constant.
+            radius (float): Radius of the moon.
+            tol (float): Tolerance on the event times (s).
+            field (function): If not None, the acceleration function
+                of the RK4 steps (see engine.step).
+        """
+        self.planets = planets
+        self.gravity = gravity
+        self.radius = radius
+        self.tol = tol
+        self.field = field
+
+#######################################
+# Methods.
+
+    def values(self, locus, velocity):
+        """Returns the event function values for a moon state.
+
+        Returns:
+            list of tuple: (surface distance, radial velocity) for each
+                planet. The radial velocity is not normalized by the
+                distance, which does not change its sign.
+        """
+        values = list()
+        for planet in self.planets:
+            rx = locus.x - planet.locus.x
+            ry = locus.y - planet.locus.y
+            dist = (rx * rx + ry * ry) ** 0.5
+            surface = dist - planet.width / 2 - self.radius
+            values.append((surface, rx * velocity.x + ry * velocity.y))
+        return values
+
+    def step(self, locus, velocity, dt, start_values=None, end=None):
+        """Takes one RK4 step and locates the events within it.
+
+        Args:
+            locus (Vector): Position at the start of the step.
+            velocity (Vector): Velocity at the start of the step.
+            dt (float): Time step (s).
+            start_values (list of tuple): Event function values at the
+                start of the step, if known (see values).
+            end (tuple): Position and velocity at the end of the step,
+                if already computed by another integrator, in which
+                case no RK4 step is taken.
+
+        Returns:
+            tuple (four elements): The position and velocity at the
+                end of the step (or at the crash), the event function
+                values there, and a list of (time offset, kind,
+                planet index, position, velocity) tuples for the
+                events in the step in order of time. If a crash is
+                found, it is the last event and the step ends there.
+        """
+        if start_values == None:
+            start_values = self.values(locus, velocity)
+        if end == None:
+            end = model.engine.step(
+                locus, velocity, dt, self.planets, self.gravity, self.radius,
+                self.field)
+        end_locus, end_velocity = end
+        end_values = self.values(end_locus, end_velocity)
+        found = list()
+        for index, (start, end) in enumerate(zip(start_values, end_values)):
+            if start[0] > 0 and end[0] <= 0:
+                found.append((ind.CRASH, index, 0))
+            if start[1] < 0 and end[1] >= 0:
+                found.append((ind.PERIAPSIS, index, 1))
+            elif start[1] > 0 and end[1] <= 0:
+                found.append((ind.APOAPSIS, index, 1))
+        if not found:
+            return end_locus, end_velocity, end_values, list()
+        events = list()
+        for kind, index, component in found:
+            offset, event_locus, event_velocity = self.__locate(
+                locus, velocity, end_locus, end_velocity, dt, index, component,
+                start_values[index][component], end_values[index][component])
+            events.append((offset, kind, index, event_locus, event_velocity))
+        events.sort(key=lambda event: event[0])
+        for position, event in enumerate(events):
+            if event[1] == ind.CRASH:
+                del events[position + 1:]
+                crash_values = self.values(event[3], event[4])
+                return event[3], event[4], crash_values, events
+        return end_locus, end_velocity, end_values, events
+
+    def __locate(self, locus, velocity, end_locus, end_velocity, dt,
+                 index, component, g0, g1):
+        """Locates the root of an event function within a step.
+
+        Returns:
+            tuple (three elements): Time offset of the event from the
+                start of the step, and the position and velocity there.
+        """
+        t0, t1 = 0, dt
+        event_locus, event_velocity = None, None
+        side = 0
+        for iteration in range(const.EVENT_MAX_ITER):
+            t = (t0 * g1 - t1 * g0) / (g1 - g0)
+            if not t0 < t < t1:
+                t = (t0 + t1) / 2
+            event_locus, event_velocity = model.engine.interpolate(
+                locus, velocity, end_locus, end_velocity, dt, t)
+            g = self.values(event_locus, event_velocity)[index][component]
+            if (g > 0) == (g0 > 0):
+                t0, g0 = t, g
+                if side == -1:
+                    g1 /= 2
+                side = -1
+            else:
+                t1, g1 = t, g
+                if side == 1:
+                    g0 /= 2
+                side = 1
+            if t1 - t0 < self.tol or g == 0:
+                break
+        # Report the end of the bracket past the event (for a crash,
+        # the moon is then touching the planet).
+        if t1 != t:
+            event_locus, event_velocity = model.engine.interpolate(
+                locus, velocity, end_locus, end_velocity, dt, t1)
+        return t1, event_locus, event_velocity
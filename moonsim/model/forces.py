@@ -0,0 +1,234 @@
+import math
+from resources import const
+
+# Force models by scenario name (see register).
+MODELS = dict()
+
+def register(name):
+    """Class decorator adding a force model to MODELS.
+
+    Args:
+        name (str): Name of the model in scenario files.
+
+    Returns:
+        function: The decorator, which returns the class unchanged.
+    """
+    def decorator(cls):
+        MODELS[name] = cls
+        return cls
+    return decorator
+
+class ForceModel():
+    """Base class of the force models.
+
+    A model contributes lines of code to the acceleration function
+    written by compose. The lines add to the acceleration (ax, ay) of
+    the state (x, y, vx, vy), and may use the speed if uses_speed is
+    set. The lines for a planet may also use its offset from the moon
+    ({dx}, {dy}), squared distance ({r2}) and distance ({r}), and
+    whether the moon is clear of it ({live}), which are computed once
+    for all the models.
+    """
+
+    uses_speed = False
+
+    def planet_terms(self, planet, gravity):
+        """Returns the code lines of the model for a planet.
+
+        Args:
+            planet (Planet or Body): Planet exerting the force.
+            gravity (float): Gravity constant.
+
+        Returns:
+            tuple (two elements): Lines of code and the values of the
+                constants named in them.
+        """
+        return (list(), dict())
+
+    def terms(self):
+        """Returns the code lines of the model that do not depend on
+        the planets, and the values of their constants."""
+        return (list(), dict())
+
+@register("gravity")
+class PointMass(ForceModel):
+    """Inverse-square attraction of each planet, as engine.acceleration.
+
+    This model is part of every composed field.
+    """
+
+    def planet_terms(self, planet, gravity):
+        return ([
+            "f = {live} * {gm} / ({r2} * {r})",
+            "ax += f * {dx}",
+            "ay += f * {dy}"],
+            {"gm": gravity * planet.mass})
+
+@register("j2")
+class J2(ForceModel):
+    """Oblateness (J2) term of the gravity of each planet.
+
+    The moons move in the equatorial plane of the planets, where the
+    J2 term adds 3/2 * j2 * (R / r)^2 times the point-mass attraction,
+    R being the planet radius.
+    """
+
+    def __init__(self, j2):
+        """Initialization.
+
+        Args:
+            j2 (float): Dimensionless J2 coefficient of the planets.
+        """
+        self.j2 = j2
+
+    def planet_terms(self, planet, gravity):
+        radius = planet.width / 2
+        return ([
+            "f = {live} * {k} / ({r2} * {r2} * {r})",
+            "ax += f * {dx}",
+            "ay += f * {dy}"],
+            {"k": 1.5 * self.j2 * gravity * planet.mass * radius ** 2})
+
+@register("drag")
+class Drag(ForceModel):
+    """Atmospheric drag close to each planet.
+
+    The atmosphere reaches ceiling planet radii from the center of
+    each planet, and its density falls off exponentially with the
+    height above the surface. The deceleration is density * rho * v^2
+    against the velocity, rho being the relative density of the
+    atmosphere (1 at the surface). The planets are fixed, so the
+    velocity of the moon is its velocity in the atmosphere.
+    """
+
+    uses_speed = True
+
+    def __init__(self, density, height=const.FORCE_DRAG_HEIGHT,
+                 ceiling=const.FORCE_DRAG_CEILING):
+        """Initialization.
+
+        Args:
+            density (float): Drag coefficient at the surface (1/px),
+                i.e., the density of the atmosphere times the drag
+                area of the moon over twice its mass.
+            height (float): Scale height of the atmosphere (px).
+            ceiling (float): Top of the atmosphere (planet radii).
+        """
+        self.density = density
+        self.height = height
+        self.ceiling = ceiling
+
+    def planet_terms(self, planet, gravity):
+        radius = planet.width / 2
+        return ([
+            "f = {live} * ({r} < {top}) * {density} * "
+            "exp(({radius} - {r}) / {height}) * speed",
+            "ax -= f * vx",
+            "ay -= f * vy"],
+            {"top": self.ceiling * radius, "density": self.density,
+             "radius": radius, "height": self.height})
+
+@register("thrust")
+class Thrust(ForceModel):
+    """Constant thrust acceleration of the moon."""
+
+    def __init__(self, acceleration):
+        """Initialization.
+
+        Args:
+            acceleration (tuple of float): (x, y) acceleration
+                (px/s^2).
+        """
+        self.acceleration = tuple(acceleration)
+
+    def terms(self):
+        return (["ax += {x}", "ay += {y}"],
+                {"x": self.acceleration[0], "y": self.acceleration[1]})
+
+#######################################
+# Core functions.
+
+def compose(forces, planets, gravity=const.GRAVITY, radius=0,
+            vectorized=False):
+    """Composes force models into a single acceleration function.
+
+    Args:
+        forces (list of tuple): (name, settings) of the models, with
+            the settings as a dict of keyword arguments of the model
+            class. Point-mass gravity is added if it is not named.
+        planets (list of Planet or Body): Planets setting up the
+            field. They are assumed fixed.
+        gravity (float): Gravity constant.
+        radius (float): Radius of the moon. As in
+            engine.acceleration, planets that the moon overlaps exert
+            no force.
+        vectorized (bool): Whether the function works on numpy
+            arrays of states instead of floats.
+
+    Returns:
+        function: field(x, y, velx, vely), which returns the (ax, ay)
+            acceleration of a state.
+
+    The terms of all the models are written into the source of one
+    function, with the planets, settings and gravity constant as
+    literals and the distance of each planet computed once for all
+    the models, so adding models does not add function calls to the
+    stages of the integrators. Overlapped planets are masked by
+    multiplying their terms by 0 instead of branching, which works
+    the same on floats and arrays; their distance is moved out of
+    the planet first, so the masked terms stay finite.
+    """
+    models = [MODELS[name](**settings) for name, settings in forces]
+    if not any(isinstance(model, PointMass) for model in models):
+        models.insert(0, PointMass())
+    lines = ["def field(x, y, vx, vy):", "ax = 0.0 * x", "ay = 0.0 * y"]
+    if any(model.uses_speed for model in models):
+        lines.append("speed = sqrt(vx * vx + vy * vy)")
+    for index, planet in enumerate(planets):
+        reach2 = (planet.width / 2 + radius) ** 2
+        names = {name: name + str(index)
+                 for name in ("dx", "dy", "r2", "r", "live")}
+        lines.extend(line.format(
+            reach2=_literal(reach2), x=_literal(planet.locus.x),
+            y=_literal(planet.locus.y), clear=_literal(4 * reach2 + 1),
+            **names)
+            for line in [
+                "{dx} = {x} - x",
+                "{dy} = {y} - y",
+                "{r2} = {dx} * {dx} + {dy} * {dy}",
+                "{live} = {r2} > {reach2}",
+                "{r2} = {r2} + ({r2} <= {reach2}) * {clear}",
+                "{r} = sqrt({r2})"])
+        for model in models:
+            code, values = model.planet_terms(planet, gravity)
+            values = {key: _literal(value) for key, value in values.items()}
+            lines.extend(line.format(**names, **values) for line in code)
+    for model in models:
+        code, values = model.terms()
+        values = {key: _literal(value) for key, value in values.items()}
+        lines.extend(line.format(**values) for line in code)
+    lines.append("return ax, ay")
+    source = "\n    ".join(lines) + "\n"
+    if vectorized:
+        # Imported here so the models can be used without numpy.
+        import numpy as np
+
+        namespace = {"sqrt": np.sqrt, "exp": np.exp}
+    else:
+        namespace = {"sqrt": math.sqrt, "exp": math.exp}
+    exec(compile(source, "<forces>", "exec"), namespace)
+    return namespace["field"]
+
+def key(forces):
+    """Returns a hashable key of force models (see compose)."""
+    if not forces:
+        return None
+    return tuple((name, tuple(sorted(settings.items())))
+                 for name, settings in forces)
+
+#######################################
+# Generic functions.
+
+def _literal(value):
+    """Returns the source of a float constant (exact)."""
+    return repr(float(value))
@@ -0,0 +1,295 @@
+import array
+import threading
+from resources import const
+
+class History():
+    """Memory-bounded record of a run at several resolutions.
+
+    Tier 0 keeps the most recent samples at full rate. Each following
+    tier keeps older data in buckets of const.HISTORY_FACTOR rows of
+    the tier below, with the time span and the min and max of every
+    channel over the bucket, so peaks survive the downsampling. All
+    tiers are ring buffers of the same number of rows, allocated up
+    front from the byte budget, except the last one: when it fills
+    up, pairs of its rows are merged, so it always covers the whole
+    run, with the oldest rows merged the most often. The memory used
+    is therefore fixed however long the run lasts.
+
+    Samples are added by the simulation thread and may be queried
+    from other threads (e.g., the state server).
+    """
+
+    def __init__(self, channels, budget=const.HISTORY_BYTES,
+                 tiers=const.HISTORY_TIERS, factor=const.HISTORY_FACTOR):
+        """Initialization.
+
+        Args:
+            channels (tuple of str): Names of the recorded values.
+            budget (int): Max number of bytes used by the tiers.
+            tiers (int): Number of tiers (at least 2).
+            factor (int): Number of rows of a tier merged into each
+                row of the next tier.
+        """
+        self.channels = tuple(channels)
+        self.factor = factor
+        count = len(self.channels)
+        # Tier 0 rows are (time, values), others (start, end, lows, highs).
+        widths = [1 + count] + [2 + 2 * count] * (tiers - 1)
+        capacity = budget // (array.array("d").itemsize * sum(widths))
+        if capacity < 2 * factor:
+            raise ValueError("history budget is too small")
+        self.tiers = [_Ring(width, capacity) for width in widths]
+        self.__lock = threading.Lock()
+        self.clear()
+
+#######################################
+# Methods.
+
+    def clear(self):
+        """Removes all the samples."""
+        with self.__lock:
+            for tier in self.tiers:
+                tier.clear()
+            self.__pending = [None] * len(self.tiers)
+            self.__merged = [0] * len(self.tiers)
+            # Buckets per row of the last tier, and in its newest row.
+            self.__top_factor = 1
+            self.__top_fill = 0
+
+    def add(self, time, values):
+        """Records a sample.
+
+        Args:
+            time (float): Time of the sample. Samples must be added in
+                time order.
+            values (tuple of float): Values of the channels.
+
+        Returns:
+            Nothing.
+        """
+        if len(values) != len(self.channels):
+            raise ValueError("expected one value per channel")
+        with self.__lock:
+            self.tiers[0].push((time,) + tuple(values))
+            self.__feed(1, time, time, values, values)
+
+    def nbytes(self):
+        """Returns the number of bytes allocated for the samples."""
+        return sum(tier.nbytes() for tier in self.tiers)
+
+    def query(self, start, end, points=None):
+        """Returns the recorded rows over a time range.
+
+        Args:
+            start (float): Start of the range.
+            end (float): End of the range.
+            points (int): If not None, the max number of rows. Finer
+                tiers are left out until the rows fit, and if even
+                the last tier has too many rows, consecutive rows are
+                merged (see decimate).
+
+        Returns:
+            tuple: Index of the finest tier used and the list of rows
+                in time order. Each row is (start, end, lows, highs)
+                with the time span of the row and tuples of the min and
+                max of the channels over it (equal in tier 0 rows).
+                Each part of the range comes from the finest tier used
+                that still holds it, so recent data is at full rate
+                and older data progressively coarser. The newest rows
+                may be partial buckets.
+        """
+        with self.__lock:
+            for finest in range(len(self.tiers)):
+                rows = self.__compose(finest, start, end)
+                if points == None or len(rows) <= points:
+                    break
+            else:
+                rows = decimate(rows, points)
+            return finest, rows
+
+    def span(self):
+        """Returns the (start, end) times of the run, or None if empty."""
+        with self.__lock:
+            oldest = self.__oldest()
+            if oldest == None:
+                return None
+            return oldest, self.tiers[0].row(self.tiers[0].count - 1)[0]
+
+    def __oldest(self):
+        """Returns the time of the oldest sample kept, or None."""
+        for index in range(len(self.tiers) - 1, -1, -1):
+            if self.tiers[index].count > 0:
+                return self.tiers[index].row(0)[0]
+            if self.__pending[index] != None:
+                return self.__pending[index][0]
+        return None
+
+    def __feed(self, index, start, end, lows, highs):
+        """Merges a closed row into the pending bucket of a tier."""
+        if index >= len(self.tiers):
+            return
+        pending = self.__pending[index]
+        if pending == None:
+            pending = [start, end, list(lows), list(highs)]
+            self.__pending[index] = pending
+        else:
+            pending[1] = end
+            pending[2] = [min(a, b) for a, b in zip(pending[2], lows)]
+            pending[3] = [max(a, b) for a, b in zip(pending[3], highs)]
+        self.__merged[index] += 1
+        if self.__merged[index] < self.factor:
+            return
+        self.__pending[index] = None
+        self.__merged[index] = 0
+        row = [pending[0], pending[1]] + pending[2] + pending[3]
+        if index < len(self.tiers) - 1:
+            self.tiers[index].push(row)
+            self.__feed(index + 1, *pending)
+        else:
+            self.__push_top(row)
+
+    def __push_top(self, row):
+        """Adds a bucket to the last tier.
+
+        Buckets are merged into the newest row of the tier until it
+        holds __top_factor of them, and when the tier is full, pairs of
+        rows are merged and __top_factor doubles, so the rows of the
+        tier stay about the same width.
+        """
+        tier = self.tiers[-1]
+        if tier.count > 0 and self.__top_fill < self.__top_factor:
+            tier.set_last(merge(tier.row(tier.count - 1), row))
+            self.__top_fill += 1
+            return
+        if tier.count == tier.capacity:
+            rows = [tier.row(index) for index in range(tier.count)]
+            tier.clear()
+            for index in range(0, len(rows) - 1, 2):
+                tier.push(merge(rows[index], rows[index + 1]))
+            if len(rows) % 2:
+                tier.push(rows[-1])
+            self.__top_factor *= 2
+        tier.push(row)
+        self.__top_fill = 1
+
+    def __rows(self, index, start, end):
+        """Yields the rows of a tier overlapping a time range."""
+        tier = self.tiers[index]
+        count = len(self.channels)
+        position = tier.find(start, 0 if index == 0 else 1)
+        for position in range(position, tier.count):
+            row = tier.row(position)
+            if row[0] > end:
+                return
+            if index == 0:
+                values = tuple(row[1:])
+                yield (row[0], row[0], values, values)
+            else:
+                yield (row[0], row[1], tuple(row[2:2 + count]),
+                       tuple(row[2 + count:]))
+
+    def __compose(self, finest, start, end):
+        """Joins the rows of the tiers from the last one to finest."""
+        rows = list()
+        for index in range(len(self.tiers) - 1, finest - 1, -1):
+            # Rows held by the finer tier are taken from it instead.
+            finer = float("inf")
+            if index > finest and self.tiers[index - 1].count > 0:
+                finer = self.tiers[index - 1].row(0)[0]
+            last = rows[-1][1] if rows else float("-inf")
+            for row in self.__rows(index, start, end):
+                if row[0] >= finer:
+                    break
+                if row[0] > last:
+                    rows.append(row)
+        # The newest samples are still in the pending buckets.
+        for index in range(finest, 0, -1):
+            pending = self.__pending[index]
+            last = rows[-1][1] if rows else float("-inf")
+            if pending != None and pending[0] > last and \
+                    pending[0] <= end and pending[1] >= start:
+                rows.append((pending[0], pending[1], tuple(pending[2]),
+                             tuple(pending[3])))
+        return rows
+
+#######################################
+# Core functions.
+
+def merge(first, second):
+    """Merges two consecutive (start, end, lows, highs) rows."""
+    count = (len(first) - 2) // 2
+    return (
+        [first[0], second[1]] +
+        [min(a, b) for a, b in zip(first[2:2 + count], second[2:2 + count])] +
+        [max(a, b) for a, b in zip(first[2 + count:], second[2 + count:])])
+
+def decimate(rows, points):
+    """Merges consecutive (start, end, lows, highs) rows into at most
+    points rows, keeping the min and max of the channels."""
+    if points < 1:
+        return list()
+    size = -(-len(rows) // points)
+    merged = list()
+    for first in range(0, len(rows), size):
+        group = rows[first:first + size]
+        merged.append((
+            group[0][0], group[-1][1],
+            tuple(min(lows) for lows in zip(*(row[2] for row in group))),
+            tuple(max(highs) for highs in zip(*(row[3] for row in group)))))
+    return merged
+
+class _Ring():
+    """Fixed-size ring buffer of rows of doubles."""
+
+    def __init__(self, width, capacity):
+        self.width = width
+        self.capacity = capacity
+        self.data = array.array("d", bytes(8 * width * capacity))
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        self.head = 0
+
+    def push(self, row):
+        """Appends a row, overwriting the oldest one when full."""
+        if self.count == self.capacity:
+            slot = self.head
+            self.head = (self.head + 1) % self.capacity
+        else:
+            slot = (self.head + self.count) % self.capacity
+            self.count += 1
+        self.data[slot * self.width:(slot + 1) * self.width] = \
+            array.array("d", row)
+
+    def set_last(self, row):
+        """Replaces the newest row."""
+        slot = (self.head + self.count - 1) % self.capacity
+        self.data[slot * self.width:(slot + 1) * self.width] = \
+            array.array("d", row)
+
+    def row(self, index):
+        """Returns the index-th oldest row."""
+        slot = (self.head + index) % self.capacity
+        return self.data[slot * self.width:(slot + 1) * self.width]
+
+    def find(self, time, column, right=False):
+        """Bisects the rows on a time column.
+
+        Returns:
+            int: Index of the first row whose column is at least time
+                (greater than time if right is True).
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            value = self.data[
+                ((self.head + middle) % self.capacity) * self.width + column]
+            if value < time or right and value == time:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def nbytes(self):
+        return self.data.itemsize * len(self.data)
@@ -0,0 +1,265 @@
+import math
+import resources.indices as ind
+from model.engine import Vector
+
+class KeplerOrbit():
+    """Analytic two-body orbit of a moon about a fixed planet.
+
+    The orbit is set up from the moon position and velocity at an
+    epoch (t = 0) and gives the exact state at any later time by
+    solving Kepler's equation, so the cost does not depend on how far
+    the orbit is propagated. Elliptic (including radial) and
+    hyperbolic orbits are supported; parabolic orbits are not (see
+    the supported member).
+    """
+
+    def __init__(self, locus, velocity, center, mu, crash_radius=0):
+        """Initialization.
+
+        Args:
+            locus (Vector): Moon position at the epoch.
+            velocity (Vector): Moon velocity at the epoch.
+            center (Vector): Position of the planet.
+            mu (float): Gravity constant times the planet mass.
+            crash_radius (float): Distance from the planet center at
+                which the moon crashes.
+        """
+        self.center = Vector(center.x, center.y)
+        self.mu = mu
+        self.crash_radius = crash_radius
+        self.r0 = Vector(locus.x - center.x, locus.y - center.y)
+        self.v0 = Vector(velocity.x, velocity.y)
+        r0_mag = self.r0.mag()
+        speed_sq = self.v0.x ** 2 + self.v0.y ** 2
+        self.r0_mag = r0_mag
+        # Radial velocity times r0, and the angular momentum.
+        self.rdotv = self.r0.x * self.v0.x + self.r0.y * self.v0.y
+        self.ang_mom = self.r0.x * self.v0.y - self.r0.y * self.v0.x
+        # Reciprocal semi-major axis (negative for hyperbolic orbits).
+        self.alpha = 2 / r0_mag - speed_sq / mu
+        ecc_x = ((speed_sq - mu / r0_mag) * self.r0.x -
+                 self.rdotv * self.v0.x) / mu
+        ecc_y = ((speed_sq - mu / r0_mag) * self.r0.y -
+                 self.rdotv * self.v0.y) / mu
+        self.ecc = math.hypot(ecc_x, ecc_y)
+        self.ecc_vector = Vector(ecc_x, ecc_y)
+        self.supported = r0_mag > 0 and abs(self.alpha) * r0_mag > 1e-9
+        if not self.supported:
+            self.crash_time = None
+            return
+        self.a = 1 / self.alpha
+        self.mean_motion = math.sqrt(mu * abs(self.alpha) ** 3)
+        # Anomaly (eccentric or hyperbolic) and mean anomaly at epoch.
+        if self.alpha > 0:
+            # The anomaly of a circular orbit is measured from r0.
+            cos_anom = 1 - r0_mag * self.alpha
+            sin_anom = self.rdotv / math.sqrt(mu * self.a)
+            if self.ecc > 1e-12:
+                self.anom0 = math.atan2(sin_anom, cos_anom)
+            else:
+                self.anom0 = 0
+            self.mean0 = self.anom0 - self.ecc * math.sin(self.anom0)
+        else:
+            sinh_anom = self.rdotv / (self.ecc * math.sqrt(-mu * self.a))
+            self.anom0 = math.asinh(sinh_anom)
+            self.mean0 = self.ecc * math.sinh(self.anom0) - self.anom0
+        self.crash_time = self.__get_crash_time()
+
+#######################################
+# Methods.
+
+    @property
+    def period(self):
+        """Orbital period (None for unbound orbits)."""
+        if not self.supported or self.alpha <= 0:
+            return None
+        return 2 * math.pi / self.mean_motion
+
+    @property
+    def periapsis(self):
+        """Closest distance to the planet center."""
+        return abs(self.a) * abs(1 - self.ecc)
+
+    @property
+    def apoapsis(self):
+        """Furthest distance from the planet center (None if unbound)."""
+        if self.alpha <= 0:
+            return None
+        return self.a * (1 + self.ecc)
+
+    def state(self, t):
+        """Returns the moon position and velocity at a time.
+
+        Args:
+            t (float): Time since the epoch (simulation seconds).
+
+        Returns:
+            tuple (two elements): Position and velocity Vectors.
+
+        Uses the Lagrange f and g coefficients in terms of the change
+        in the eccentric (or hyperbolic) anomaly since the epoch.
+        """
+        mean = self.mean0 + self.mean_motion * t
+        if self.alpha > 0:
+            anom = solve_elliptic(mean, self.ecc)
+            delta = anom - self.anom0
+            r_mag = self.a * (1 - self.ecc * math.cos(anom))
+            one_minus_cos = 1 - math.cos(delta)
+            f = 1 - self.a / self.r0_mag * one_minus_cos
+            g = t - (delta - math.sin(delta)) / self.mean_motion
+            fdot = (-math.sqrt(self.mu * self.a) * math.sin(delta) /
+                    (r_mag * self.r0_mag))
+            gdot = 1 - self.a / r_mag * one_minus_cos
+        else:
+            anom = solve_hyperbolic(mean, self.ecc)
+            delta = anom - self.anom0
+            r_mag = self.a * (1 - self.ecc * math.cosh(anom))
+            one_minus_cosh = 1 - math.cosh(delta)
+            f = 1 - self.a / self.r0_mag * one_minus_cosh
+            g = t - (math.sinh(delta) - delta) / self.mean_motion
+            fdot = (-math.sqrt(-self.mu * self.a) * math.sinh(delta) /
+                    (r_mag * self.r0_mag))
+            gdot = 1 - self.a / r_mag * one_minus_cosh
+        locus = Vector(
+            self.center.x + f * self.r0.x + g * self.v0.x,
+            self.center.y + f * self.r0.y + g * self.v0.y)
+        velocity = Vector(
+            fdot * self.r0.x + gdot * self.v0.x,
+            fdot * self.r0.y + gdot * self.v0.y)
+        return locus, velocity
+
+    def apsis_times(self, t0, t1):
+        """Returns the apsis passages in a time interval.
+
+        Args:
+            t0 (float): Start of the interval (excluded).
+            t1 (float): End of the interval (included).
+
+        Returns:
+            list of tuple: (time, kind) for each passage in order of
+                time, where kind is ind.PERIAPSIS or ind.APOAPSIS.
+
+        Periapsis is at mean anomalies that are multiples of 2 pi and
+        apoapsis (bound orbits only) at odd multiples of pi.
+        """
+        if self.ecc < 1e-12:
+            return list()
+        mean0 = self.mean0 + self.mean_motion * t0
+        mean1 = self.mean0 + self.mean_motion * t1
+        if self.alpha <= 0:
+            if mean0 < 0 <= mean1:
+                return [(-self.mean0 / self.mean_motion, ind.PERIAPSIS)]
+            return list()
+        times = list()
+        half_turn = math.floor(mean0 / math.pi) + 1
+        while half_turn * math.pi <= mean1:
+            kind = ind.PERIAPSIS if half_turn % 2 == 0 else ind.APOAPSIS
+            time = (half_turn * math.pi - self.mean0) / self.mean_motion
+            times.append((time, kind))
+            half_turn += 1
+        return times
+
+    def __get_crash_time(self):
+        """Returns the time the moon reaches the crash radius.
+
+        Returns None if the moon never crashes. The moon is assumed
+        to start outside the crash radius, so the crash is the next
+        inbound crossing of the crash radius.
+        """
+        if self.r0_mag <= self.crash_radius:
+            return 0
+        if self.periapsis > self.crash_radius:
+            return None
+        if self.alpha > 0:
+            # r = a (1 - e cos E), the inbound crossing has E in (pi, 2pi).
+            cos_anom = (1 - self.crash_radius / self.a) / self.ecc
+            anom = 2 * math.pi - math.acos(min(max(cos_anom, -1), 1))
+            mean = anom - self.ecc * math.sin(anom)
+            delta = (mean - self.mean0) % (2 * math.pi)
+        else:
+            # r = a (1 - e cosh F), the inbound crossing has F < 0.
+            cosh_anom = (1 - self.crash_radius / self.a) / self.ecc
+            anom = -math.acosh(max(cosh_anom, 1))
+            if self.anom0 > anom:
+                return None
+            mean = self.ecc * math.sinh(anom) - anom
+            delta = mean - self.mean0
+        return delta / self.mean_motion
+
+#######################################
+# Core functions.
+
+def solve_elliptic(mean, ecc, tol=1e-14):
+    """Solves Kepler's equation E - e sin E = M for E.
+
+    Args:
+        mean (float): Mean anomaly M (any value).
+        ecc (float): Eccentricity (0 <= e <= 1).
+        tol (float): Absolute tolerance on E.
+
+    Returns:
+        float: Eccentric anomaly E with the same number of whole
+            revolutions as M.
+
+    Uses Newton's method safeguarded by bisection, which converges
+    for all eccentricities including the radial case e = 1.
+    """
+    turns = math.floor(mean / (2 * math.pi))
+    mean -= 2 * math.pi * turns
+    low, high = 0, 2 * math.pi
+    anom = mean + ecc * math.sin(mean) if ecc < 0.8 else math.pi
+    for iteration in range(100):
+        error = anom - ecc * math.sin(anom) - mean
+        if error > 0:
+            high = anom
+        else:
+            low = anom
+        slope = 1 - ecc * math.cos(anom)
+        step = error / slope if slope > 0 else math.inf
+        new_anom = anom - step
+        if not low < new_anom < high:
+            new_anom = (low + high) / 2
+        if abs(new_anom - anom) < tol:
+            anom = new_anom
+            break
+        anom = new_anom
+    return anom + 2 * math.pi * turns
+
+def solve_hyperbolic(mean, ecc, tol=1e-14):
+    """Solves Kepler's equation e sinh F - F = M for F.
+
+    Args:
+        mean (float): Mean anomaly M.
+        ecc (float): Eccentricity (e > 1).
+        tol (float): Tolerance on F (relative for large F).
+
+    Returns:
+        float: Hyperbolic anomaly F.
+    """
+    # |F| <= asinh(|M| / (e - 1)) brackets the root.
+    bound = math.asinh(abs(mean) / (ecc - 1)) + 1
+    low, high = -bound, bound
+    anom = math.asinh(mean / ecc)
+    for iteration in range(200):
+        error = ecc * math.sinh(anom) - anom - mean
+        if error > 0:
+            high = anom
+        else:
+            low = anom
+        slope = ecc * math.cosh(anom) - 1
+        new_anom = anom - error / slope
+        if not low < new_anom < high:
+            new_anom = (low + high) / 2
+        if abs(new_anom - anom) < tol * max(1, abs(anom)):
+            anom = new_anom
+            break
+        anom = new_anom
+    return anom
+
+def qualifies(moon, planets):
+    """Determines whether the analytic orbit applies to a scene.
+
+    The scene is an exact two-body problem if there is exactly one
+    (fixed) planet.
+    """
+    return len(planets) == 1
@@ -3,13 +3,15 @@ import pyglet
 import model
 import resources.indices as ind
 from model.engine import Vector, Rect
+from model.trail import Trail
 from resources import const
 
 class Moon(pyglet.sprite.Sprite):
     """Manages the moon object for the simulation."""
 
     def __init__(self, images, locus, velocity, mass=const.MOON_MASS,
-                 batch=None, path_segment=5, path_length=200):
+                 batch=None, path_segment=5, path_length=200,
+                 path_history=const.MOON_PATH_HISTORY, group=None):
         """Initialization.
         Args:
             images (list of images): Sprite graphics for the moon.
@@ -19,16 +21,21 @@ class Moon(pyglet.sprite.Sprite):
             mass (float): Mass of the moon.
             path_segment (int): Min length of path segment.
             path_length (int): Max number of segments in path.
+            path_history (int): Max number of vertices used to keep
+                a simplified history of older path segments.
+            group (pyglet.graphics.Group): Parent group for drawing.
         """
-        super().__init__(img=images[0], batch=batch)
-        self.path = [locus.x, locus.y]
-        self.path_segment = path_segment
-        self.path_length = path_length
+        super().__init__(img=images[0], batch=batch, group=group)
+        self.trail = Trail(
+            locus, segment=path_segment, length=path_length,
+            history=path_history)
         self.images = images
         self.mass = mass
         self.__locus = locus
         self.velocity = velocity
         self.crashed = False
+        self.__arrow_key = None
+        self.__arrow_geometry = None
         self.__adjust_position()
 
 #######################################
@@ -45,6 +52,10 @@ class Moon(pyglet.sprite.Sprite):
         """Emitted when the moon velocity arrow is clicked."""
         pass
 
+    def sig_moved(self, moon):
+        """Emitted when the position, size or velocity changes."""
+        pass
+
 #######################################
 # Methods.
 
@@ -68,7 +79,8 @@ class Moon(pyglet.sprite.Sprite):
             self.locus = locus
         if velocity != None:
             self.velocity = velocity
-        self.path = [self.__locus.x, self.__locus.y]
+        self.trail.reset(self.__locus)
+        self.sig_moved(self)
 
     def crash(self):
         """Indicate that the moon has crashed.
@@ -102,6 +114,7 @@ class Moon(pyglet.sprite.Sprite):
             new_vel_mag = 0
         new_vel_mag /= const.MOON_ARROW_LEN_SCALE
         self.velocity = new_vel_mag * mdir
+        self.sig_moved(self)
 
     def get_velocity_arrow(self):
         """Returns the unrotated, untranslated arrow vertices.
@@ -153,25 +166,58 @@ class Moon(pyglet.sprite.Sprite):
         right.  The point is then set relative to the moon and
         rotated to a corresponding orientation versus the bounding
         rect along the axis. The model.engine.inrect method is the
-        used to determine containment.
+        used to determine containment. The bounding rect and rotation
+        are cached until the velocity or moon size changes.
         """
-        # Bounding rect for velocity arrow.
-        arrow_rect = Rect()
-        arrow_rect.width = (
-            const.MOON_ARROW_LEN_SCALE * self.velocity.mag() +
-            const.MOON_ARROW_HDX)
-        arrow_rect.height = const.MOON_ARROW_WIDTH_SCALE * self.width
-        arrow_rect.x = const.MOON_ARROW_BASE_SHIFT * self.width
-        arrow_rect.y = -arrow_rect.height / 2
+        arrow_rect, cos_ang, sin_ang = self.__get_arrow_geometry()
         # Get click position relative to the moon.
-        pos = Vector(x, y)
-        rel_pos = pos - self.__locus 
+        rel_x = x - self.__locus.x
+        rel_y = y - self.__locus.y
         # Rotate the relative click position to the new arrow position.
-        ang = -self.velocity.angle_rad()
-        rel_rot_x = rel_pos.x * math.cos(ang) - rel_pos.y * math.sin(ang)
-        rel_rot_y = rel_pos.x * math.sin(ang) + rel_pos.y * math.cos(ang)
+        rel_rot_x = rel_x * cos_ang - rel_y * sin_ang
+        rel_rot_y = rel_x * sin_ang + rel_y * cos_ang
         return model.engine.inrect(rel_rot_x, rel_rot_y, arrow_rect)
 
+    def hit_bounds(self, info):
+        """Returns an axis-aligned bounding rect for click routing.
+
+        Args:
+            info (int): ind.MOON for the moon itself or ind.ARROW for
+                the velocity arrow.
+
+        Returns:
+            Rect: Bounding rect in world coordinates.
+        """
+        if info == ind.MOON:
+            return Rect(self.x, self.y, self.width, self.height)
+        arrow_rect, cos_ang, sin_ang = self.__get_arrow_geometry()
+        # Rotate the arrow rect corners back to the velocity direction.
+        xs = list()
+        ys = list()
+        for cx in (arrow_rect.x, arrow_rect.x + arrow_rect.width):
+            for cy in (arrow_rect.y, arrow_rect.y + arrow_rect.height):
+                xs.append(cx * cos_ang + cy * sin_ang)
+                ys.append(cy * cos_ang - cx * sin_ang)
+        return Rect(
+            self.__locus.x + min(xs), self.__locus.y + min(ys),
+            max(xs) - min(xs), max(ys) - min(ys))
+
+    def hit_test(self, x, y, info):
+        """Checks whether a point lies in the moon or its arrow.
+
+        Args:
+            x (float or int): X-coordinate of the point.
+            y (float or int): Y-coordinate of the point.
+            info (int): ind.MOON for the moon itself or ind.ARROW for
+                the velocity arrow.
+
+        Returns:
+            bool: True if the point is contained, False if not.
+        """
+        if info == ind.MOON:
+            return model.engine.inrect(x, y, self)
+        return self.chk_in_arrow(x, y)
+
     def click(self, x, y, info):
         """Route click events on the moon and velocity arrow.
 
@@ -207,6 +253,39 @@ class Moon(pyglet.sprite.Sprite):
         """
         self.x = self.__locus.x - self.width / 2
         self.y = self.__locus.y - self.height / 2
+        self.sig_moved(self)
+
+    def __get_arrow_geometry(self):
+        """Returns the velocity arrow bounding rect and rotation.
+
+        Args:
+            None.
+
+        Returns:
+            tuple (three elements): Bounding rect of the unrotated
+                arrow relative to the moon center, and the cosine and
+                sine of the angle rotating the velocity direction onto
+                the x-axis.
+        """
+        key = (self.velocity.x, self.velocity.y, self.width)
+        if key != self.__arrow_key:
+            # Bounding rect for velocity arrow.
+            arrow_rect = Rect()
+            arrow_rect.width = (
+                const.MOON_ARROW_LEN_SCALE * self.velocity.mag() +
+                const.MOON_ARROW_HDX)
+            arrow_rect.height = const.MOON_ARROW_WIDTH_SCALE * self.width
+            arrow_rect.x = const.MOON_ARROW_BASE_SHIFT * self.width
+            arrow_rect.y = -arrow_rect.height / 2
+            ang = -self.velocity.angle_rad()
+            self.__arrow_geometry = (arrow_rect, math.cos(ang), math.sin(ang))
+            self.__arrow_key = key
+        return self.__arrow_geometry
+
+    @property
+    def path(self):
+        """Getter for the flattened path vertices."""
+        return self.trail.vertices()
 
     @property
     def locus(self):
@@ -219,15 +298,7 @@ class Moon(pyglet.sprite.Sprite):
 
         This method will also update the moon path.
         """
-        if len(self.path) // 2 > 0:
-            delta_x = value - Vector(self.path[-2], self.path[-1])
-            disp = delta_x.mag()
-        else:
-            disp = 0
         self.__locus.x = value.x
         self.__locus.y = value.y
         self.__adjust_position()
-        if disp >= self.path_segment:
-            self.path.extend((self.__locus.x, self.__locus.y))
-            if len(self.path) // 2 > self.path_length:
-                self.path = self.path[2:]
+        self.trail.add(self.__locus.x, self.__locus.y)
@@ -0,0 +1,292 @@
+import numpy as np
+from model.engine import Vector
+from resources import const
+
+class NBodySystem():
+    """Integrates bodies that all attract each other.
+
+    Unlike the fixed field of the default mode, every body (planets
+    included) has a mass, a velocity and feels the attraction of all
+    the others. The state is kept in numpy arrays and advanced with
+    RK4. Accelerations are computed with the pairwise kernel
+    (direct_accelerations) for small systems and with the Barnes-Hut
+    tree (tree_accelerations) from const.NBODY_TREE_MIN bodies. As in
+    engine.acceleration, bodies that overlap exert no force on each
+    other.
+
+    Bodies listed as crashable (i.e., moons) crash when they touch
+    another body. The crashed body is merged into the body it hit,
+    conserving mass and momentum, and is no longer integrated.
+    """
+
+    def __init__(self, bodies, gravity=const.GRAVITY, crashable=(),
+                 com_frame=const.NBODY_COM_FRAME,
+                 theta=const.NBODY_THETA, tree_min=const.NBODY_TREE_MIN):
+        """Initialization.
+
+        Args:
+            bodies (list of Planet, Moon or Body): Bodies with locus,
+                velocity, mass and width members.
+            gravity (float): Gravity constant.
+            crashable (list): Bodies that crash when they touch
+                another body. They must have a crash method.
+            com_frame (bool): If True, the velocities are changed to
+                the centre-of-mass frame, so the centre of mass of the
+                system stays where it is.
+            theta (float): Opening angle of the tree approximation.
+            tree_min (int): Min number of bodies for which the tree
+                approximation is used.
+        """
+        self.bodies = list(bodies)
+        self.gravity = gravity
+        self.theta = theta
+        self.tree_min = tree_min
+        self.pos = np.array(
+            [(body.locus.x, body.locus.y) for body in bodies], dtype=float)
+        self.vel = np.array(
+            [(body.velocity.x, body.velocity.y) for body in bodies],
+            dtype=float)
+        self.mass = np.array([body.mass for body in bodies], dtype=float)
+        self.radius = np.array(
+            [body.width / 2 for body in bodies], dtype=float)
+        self.crashable = np.array(
+            [any(body is other for other in crashable) for body in bodies],
+            dtype=bool)
+        self.active = np.ones(len(bodies), dtype=bool)
+        self.crashed = list()
+        if com_frame:
+            self.vel -= self.center_of_mass()[1]
+
+#######################################
+# Methods.
+
+    def center_of_mass(self):
+        """Returns the centre-of-mass position and velocity arrays."""
+        mass = self.mass[self.active]
+        total = mass.sum()
+        pos = (self.pos[self.active] * mass[:, None]).sum(0) / total
+        vel = (self.vel[self.active] * mass[:, None]).sum(0) / total
+        return pos, vel
+
+    def accelerations(self, pos):
+        """Returns the accelerations of the active bodies.
+
+        Args:
+            pos (numpy.ndarray): (n, 2) positions of the active bodies.
+
+        Returns:
+            numpy.ndarray: (n, 2) accelerations.
+        """
+        mass = self.mass[self.active]
+        radius = self.radius[self.active]
+        if len(pos) >= self.tree_min:
+            return tree_accelerations(
+                pos, mass, radius, self.gravity, self.theta)
+        return direct_accelerations(pos, mass, radius, self.gravity)
+
+    def step(self, dt):
+        """Advances the active bodies by one RK4 step.
+
+        Args:
+            dt (float): Time step in seconds.
+
+        Returns:
+            list of tuple: (crashed body, index of the body it
+                merged into) for each body that crashed in the step.
+        """
+        active = self.active
+        pos = self.pos[active]
+        vel = self.vel[active]
+
+        rkv1 = self.accelerations(pos) * dt
+        rkx1 = vel * dt
+
+        rkv2 = self.accelerations(pos + rkx1 / 2) * dt
+        rkx2 = (vel + rkv1 / 2) * dt
+
+        rkv3 = self.accelerations(pos + rkx2 / 2) * dt
+        rkx3 = (vel + rkv2 / 2) * dt
+
+        rkv4 = self.accelerations(pos + rkx3) * dt
+        rkx4 = (vel + rkv3) * dt
+
+        self.pos[active] = pos + (rkx1 + 2 * rkx2 + 2 * rkx3 + rkx4) / 6
+        self.vel[active] = vel + (rkv1 + 2 * rkv2 + 2 * rkv3 + rkv4) / 6
+        return self.__merge_crashed()
+
+    def apply(self):
+        """Copies the state back to the bodies.
+
+        The masses are copied too, since bodies that were crashed into
+        have gained mass. Bodies that crashed since the last call are
+        crashed.
+        """
+        crashed = [body for body, target in self.crashed]
+        for index, body in enumerate(self.bodies):
+            if not self.active[index] and body not in crashed:
+                continue
+            body.mass = float(self.mass[index])
+            body.velocity = Vector(*self.vel[index])
+            body.locus = Vector(*self.pos[index])
+        for body in crashed:
+            body.crash()
+        self.crashed = list()
+
+    def __merge_crashed(self):
+        """Merges crashable bodies into the bodies they touch."""
+        moons = np.flatnonzero(self.active & self.crashable)
+        crashed = list()
+        for moon in moons:
+            others = np.flatnonzero(self.active)
+            others = others[others != moon]
+            if len(others) == 0:
+                break
+            dist = np.hypot(*(self.pos[others] - self.pos[moon]).T)
+            touching = others[dist <= self.radius[others] + self.radius[moon]]
+            if len(touching) == 0:
+                continue
+            # Merge into the heaviest body touched.
+            target = int(touching[np.argmax(self.mass[touching])])
+            total = self.mass[target] + self.mass[moon]
+            self.vel[target] = (
+                self.mass[target] * self.vel[target] +
+                self.mass[moon] * self.vel[moon]) / total
+            self.mass[target] = total
+            self.active[moon] = False
+            crashed.append((self.bodies[moon], target))
+        self.crashed.extend(crashed)
+        return crashed
+
+#######################################
+# Core functions.
+
+def direct_accelerations(pos, mass, radius, gravity=0):
+    """Computes the accelerations from all pairs of bodies.
+
+    Args:
+        pos (numpy.ndarray): (n, 2) body positions.
+        mass (numpy.ndarray): (n,) body masses.
+        radius (numpy.ndarray): (n,) body radii.
+        gravity (float): Gravity constant.
+
+    Returns:
+        numpy.ndarray: (n, 2) accelerations.
+
+    Uses O(n^2) time and memory, which is fastest for small n.
+    """
+    disp = pos[None, :, :] - pos[:, None, :]
+    dist_sq = np.einsum("ijk,ijk->ij", disp, disp)
+    dist = np.sqrt(dist_sq)
+    apart = dist > radius[:, None] + radius[None, :]
+    scale = np.zeros_like(dist)
+    np.divide(gravity * mass[None, :], dist_sq * dist, out=scale, where=apart)
+    return np.einsum("ij,ijk->ik", scale, disp)
+
+def build_tree(pos, mass, radius, max_depth=const.NBODY_TREE_DEPTH):
+    """Builds the Barnes-Hut quadtree of a set of bodies.
+
+    Args:
+        pos (numpy.ndarray): (n, 2) body positions.
+        mass (numpy.ndarray): (n,) body masses.
+        radius (numpy.ndarray): (n,) body radii.
+        max_depth (int): Max depth of the tree. Bodies still sharing
+            a cell at this depth are grouped in one leaf.
+
+    Returns:
+        dict of numpy.ndarray: Node arrays, 'com' (m, 2) centres of
+            mass, 'mass' (m,), 'size' (m,) cell widths, 'children'
+            (m, 4) child indices (-1 if none), 'body' (m,) body index
+            of single-body leaves (-1 otherwise), and 'reach' (m,)
+            radius of single-body leaves (0 otherwise). Node 0 is the
+            root.
+    """
+    low = pos.min(0)
+    size = max((pos.max(0) - low).max(), 1) * (1 + 1e-9)
+    com, node_mass, sizes, children, body, reach = [], [], [], [], [], []
+    stack = [(-1, 0, np.arange(len(pos)), low[0], low[1], size, 0)]
+    while stack:
+        parent, quadrant, members, x0, y0, width, depth = stack.pop()
+        node = len(com)
+        if parent >= 0:
+            children[parent][quadrant] = node
+        member_mass = mass[members]
+        total = member_mass.sum()
+        if total > 0:
+            com.append((pos[members] * member_mass[:, None]).sum(0) / total)
+        else:
+            com.append(pos[members].mean(0))
+        node_mass.append(total)
+        sizes.append(width)
+        children.append([-1, -1, -1, -1])
+        if len(members) == 1:
+            body.append(members[0])
+            reach.append(radius[members[0]])
+            continue
+        body.append(-1)
+        reach.append(0)
+        if depth >= max_depth:
+            continue
+        half = width / 2
+        quadrants = ((pos[members, 0] >= x0 + half) +
+                     2 * (pos[members, 1] >= y0 + half))
+        for index in range(4):
+            sub = members[quadrants == index]
+            if len(sub) > 0:
+                stack.append((
+                    node, index, sub,
+                    x0 + half * (index % 2), y0 + half * (index // 2),
+                    half, depth + 1))
+    return {
+        "com": np.array(com), "mass": np.array(node_mass),
+        "size": np.array(sizes), "children": np.array(children),
+        "body": np.array(body), "reach": np.array(reach)}
+
+def tree_accelerations(pos, mass, radius, gravity=0,
+                       theta=const.NBODY_THETA):
+    """Computes the accelerations with the Barnes-Hut approximation.
+
+    Args:
+        pos (numpy.ndarray): (n, 2) body positions.
+        mass (numpy.ndarray): (n,) body masses.
+        radius (numpy.ndarray): (n,) body radii.
+        gravity (float): Gravity constant.
+        theta (float): Opening angle. Cells seen under a smaller
+            angle act as a single mass at their centre of mass.
+
+    Returns:
+        numpy.ndarray: (n, 2) accelerations.
+
+    Uses O(n log n) time. All bodies walk the tree together: each
+    pass accepts or opens a frontier of (body, node) pairs with array
+    operations, so there is one pass per tree level rather than one
+    per body.
+    """
+    tree = build_tree(pos, mass, radius)
+    count = len(pos)
+    acc_x = np.zeros(count)
+    acc_y = np.zeros(count)
+    leaf = (tree["children"] < 0).all(1)
+    bodies = np.arange(count)
+    nodes = np.zeros(count, dtype=int)
+    while len(bodies) > 0:
+        disp = tree["com"][nodes] - pos[bodies]
+        dist_sq = (disp * disp).sum(1)
+        opened = ~leaf[nodes] & (tree["size"][nodes] ** 2 >=
+                                 theta ** 2 * dist_sq)
+        accept = ~opened
+        dist = np.sqrt(dist_sq[accept])
+        acc_bodies = bodies[accept]
+        acc_nodes = nodes[accept]
+        valid = ((tree["body"][acc_nodes] != acc_bodies) &
+                 (dist > radius[acc_bodies] + tree["reach"][acc_nodes]))
+        scale = np.zeros_like(dist)
+        np.divide(gravity * tree["mass"][acc_nodes], dist_sq[accept] * dist,
+                  out=scale, where=valid)
+        acc_x += np.bincount(
+            acc_bodies, weights=scale * disp[accept, 0], minlength=count)
+        acc_y += np.bincount(
+            acc_bodies, weights=scale * disp[accept, 1], minlength=count)
+        children = tree["children"][nodes[opened]].ravel()
+        bodies = np.repeat(bodies[opened], 4)[children >= 0]
+        nodes = children[children >= 0]
+    return np.stack((acc_x, acc_y), axis=1)
@@ -6,16 +6,23 @@ from resources import const
 class Planet(pyglet.sprite.Sprite):
     """Manages the planet object."""
 
-    def __init__(self, img, locus, mass=const.PLANET_MASS, batch=None):
+    def __init__(self, img, locus, mass=const.PLANET_MASS, batch=None,
+                 velocity=None, group=None):
         """Initialization.
         Args:
             img (image): Sprite graphic for the planet.
             locus (Vector): Position vector for the planet.
             mass (float): Relative mass of the planet.
             batch (pyglet.graphics.Batch): Batch for drawing.
+            velocity (Vector): Velocity of the planet (only used in
+                N-body mode, where planets move).
+            group (pyglet.graphics.Group): Parent group for drawing.
         """
-        super().__init__(img=img, batch=batch)
+        super().__init__(img=img, batch=batch, group=group)
+        if velocity == None:
+            velocity = Vector(0, 0)
         self.mass = mass
+        self.velocity = Vector(velocity.x, velocity.y)
         self.__locus = Vector(locus.x, locus.y)
         self.locus = self.__locus
 
@@ -1,6 +1,7 @@
 import pyglet
 import model
 import resources.indices as ind
+from model.engine import Rect
 
 class Player():
     """Manages the simulation animation player."""
@@ -73,6 +74,14 @@ class Player():
         elif model.engine.inrect(x, y, self.reset_btn):
             self.sig_reset_clicked()
 
+    def hit_bounds(self, info=None):
+        """Returns the bounding rect of the player for click routing."""
+        return Rect(self.x, self.y, self.width, self.height)
+
+    def hit_test(self, x, y, info=None):
+        """Checks whether a point lies in the player."""
+        return model.engine.inrect(x, y, self)
+
     def play(self):
         """Indicate that the simulation is running."""
         self.play_btn.image = self.images[ind.PAUSE_BTN]
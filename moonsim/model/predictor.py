@@ -0,0 +1,189 @@
+import threading
+import time
+import model.engine
+import model.forces
+import resources.indices as ind
+from model.body import Body
+from model.engine import Vector
+from model.events import EventDetector
+from model.kepler import KeplerOrbit, qualifies
+from resources import const
+
+class Predictor():
+    """Predicts the trajectory of the moon on a background thread.
+
+    Each request replaces any pending or running one, so while the
+    moon or its velocity arrow is dragged only the most recent state
+    is predicted and stale predictions are abandoned part way. The
+    worker computes in slices of at most budget seconds per frame and
+    then sleeps for the rest of the frame, so it never takes more than
+    its share of the interpreter from the main (drawing) thread. The
+    vertices computed so far are published after each slice, so long
+    predictions grow on screen instead of appearing all at once.
+
+    The planets are assumed fixed, as they are in the simulation
+    with every integrator but ind.NBODY, which is not predicted.
+    Two-body scenes are predicted with the analytic KeplerOrbit when
+    the integrator is ind.AUTO, and all others with RK4 steps that
+    stop at the first crash. Force models, if any, are included in
+    the RK4 steps (and rule out the analytic orbit).
+    """
+
+    def __init__(self, planets, gravity=const.GRAVITY,
+                 integrator=ind.AUTO, horizon=const.PREDICT_HORIZON,
+                 step=const.PREDICT_STEP, budget=const.PREDICT_BUDGET,
+                 forces=None):
+        """Initialization.
+
+        Args:
+            planets (list of Planet or Body): Planets setting up the
+                gravitational field.
+            gravity (float): Gravity constant.
+            integrator (int): ind.AUTO or ind.RK4.
+            horizon (float): Length of the prediction (simulation s).
+            step (float): Time between predicted vertices
+                (simulation s).
+            budget (float): Max computing time per frame (s).
+            forces (list of tuple): If not None, the (name, settings)
+                of the force models acting on the moon (see
+                forces.compose).
+        """
+        self.planets = [
+            Body(Vector(planet.locus.x, planet.locus.y), mass=planet.mass,
+                 width=planet.width)
+            for planet in planets]
+        self.gravity = gravity
+        self.integrator = integrator
+        self.horizon = horizon
+        self.step = step
+        self.budget = budget
+        self.forces = forces
+        # Composed force models by moon width.
+        self.__fields = dict()
+        self.__condition = threading.Condition()
+        self.__pending = None
+        self.__state = None
+        self.__closed = False
+        self.__result = (None, ())
+        self.__thread = threading.Thread(target=self.__work, daemon=True)
+        self.__thread.start()
+
+#######################################
+# Methods.
+
+    def request(self, moon):
+        """Requests a prediction for the current state of the moon.
+
+        Args:
+            moon (Moon or Body): Moon whose trajectory is predicted.
+
+        Returns:
+            Nothing.
+
+        Requests for the state that was last requested are ignored, so
+        this may be called every frame.
+        """
+        state = (moon.locus.x, moon.locus.y, moon.velocity.x,
+                 moon.velocity.y, moon.width)
+        if state == self.__state:
+            return
+        self.__state = state
+        with self.__condition:
+            self.__pending = state
+            self.__condition.notify()
+
+    def result(self):
+        """Returns the latest predicted vertices.
+
+        Returns:
+            tuple: Flat (x0, y0, x1, y1, ...) vertices of the newest
+                prediction, which may still be growing. Until a new
+                request has published its first slice, the vertices of
+                the previous request are returned.
+        """
+        return self.__result[1]
+
+    def close(self):
+        """Stops the worker thread."""
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify()
+        self.__thread.join()
+
+    def __work(self):
+        """Worker thread loop."""
+        while True:
+            with self.__condition:
+                while self.__pending == None and not self.__closed:
+                    self.__condition.wait()
+                if self.__closed:
+                    return
+                state = self.__pending
+                self.__pending = None
+            self.__predict(state)
+
+    def __stale(self):
+        """Checks whether the running prediction has been replaced."""
+        return self.__pending != None or self.__closed
+
+    def __predict(self, state):
+        """Computes and publishes the prediction for a moon state."""
+        locx, locy, velx, vely, width = state
+        locus, velocity = Vector(locx, locy), Vector(velx, vely)
+        points = self.__points(locus, velocity, width)
+        vertices = [locx, locy]
+        period = 1 / const.FRAME_RATE
+        while True:
+            start = time.perf_counter()
+            done = True
+            for point in points:
+                vertices.extend(point)
+                if self.__stale():
+                    return
+                if time.perf_counter() - start > self.budget:
+                    done = False
+                    break
+            self.__result = (state, tuple(vertices))
+            if done:
+                return
+            time.sleep(max(0, period - (time.perf_counter() - start)))
+
+    def __points(self, locus, velocity, width):
+        """Generates the predicted vertices after the start point."""
+        count = int(self.horizon / self.step)
+        if self.integrator == ind.AUTO and not self.forces and \
+                qualifies(None, self.planets):
+            planet = self.planets[0]
+            orbit = KeplerOrbit(
+                locus, velocity, planet.locus, self.gravity * planet.mass,
+                crash_radius=planet.width / 2 + width / 2)
+            crash_time = orbit.crash_time
+            if orbit.supported:
+                for step in range(1, count + 1):
+                    t = step * self.step
+                    crashed = crash_time != None and t >= crash_time
+                    if crashed:
+                        t = crash_time
+                    point = orbit.state(t)[0]
+                    yield point.x, point.y
+                    if crashed:
+                        return
+                return
+        if model.engine.collided(locus, self.planets, width / 2):
+            return
+        field = None
+        if self.forces:
+            field = self.__fields.get(width)
+            if field == None:
+                field = model.forces.compose(
+                    self.forces, self.planets, self.gravity, width / 2)
+                self.__fields[width] = field
+        detector = EventDetector(
+            self.planets, gravity=self.gravity, radius=width / 2, field=field)
+        values = None
+        for step in range(count):
+            locus, velocity, values, events = detector.step(
+                locus, velocity, self.step, values)
+            yield locus.x, locus.y
+            if events and events[-1][1] == ind.CRASH:
+                return
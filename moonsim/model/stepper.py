@@ -0,0 +1,673 @@
+import collections
+import math
+import model.cache
+import model.engine
+import model.forces
+import resources.indices as ind
+from model.engine import Vector
+from model.events import Event, EventDetector
+from model.kepler import KeplerOrbit, qualifies
+from resources import const
+
+class Stepper():
+    """Advances the moon through the field of the planets.
+
+    With the ind.AUTO integrator, scenes that are exact two-body
+    problems (see kepler.qualifies) are advanced with the analytic
+    KeplerOrbit, so the cost of a step does not depend on its size
+    and crashes are found at their exact time. All other scenes, or
+    the ind.RK4 integrator, are advanced with RK4 steps. By default,
+    each step is divided into divs substeps. If a fixed step size is
+    given instead, the RK4 steps are independent of the frame time
+    and may be much longer than a frame; the integrator then runs up
+    to one step ahead of the moon, which is placed at each frame time
+    by dense output (see state_at).
+
+    When regularize is set, RK4 steps that start close to a planet
+    (see engine.close_planet) are taken in Levi-Civita coordinates
+    centered on it instead (see engine.lc_step), which stay accurate
+    through close approaches where the force grows fastest. Fixed
+    steps then have a constant length in the regularized time, so
+    their length in seconds shrinks with the distance to the planet.
+    Without a fixed step size, frames that start close to a planet
+    are divided into const.LC_FRAME_DIVS regularized substeps, far
+    fewer than RK4 needs there, and their error is not estimated.
+
+    With the ind.BS integrator, the moon is advanced with adaptive
+    Bulirsch-Stoer steps (see engine.bs_step) that end at the frame
+    times, for reference solutions far more accurate than RK4
+    substeps of the same cost. The step size option is not used.
+
+    With the ind.NBODY integrator, the planets move too and all
+    bodies attract each other (see nbody.NBodySystem). Unless a fixed
+    step size is given, each step is divided into NBODY_FRAME_DIVS
+    substeps. Only crashes are detected in this mode, and the planets
+    are put back where they started by restore.
+
+    Additional moons (companions) are advanced together with the moon.
+    They attract the other bodies in N-body mode and are otherwise
+    advanced by their own steppers, which keep their own events.
+    Additional moons can instead be given as batched states when a
+    precision is given and the integrator allows it (see batches):
+    they are then only kept in an Ensemble of that precision, without
+    Moon or Body objects, and advanced all at once with the RK4
+    substeps of the moon (or steps of at most the fixed step size)
+    and without analytic orbits, events or cache, so that large
+    numbers of moons take far less time and memory.
+
+    Force models other than point-mass gravity (e.g., drag or thrust,
+    see model.forces) may be given as forces. They are composed into
+    a single acceleration function used by the RK4 and BS steps and
+    by the Ensemble. Analytic orbits and regularization assume pure
+    gravity, so they are not used with forces, and neither are the
+    forces in N-body mode.
+
+    When estimate_error is set, the local error of the RK4 substeps
+    of each frame is estimated by step doubling on the first substep
+    and kept in the error member (None if the last advance did not
+    take divs substeps), e.g., for a Governor to choose divs.
+
+    When a TrajectoryCache is given, the RK4 motion of each run is
+    recorded in it at the frame times, and a run that starts from a
+    state recorded before (e.g., after the simulation was stopped or
+    reset) is replayed from the cache, with the recorded states as
+    the steps, until it reaches the end of the recorded motion, from
+    where it is integrated and recorded again. If the cache detects
+    cycles, runs whose moon comes back to an earlier state are
+    replayed lap after lap from the recorded cycle instead.
+
+    Crashes and apsis passages are detected within the steps and
+    emitted as timestamped Event objects through sig_event. The most
+    recent events are also kept in the events member. Events are
+    emitted when the moon reaches them. Times are measured from when
+    the stepper was created or last reset.
+    """
+
+    def __init__(self, moon, planets, gravity=const.GRAVITY,
+                 integrator=ind.AUTO, divs=const.FRAME_DIVS, step=None,
+                 profiler=None, companions=(), estimate_error=False,
+                 cache=None, precision=None, regularize=False, forces=None,
+                 batched=()):
+        """Initialization.
+
+        Args:
+            moon (Moon or Body): Moon to be advanced.
+            planets (list of Planet or Body): Planets setting up the
+                gravitational field.
+            gravity (float): Gravity constant.
+            integrator (int): ind.AUTO, ind.RK4, ind.BS or ind.NBODY.
+            divs (int): Number of RK4 substeps per step.
+            step (float): If not None, RK4 steps of this fixed size
+                (simulation s) are taken instead of divs substeps.
+            profiler (Profiler): If not None, each RK4 substep is
+                timed in its const.PROF_ENGINE section.
+            companions (list of Moon or Body): Additional moons.
+            estimate_error (bool): Whether the error of the substeps
+                is estimated (at the cost of two extra RK4 half steps
+                per advance).
+            cache (TrajectoryCache): If not None, the cache the RK4
+                motion of the moon and companions is replayed from and
+                recorded in. Not used in N-body mode.
+            precision (int): Precision of the states of the batched
+                moons (ind.FLOAT32 or ind.FLOAT64).
+            regularize (bool): Whether close approaches are integrated
+                in regularized coordinates. Not used by the ind.BS and
+                ind.NBODY integrators, or with forces.
+            forces (list of tuple): If not None, the (name, settings)
+                of the force models acting on the moons (see
+                forces.compose). Not used by the ind.NBODY integrator.
+            batched (list of tuple): Additional moons as
+                (x, y, velx, vely, mass) tuples, advanced by an
+                Ensemble. Requires batches(integrator, precision).
+        """
+        self.moon = moon
+        self.planets = planets
+        self.gravity = gravity
+        self.integrator = integrator
+        self.divs = divs
+        self.step = step
+        self.profiler = profiler
+        self.estimate_error = estimate_error
+        self.error = None
+        self.forces = forces
+        self.field = None
+        if forces and integrator != ind.NBODY:
+            self.field = model.forces.compose(
+                forces, planets, gravity, moon.width / 2)
+            regularize = False
+        self.regularize = regularize
+        self.cache = cache
+        self.detector = EventDetector(
+            planets, gravity=gravity, radius=moon.width / 2, field=self.field)
+        self.events = collections.deque(maxlen=const.EVENT_HISTORY)
+        self.planet_states = [
+            (Vector(planet.locus.x, planet.locus.y),
+             Vector(planet.velocity.x, planet.velocity.y), planet.mass)
+            for planet in planets]
+        self.companions = list(companions)
+        self.companion_states = [
+            (Vector(moon.locus.x, moon.locus.y),
+             Vector(moon.velocity.x, moon.velocity.y))
+            for moon in companions]
+        self.companion_steppers = list()
+        self.ensemble = None
+        if batched:
+            # Imported here so the stepper can be used without numpy.
+            from model.ensemble import Ensemble
+
+            self.ensemble = Ensemble(
+                batched, planets, gravity, moon.width / 2, precision, forces)
+        if integrator != ind.NBODY:
+            self.companion_steppers = [
+                Stepper(moon, planets, gravity, integrator, divs, step,
+                        cache=cache, regularize=regularize, forces=forces)
+                for moon in companions]
+        self.reset()
+
+#######################################
+# Signals.
+# These are methods that can be connected to slot methods in another
+# object to allow communication without dispatching events. If the
+# signal methods are not connected, they do nothing.
+
+    def sig_event(self, event):
+        """Emitted when a crash or apsis passage is detected."""
+        pass
+
+#######################################
+# Methods.
+
+    def reset(self):
+        """Resets the time and forgets the past motion of the moon."""
+        self.time = 0
+        self.system = None
+        self.orbit = None
+        self.orbit_time = 0
+        self.events.clear()
+        for stepper in self.companion_steppers:
+            stepper.reset()
+        if self.ensemble != None:
+            self.ensemble.reset()
+        self.__last_state = None
+        self.__state_time = None
+        self.__values = None
+        self.__segments = list()
+        self.__pending = list()
+        self.__crash_time = None
+        self.__trajectory = None
+        self.__offset = None
+        self.__delivered = list()
+
+    def set_divs(self, divs):
+        """Sets the number of RK4 substeps per step.
+
+        Args:
+            divs (int): Number of substeps, also used by the steppers
+                of the companions.
+
+        Returns:
+            Nothing.
+        """
+        self.divs = divs
+        for stepper in self.companion_steppers:
+            stepper.set_divs(divs)
+
+    def restore(self):
+        """Resets the stepper and puts the planets back at their start.
+
+        This only changes the planets in N-body mode, since planets
+        are fixed otherwise. The companions and batched moons are also
+        put back.
+        """
+        for planet, (locus, velocity, mass) in zip(
+            self.planets, self.planet_states):
+            planet.mass = mass
+            planet.velocity = Vector(velocity.x, velocity.y)
+            planet.locus = Vector(locus.x, locus.y)
+        for moon, (locus, velocity) in zip(
+            self.companions, self.companion_states):
+            moon.reset(locus, velocity)
+        if self.ensemble != None:
+            self.ensemble.restart()
+        self.reset()
+
+    def advance(self, dt):
+        """Advances the moon by a time step.
+
+        Args:
+            dt (float): Time step in simulation seconds.
+
+        Returns:
+            Nothing.
+        """
+        for stepper in self.companion_steppers:
+            stepper.advance(dt)
+        if self.ensemble != None:
+            self.__advance_ensemble(dt)
+        self.error = None
+        if self.integrator == ind.NBODY:
+            self.__advance_nbody(dt)
+            return
+        if self.moon.crashed:
+            return
+        if self.integrator == ind.AUTO and self.field == None and \
+                qualifies(self.moon, self.planets):
+            orbit = self.__get_orbit()
+            if orbit != None:
+                self.__advance_orbit(orbit, dt)
+                return
+        self.orbit = None
+        if self.cache != None:
+            dt = self.__replay(dt)
+            if dt <= 0 or self.moon.crashed:
+                return
+        self.__advance_rk4(dt)
+        if self.cache != None:
+            self.__record()
+
+    def state_at(self, time):
+        """Returns the moon state at a time within the last step.
+
+        Args:
+            time (float): Stepper time, between the start of the last
+                advance and the end of the last RK4 step taken.
+
+        Returns:
+            tuple (two elements): Position and velocity Vectors.
+
+        Analytic orbits are evaluated exactly and RK4 steps are
+        interpolated with engine.interpolate. Raises ValueError if the
+        time is not covered by the last step.
+        """
+        if self.orbit != None:
+            return self.orbit.state(self.orbit_time + time - self.time)
+        for t0, locus0, velocity0, t1, locus1, velocity1 in reversed(
+            self.__segments):
+            if time == t0:
+                return locus0, velocity0
+            if t0 < time <= t1:
+                return model.engine.interpolate(
+                    locus0, velocity0, locus1, velocity1, t1 - t0, time - t0)
+        if time == self.time:
+            return self.moon.locus, self.moon.velocity
+        raise ValueError("time is outside of the last step")
+
+    def __moved(self):
+        """Checks whether the moon has been changed by someone else."""
+        moon = self.moon
+        state = (moon.locus.x, moon.locus.y, moon.velocity.x, moon.velocity.y)
+        return state != self.__last_state
+
+    def __set_moon(self, locus, velocity):
+        """Moves the moon and records the state that was set."""
+        self.moon.velocity = velocity
+        self.moon.locus = locus
+        self.__record_moon()
+
+    def __record_moon(self):
+        """Records the moon state set by the stepper."""
+        moon = self.moon
+        self.__last_state = (
+            moon.locus.x, moon.locus.y, moon.velocity.x, moon.velocity.y)
+
+    def __emit(self, time, kind, planet, locus, velocity):
+        """Records and emits an event."""
+        self.__deliver(Event(time, kind, planet, locus, velocity))
+
+    def __deliver(self, event):
+        """Records and emits an event reached by the moon."""
+        self.events.append(event)
+        self.__delivered.append(event)
+        self.sig_event(event)
+
+    def __get_orbit(self):
+        """Returns the analytic orbit matching the current moon state.
+
+        The orbit is set up again whenever the moon state differs from
+        the state the orbit last gave it, e.g., after the moon has
+        been moved or reset. Returns None for unsupported orbits.
+        """
+        moon = self.moon
+        if self.orbit == None or self.__moved():
+            planet = self.planets[0]
+            self.orbit = KeplerOrbit(
+                moon.locus, moon.velocity, planet.locus,
+                self.gravity * planet.mass,
+                crash_radius=planet.width / 2 + moon.width / 2)
+            self.orbit_time = 0
+            if not self.orbit.supported:
+                self.orbit = None
+        return self.orbit
+
+    def __advance_orbit(self, orbit, dt):
+        """Moves the moon along the analytic orbit."""
+        self.__state_time = None
+        start = self.orbit_time
+        end = start + dt
+        crashed = orbit.crash_time != None and end >= orbit.crash_time
+        if crashed:
+            end = orbit.crash_time
+        for time, kind in orbit.apsis_times(start, end):
+            locus, velocity = orbit.state(time)
+            self.__emit(self.time + time - start, kind, 0, locus, velocity)
+        locus, velocity = orbit.state(end)
+        self.__set_moon(locus, velocity)
+        self.time += end - start
+        self.orbit_time = end
+        if crashed:
+            self.__emit(self.time, ind.CRASH, 0, locus, velocity)
+            self.moon.crash()
+
+    def __advance_nbody(self, dt):
+        """Moves all the bodies with mutual attraction."""
+        # Imported here so the stepper can be used without numpy.
+        from model.nbody import NBodySystem
+
+        moon = self.moon
+        if self.system == None or (not moon.crashed and self.__moved()):
+            moons = [moon] + self.companions
+            bodies = list(self.planets)
+            bodies.extend(body for body in moons if not body.crashed)
+            self.system = NBodySystem(
+                bodies, gravity=self.gravity, crashable=moons)
+        if self.step == None:
+            count = const.NBODY_FRAME_DIVS
+        else:
+            count = max(1, math.ceil(dt / self.step))
+        section = None
+        if self.profiler != None:
+            section = self.profiler.section(const.PROF_ENGINE)
+        for step in range(count):
+            if section != None:
+                with section:
+                    crashed = self.system.step(dt / count)
+            else:
+                crashed = self.system.step(dt / count)
+            for body, target in crashed:
+                index = self.system.bodies.index(body)
+                self.__emit(
+                    self.time + dt * (step + 1) / count, ind.CRASH, target,
+                    Vector(*self.system.pos[index]),
+                    Vector(*self.system.vel[index]))
+        self.system.apply()
+        self.__record_moon()
+        self.time += dt
+
+    def __advance_ensemble(self, dt):
+        """Moves the batched moons with batched RK4 steps."""
+        if self.step == None:
+            count = self.divs
+        else:
+            count = max(1, math.ceil(dt / self.step))
+        if self.profiler != None:
+            with self.profiler.section(const.PROF_ENGINE):
+                self.ensemble.advance(dt, count)
+        else:
+            self.ensemble.advance(dt, count)
+
+    def __advance_rk4(self, dt):
+        """Moves the moon with RK4 (or BS) steps, detecting events."""
+        moon = self.moon
+        if model.engine.collided(moon.locus, self.planets, moon.width / 2):
+            moon.crash()
+            return
+        if self.__moved() or self.__state_time == None:
+            # Copies, as the moon setters change its vectors in place.
+            self.__locus = Vector(moon.locus.x, moon.locus.y)
+            self.__velocity = Vector(moon.velocity.x, moon.velocity.y)
+            self.__state_time = self.time
+            self.__values = None
+            self.__segments = list()
+            self.__pending = list()
+            self.__crash_time = None
+            self.__bs_size = dt
+            self.__bs_order = const.BS_ORDER
+        start = self.time
+        end = start + dt
+        self.__segments = [
+            segment for segment in self.__segments if segment[3] >= start]
+        section = None
+        if self.profiler != None:
+            section = self.profiler.section(const.PROF_ENGINE)
+        if self.integrator == ind.BS:
+            while self.__state_time < end and self.__crash_time == None:
+                self.__take_step(end - self.__state_time, section, end)
+        elif self.step == None:
+            divs = self.divs
+            regularized = self.regularize and model.engine.close_planet(
+                self.__locus, self.planets, self.gravity) != None
+            if regularized:
+                divs = const.LC_FRAME_DIVS
+            for step in range(0, divs):
+                # The last substep ends exactly at the end of the frame.
+                t1 = end if step == divs - 1 else \
+                    start + dt * (step + 1) / divs
+                locus, velocity = self.__locus, self.__velocity
+                if self.__take_step(dt / divs, section, t1):
+                    break
+                if step == 0 and self.estimate_error and not regularized:
+                    # The substep errors add up over the frame.
+                    self.error = self.divs * self.__local_error(
+                        locus, velocity, dt / self.divs)
+        else:
+            while self.__state_time < end and self.__crash_time == None:
+                self.__take_step(self.step, section)
+        crashed = self.__crash_time != None and self.__crash_time <= end
+        if crashed:
+            end = self.__crash_time
+        while self.__pending and self.__pending[0].time <= end:
+            self.__deliver(self.__pending.pop(0))
+        self.__move_moon(start, end)
+        self.time = end
+        if crashed:
+            moon.crash()
+
+    def __replay(self, dt):
+        """Moves the moon along its cached trajectory.
+
+        The trajectory is looked up when a run starts or the moon has
+        been moved by someone else. Returns the part of the time step
+        that is past the end of the cached motion, which is then
+        integrated and recorded.
+        """
+        moon = self.moon
+        self.__delivered = list()
+        if self.__offset == None or self.__moved():
+            self.__offset = self.time
+            self.__trajectory = self.cache.lookup(
+                model.cache.key(moon, self.planets, self.gravity,
+                                self.integrator, self.step, self.regularize,
+                                self.forces),
+                moon.locus, moon.velocity)
+        trajectory = self.__trajectory
+        if trajectory == None:
+            return dt
+        # The step is served in pieces of recorded motion, one more
+        # for each lap completed within it on periodic trajectories.
+        start = self.time - self.__offset
+        end = start + dt
+        position = start
+        segments = list()
+        events = list()
+        located = trajectory.locate(position)
+        while located != None and position < end:
+            mapped, limit = located
+            length = min(end - position, limit - mapped)
+            # Pieces that reach the limit end exactly there, so the
+            # events at the end of a cycle are served once per lap.
+            stop = limit if length == limit - mapped else mapped + length
+            offset = self.__offset + position - mapped
+            segments.extend(trajectory.segments(mapped, stop, offset))
+            events.extend(trajectory.events_in(mapped, stop, offset))
+            position += length
+            if stop < limit:
+                break
+            located = None
+            if trajectory.period != None:
+                located = (trajectory.cycle_start,
+                           trajectory.cycle_start + trajectory.period)
+        if not segments:
+            return dt
+        # Keep the end of the replay within the last step (round-off).
+        time = min(self.__offset + position, segments[-1][3])
+        self.__segments = segments
+        for event in events:
+            self.__deliver(event)
+        # Only the events of integrated steps are recorded.
+        self.__delivered = list()
+        self.__move_moon(self.time, time)
+        self.time = time
+        # The integrator starts again from the moon where replay ends.
+        self.__state_time = None
+        if trajectory.crashed and stop == trajectory.end():
+            moon.crash()
+        return end - position
+
+    def __record(self):
+        """Adds the motion of the last integrated step to the cache."""
+        trajectory = self.__trajectory
+        if trajectory == None:
+            return
+        locus, velocity = self.moon.locus, self.moon.velocity
+        found = list()
+        for event in self.__delivered:
+            event = Event(
+                event.time - self.__offset, event.kind, event.planet,
+                event.locus, event.velocity)
+            trajectory.events.append(event)
+            found.append(event)
+            if event.kind == ind.CRASH:
+                # The moon has stopped, use its state at the crash.
+                locus, velocity = event.locus, event.velocity
+                trajectory.crashed = True
+        if self.moon.crashed and not trajectory.crashed:
+            # Crashed without a step, nothing to replay.
+            self.__trajectory = None
+            return
+        trajectory.append(self.time - self.__offset, locus, velocity)
+        if self.cache.cycles and not trajectory.crashed:
+            for event in found:
+                if trajectory.period == None:
+                    trajectory.find_cycle(event)
+        if not self.cache.charge(trajectory):
+            self.__trajectory = None
+
+    def __take_step(self, dt, section=None, t1=None):
+        """Takes one RK4 (or BS) step from the integrator state.
+
+        The step is kept for dense output and the events found in it
+        are queued until the moon reaches them. The time at the end
+        of the step may be given as t1 to avoid round-off from adding
+        up the step sizes; it is not used if a BS step is shortened.
+        Returns True if the step ended with a crash.
+        """
+        locus, velocity = self.__locus, self.__velocity
+        if section != None:
+            with section:
+                taken, new_locus, new_velocity, values, found = \
+                    self.__integrate(locus, velocity, dt)
+        else:
+            taken, new_locus, new_velocity, values, found = \
+                self.__integrate(locus, velocity, dt)
+        t0 = self.__state_time
+        if t1 == None or taken != dt:
+            t1 = t0 + taken
+        for offset, kind, planet, event_locus, event_velocity in found:
+            self.__pending.append(
+                Event(t0 + offset, kind, planet, event_locus, event_velocity))
+            if kind == ind.CRASH:
+                t1 = t0 + offset
+                self.__crash_time = t1
+        self.__segments.append(
+            (t0, locus, velocity, t1, new_locus, new_velocity))
+        self.__locus, self.__velocity = new_locus, new_velocity
+        self.__values = values
+        self.__state_time = t1
+        return self.__crash_time != None
+
+    def __integrate(self, locus, velocity, dt):
+        """Integrates a step and locates its events.
+
+        Returns:
+            tuple: Size of the step taken (less than dt if a BS step
+                was shortened, or any size for a fixed regularized
+                step) and the results of EventDetector.step.
+        """
+        end = None
+        radius = self.moon.width / 2
+        planet = None
+        if self.regularize and self.integrator != ind.BS:
+            planet = model.engine.close_planet(
+                locus, self.planets, self.gravity)
+        if self.integrator == ind.BS:
+            end_locus, end_velocity, dt, self.__bs_size, self.__bs_order = \
+                model.engine.bs_step(
+                    locus, velocity, min(dt, self.__bs_size), self.planets,
+                    self.gravity, radius, order=self.__bs_order,
+                    field=self.field)
+            end = (end_locus, end_velocity)
+        elif planet != None:
+            if self.step == None:
+                # Substeps must end at their time, ds is a first guess.
+                ds = dt / (self.planets[planet].locus - locus).mag()
+                end_locus, end_velocity, dt = model.engine.lc_step(
+                    locus, velocity, ds, self.planets, planet, self.gravity,
+                    radius, dt)
+            else:
+                # As long as the fixed step at the distance limit.
+                ds = self.step / (
+                    const.LC_DISTANCE * self.planets[planet].width / 2)
+                end_locus, end_velocity, dt = model.engine.lc_step(
+                    locus, velocity, ds, self.planets, planet, self.gravity,
+                    radius)
+            end = (end_locus, end_velocity)
+        return (dt,) + self.detector.step(
+            locus, velocity, dt, self.__values, end)
+
+    def __local_error(self, locus, velocity, dt):
+        """Estimates the position error of the last RK4 step.
+
+        The step is taken again as two half steps. The error of RK4
+        steps scales with dt ** 5, so the difference of the two
+        results is 15/16 of the error of the single step.
+        """
+        radius = self.moon.width / 2
+        half_locus, half_velocity = model.engine.step(
+            locus, velocity, dt / 2, self.planets, self.gravity, radius,
+            self.field)
+        half_locus, half_velocity = model.engine.step(
+            half_locus, half_velocity, dt / 2, self.planets, self.gravity,
+            radius, self.field)
+        return (half_locus - self.__locus).mag() * 16 / 15
+
+    def __move_moon(self, start, end):
+        """Moves the moon to its interpolated state at a time.
+
+        If the moon moves more than one trail segment, intermediate
+        points from the dense output are added to its trail so that
+        the trail keeps its resolution with long steps.
+        """
+        trail = self.moon.trail
+        locus, velocity = self.state_at(end)
+        disp = (locus - self.moon.locus).mag()
+        samples = int(disp / trail.segment) if trail.segment > 0 else 0
+        for sample in range(1, samples):
+            point = self.state_at(start + (end - start) * sample / samples)[0]
+            trail.add(point.x, point.y)
+        self.__set_moon(locus, velocity)
+
+#######################################
+# Core functions.
+
+def batches(integrator, precision):
+    """Returns whether additional moons can be batched (see Stepper).
+
+    Args:
+        integrator (int): ind.AUTO, ind.RK4, ind.BS or ind.NBODY.
+        precision (int): Precision of the batched states, or None.
+
+    Returns:
+        bool: True with a precision, unless the integrator is ind.BS
+            or ind.NBODY, which advance every moon on its own.
+    """
+    return precision != None and integrator not in (ind.BS, ind.NBODY)
@@ -0,0 +1,183 @@
+import math
+from resources import const
+
+class Trail():
+    """Manages the path traveled by a moving body.
+
+    The most recent points are kept at full resolution. If a history
+    is requested, points falling off the end of the recent path are
+    simplified online so that no retained vertex deviates from the
+    original path by more than a pixel-error tolerance. If the
+    simplified history grows past its vertex budget, it is simplified
+    again with twice the tolerance (up to a maximum, after which the
+    oldest vertices are dropped), so complete multi-orbit histories
+    can be drawn with a bounded number of vertices.
+    """
+
+    def __init__(self, locus, segment=5, length=200, history=0,
+                 tolerance=const.MOON_PATH_TOLERANCE):
+        """Initialization.
+
+        Args:
+            locus (Vector): Initial point of the path.
+            segment (int): Min length of path segment.
+            length (int): Max number of full-resolution segments.
+            history (int): Max number of vertices in the simplified
+                history of older points. If 0, older points are
+                discarded.
+            tolerance (float): Initial pixel-error tolerance used to
+                simplify the history.
+        """
+        self.segment = segment
+        self.length = length
+        self.history_length = history
+        self.initial_tolerance = tolerance
+        self.reset(locus)
+
+#######################################
+# Methods.
+
+    def reset(self, locus):
+        """Clears the path and starts it again at locus."""
+        self.recent = [locus.x, locus.y]
+        self.history = list()
+        self.tolerance = self.initial_tolerance
+        self.__window = list()
+
+    def add(self, x, y):
+        """Adds a point to the path.
+
+        Args:
+            x (float): X-coordinate of the point.
+            y (float): Y-coordinate of the point.
+
+        Returns:
+            Nothing.
+
+        The point is only recorded if it is at least one segment
+        length away from the last recorded point.
+        """
+        if len(self.recent) // 2 > 0:
+            disp = math.hypot(x - self.recent[-2], y - self.recent[-1])
+        else:
+            disp = 0
+        if disp < self.segment:
+            return
+        self.recent.extend((x, y))
+        if len(self.recent) // 2 > self.length:
+            if self.history_length > 0:
+                self.__retire(self.recent[0], self.recent[1])
+            del self.recent[:2]
+
+    def vertices(self):
+        """Returns the flattened (x0, y0, x1, y1, ...) path vertices.
+
+        Vertices are ordered from oldest to newest.
+        """
+        if self.__window:
+            return self.history + list(self.__window[-1]) + self.recent
+        return self.history + self.recent
+
+    def __retire(self, x, y):
+        """Moves a point from the recent path into the history.
+
+        Args:
+            x (float): X-coordinate of the point.
+            y (float): Y-coordinate of the point.
+
+        Returns:
+            Nothing.
+
+        This is an opening-window simplification: points are held in
+        a window extending from the last kept vertex (the anchor)
+        until one of them lies further than the tolerance from the
+        line joining the anchor and the newest point. The last point
+        that was still within tolerance then becomes a kept vertex
+        and the new anchor.
+        """
+        if not self.history:
+            self.history.extend((x, y))
+            return
+        ax, ay = self.history[-2], self.history[-1]
+        fits = len(self.__window) < const.MOON_PATH_WINDOW
+        if fits:
+            for px, py in self.__window:
+                if segment_distance(px, py, ax, ay, x, y) > self.tolerance:
+                    fits = False
+                    break
+        if not fits:
+            self.history.extend(self.__window[-1])
+            self.__window = list()
+            if len(self.history) // 2 > self.history_length:
+                self.__shrink_history()
+        self.__window.append((x, y))
+
+    def __shrink_history(self):
+        """Brings the history back within its vertex budget.
+
+        The history is simplified again with twice the tolerance. Once
+        the tolerance reaches its maximum, the oldest vertices are
+        discarded instead.
+        """
+        if self.tolerance < const.MOON_PATH_MAX_TOLERANCE:
+            self.tolerance = min(
+                2 * self.tolerance, const.MOON_PATH_MAX_TOLERANCE)
+            self.history = simplify(self.history, self.tolerance)
+        excess = len(self.history) // 2 - self.history_length
+        if excess > 0:
+            del self.history[:2 * excess]
+
+#######################################
+# Core functions.
+
+def segment_distance(px, py, ax, ay, bx, by):
+    """Distance from point (px, py) to the segment (ax, ay)-(bx, by)."""
+    dx = bx - ax
+    dy = by - ay
+    len_sq = dx * dx + dy * dy
+    if len_sq == 0:
+        return math.hypot(px - ax, py - ay)
+    t = ((px - ax) * dx + (py - ay) * dy) / len_sq
+    t = min(max(t, 0), 1)
+    return math.hypot(px - ax - t * dx, py - ay - t * dy)
+
+def simplify(vertices, tolerance):
+    """Simplifies a path using the Douglas-Peucker algorithm.
+
+    Args:
+        vertices (list of float): Flattened (x0, y0, x1, y1, ...)
+            path vertices.
+        tolerance (float): Max distance of a removed vertex from the
+            simplified path.
+
+    Returns:
+        list of float: Flattened vertices of the simplified path. The
+            end points are always kept.
+    """
+    num_ver = len(vertices) // 2
+    if num_ver < 3:
+        return list(vertices)
+    keep = [False] * num_ver
+    keep[0] = keep[-1] = True
+    stack = [(0, num_ver - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay = vertices[2 * first], vertices[2 * first + 1]
+        bx, by = vertices[2 * last], vertices[2 * last + 1]
+        max_dist = 0
+        max_index = first
+        for index in range(first + 1, last):
+            dist = segment_distance(
+                vertices[2 * index], vertices[2 * index + 1], ax, ay, bx, by)
+            if dist > max_dist:
+                max_dist = dist
+                max_index = index
+        if max_dist > tolerance:
+            keep[max_index] = True
+            stack.append((first, max_index))
+            stack.append((max_index, last))
+    simplified = list()
+    for index in range(num_ver):
+        if keep[index]:
+            simplified.extend(vertices[2 * index:2 * index + 2])
+    return simplified
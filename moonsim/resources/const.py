@@ -28,9 +28,29 @@ STARTUP_LONG = [
     "perigee",
     "apogee",
     "license",
-    "help"]
+    "help",
+    "render=",
+    "time=",
+    "trail=",
+    "profile",
+    "trace=",
+    "integrator=",
+    "step=",
+    "scenario=",
+    "telemetry=",
+    "telemetry-format=",
+    "serve=",
+    "serve-rate=",
+    "regress",
+    "regress-update",
+    "fixed-divs",
+    "cycles",
+    "precision=",
+    "regularize",
+    "compare=",
+    "analyze="]
 
-STARTUP_SHORT = "dpalh"
+STARTUP_SHORT = "dpalhr:t:s:"
 
 #######################################
 # Initial parameters for the planet.
@@ -40,12 +60,16 @@ DEL_PLANET_INIT_LOCX = 0
 DEL_PLANET_INIT_LOCY = 0
 # Mass.
 PLANET_MASS = 81.348            # Moon masses.
+# Diameter of the planet sprite image (used when running headless).
+PLANET_WIDTH = 90               # px
 
 #######################################
 # Parameters for the moon.
 
 # Mass.
 MOON_MASS = 1
+# Diameter of the moon sprite image (used when running headless).
+MOON_WIDTH = 30                 # px
 # Initial location (perigee).
 DEL_MOON_PER_LOCX = - 242.20    # px
 DEL_MOON_PER_LOCY = 0           # px
@@ -59,10 +83,22 @@ DEL_MOON_APO_LOCY = 0           # px
 MOON_APO_VELX = 0               # px/s
 MOON_APO_VELY = -23.136         # px/s
 
+# Max number of vertices kept in the simplified path history (0 for
+# no history, i.e., only the most recent path is drawn).
+MOON_PATH_HISTORY = 0
+# Initial pixel-error tolerance for simplifying the path history.
+MOON_PATH_TOLERANCE = 0.5       # px
+# Max tolerance before the oldest history vertices are discarded.
+MOON_PATH_MAX_TOLERANCE = 8     # px
+# Max number of points considered when simplifying each history segment.
+MOON_PATH_WINDOW = 64
 # Moon tail path color.
 MOON_PATH_CLR = (0.89, 0.80, 0.45, 1.0)
 # Moon velocity arrow color.
 MOON_ARROW_CLR = (0.0, 1.0, 0.0, 0.5)
+# Colors of the batched moons (see Ensemble), in flight and crashed.
+MOON_BATCH_CLR = (0.70, 0.70, 0.70, 1.0)
+MOON_BATCH_CRASH_CLR = (1.00, 0.45, 0.10, 1.0)
 # Dimensions of velocity arrow (along x-axis).
 # Length and width scaling.
 MOON_ARROW_LEN_SCALE = 2        # Velocity scale to get base length.
@@ -86,6 +122,8 @@ DAY_PER_SIMSEC = HR_PER_SIMSEC / 24
 SIMSEC_PER_YEAR = 365.25 / DAY_PER_SIMSEC
 # Energy.
 TJ_PER_SIMENERGY = 1.2747e14
+# Mass conversion: kilograms per moon mass.
+KG_PER_MOON_MASS = 7.342e22
 
 #######################################
 # Screen label for moon parameters.
@@ -100,7 +138,8 @@ r: {:+14.3e} km\n\
 speed: {:+10.3e} km/h\n\
 dx/dt: {:+7.3e} km/h\n\
 dy/dt: {:+7.3e} km/h\n\
-FPS: {:12.1f} fps"
+FPS: {:12.1f} fps\n\
+substeps: {:>12s}"
 MOON_PAR_LBL_LOCX = 5
 MOON_PAR_LBL_LOCY = 5
 MOON_PAR_LBL_WIDTH = 200
@@ -111,6 +150,57 @@ MOON_PAR_LBL_PS_CLR = (58, 193, 255, 255)       # stopped/paused
 MOON_PAR_LBL_CRASH_CLR = (255, 73, 91, 255)     # running and crashed
 MOON_PAR_LBL_MOVE_CLR = (73, 191, 172, 255)     # user changing moon
 
+#######################################
+# Comparison mode.
+
+# Format string of the pane labels (name, time, energy drift).
+COMPARE_LBL_STRING = "\
+{}\n\
+t: {:10.1f} days\n\
+drift: {:+10.3e}"
+# Color of the pane borders.
+COMPARE_BORDER_CLR = (0.4, 0.4, 0.4, 1.0)
+# Max number of scenarios in the window.
+COMPARE_MAX = 9
+# Name of the scenario of the other options.
+COMPARE_MAIN_NAME = "main"
+
+#######################################
+# Camera.
+
+# Zoom multiplier for each mouse scroll step.
+CAMERA_ZOOM_STEP = 1.1
+# Zoom limits.
+CAMERA_MIN_ZOOM = 0.01
+CAMERA_MAX_ZOOM = 20
+
+#######################################
+# Click routing.
+
+# Width and height of the hit-test grid cells.
+PICK_CELL_SIZE = 64             # px
+
+#######################################
+# Frame timing profiler.
+
+# Section names.
+PROF_UPDATE = "Controller.update"
+PROF_ENGINE = "engine.update"
+PROF_ENERGY = "engine.energy"
+PROF_ARROW = "Viewer.render_arrow"
+PROF_PATH = "Viewer.render_path"
+PROF_LABEL = "Viewer.render_label"
+PROF_PAINT = "Viewer.paint"
+# Number of frames in the rolling statistics.
+PROF_WINDOW = 300
+# Max number of timed calls kept for trace export.
+PROF_TRACE_LENGTH = 200000
+# Overlay label.
+PROF_LBL_HEADER = "{:<20s}{:>8s}{:>8s}{:>8s}".format(
+    "section (ms/frame)", "p50", "p95", "max")
+PROF_LBL_STRING = "{:<20s}{:8.2f}{:8.2f}{:8.2f}"
+PROF_LBL_CLR = (200, 200, 200, 255)
+
 #######################################
 # Simulation defaults.
 
@@ -118,6 +208,266 @@ MOON_PAR_LBL_MOVE_CLR = (73, 191, 172, 255)     # user changing moon
 FRAME_RATE = 60     # frames per second
 # Frame interval subdivision for numerical integration.
 FRAME_DIVS = 100
+# Fixed RK4 step size used instead of FRAME_DIVS (None to subdivide
+# each frame).
+STEP_SIZE = None
+
+#######################################
+# Bulirsch-Stoer integrator.
+
+# Error tolerance of each step, relative to each coordinate plus one.
+BS_TOL = 1e-12
+# Modified midpoint substeps of the successive extrapolation rows.
+BS_SEQUENCE = (2, 4, 6, 8, 10, 12, 14, 16, 18)
+# Column of the extrapolation table expected to converge at first.
+BS_ORDER = 4
+# Step size control: safety factor and bounds of the change of size.
+BS_SAFETY = 0.94
+BS_MIN_SCALE = 0.05
+BS_MAX_SCALE = 4.0
+# Ratio of work per unit time below which another order is preferred.
+BS_WORK_RATIO = 0.9
+
+#######################################
+# Levi-Civita regularization.
+
+# Distance from a planet center within which close approaches are
+# integrated in regularized coordinates.
+LC_DISTANCE = 3                 # planet radii
+# Regularized RK4 steps per frame (without a fixed step size).
+LC_FRAME_DIVS = 5
+# Tolerance on the length of steps that must end at a given time,
+# relative to the length, and max Newton iterations to reach it.
+LC_TIME_TOL = 1e-14
+LC_MAX_ITER = 8
+
+#######################################
+# Headless rendering.
+
+# Default length of a headless run.
+RENDER_DAYS = 28                # days
+# Colors used by the software rasterizer in place of sprite images.
+RASTER_PLANET_CLR = (0.20, 0.45, 0.85, 1.0)
+RASTER_MOON_CLR = (0.70, 0.70, 0.70, 1.0)
+RASTER_CRASH_CLR = (1.00, 0.45, 0.10, 1.0)
+# Radius of the crashed-moon disc (half the crash animation width).
+RASTER_CRASH_RADIUS = 35        # px
+# Number of threads encoding and writing PNG frames.
+RASTER_WRITERS = 2
+# Max number of frames waiting to be encoded before rendering blocks.
+RASTER_QUEUE_SIZE = 32
+# zlib compression level for PNG frames.
+RASTER_PNG_LEVEL = 1
+# File name format for individual frames.
+RASTER_FRAME_NAME = "frame{:06d}.png"
+
+#######################################
+# Event detection.
+
+# Tolerance on the time of crashes and apsis passages.
+EVENT_TIME_TOL = 1e-9           # s
+# Max number of iterations used to locate an event.
+EVENT_MAX_ITER = 60
+# Number of past events kept by the stepper.
+EVENT_HISTORY = 100
+
+#######################################
+# Trajectory prediction.
+
+# Length of the predicted trajectory drawn while the moon is stopped.
+PREDICT_HORIZON = 28 / DAY_PER_SIMSEC     # simulation s
+# Time between predicted vertices.
+PREDICT_STEP = 0.1                        # simulation s
+# Max time spent predicting in each frame.
+PREDICT_BUDGET = 0.004                    # s
+# Predicted trajectory color.
+PREDICT_CLR = (0.45, 0.75, 0.95, 0.6)
+
+#######################################
+# N-body mode.
+
+# Change the velocities to the centre-of-mass frame at the start of a run.
+NBODY_COM_FRAME = True
+# Frame interval subdivision (the array kernels cost more per step).
+NBODY_FRAME_DIVS = 10
+# Min number of bodies for which the Barnes-Hut tree is used.
+NBODY_TREE_MIN = 1024
+# Opening angle of the Barnes-Hut tree.
+NBODY_THETA = 0.5
+# Max depth of the Barnes-Hut tree.
+NBODY_TREE_DEPTH = 32
+
+#######################################
+# Scenario files.
+
+# Version of the compiled scenario cache (change with its format or
+# with the parameters that scenarios compile to).
+SCENARIO_CACHE_MAGIC = "moonsim-scenario-4"
+# Suffix of compiled scenario files in the __pycache__ directory.
+SCENARIO_CACHE_SUFFIX = ".moonsim.cache"
+
+#######################################
+# Telemetry.
+
+# Names of the fields of each sample (label units: days, km, km/h, TJ).
+TELEMETRY_FIELDS = (
+    "time", "distance", "speed", "velx", "vely",
+    "total_energy", "kinetic_energy", "potential_energy")
+# Binary sample layout: sequence number and fields.
+TELEMETRY_STRUCT = "<Q8d"
+# Max number of samples waiting to be sent.
+TELEMETRY_QUEUE_SIZE = 1024
+# Max number of frames between samples when downsampling.
+TELEMETRY_MAX_STRIDE = 64
+# Max number of samples sent at once.
+TELEMETRY_BATCH = 256
+# Time between connection attempts.
+TELEMETRY_RETRY = 1.0                   # s
+# Max time to wait for the last samples when closing.
+TELEMETRY_CLOSE_TIMEOUT = 1.0           # s
+
+#######################################
+# State server.
+
+# Address the state server listens on (local clients only).
+SERVER_HOST = "127.0.0.1"
+# Rate at which the state is sent to clients.
+SERVER_RATE = 10                        # Hz
+# Max number of messages waiting for a client before it is resent
+# the full state.
+SERVER_CLIENT_QUEUE = 32
+# Max size of a request or WebSocket message.
+SERVER_MAX_MESSAGE = 65536              # bytes
+# Max time to wait for the server thread when closing.
+SERVER_CLOSE_TIMEOUT = 1.0              # s
+
+#######################################
+# Run history.
+
+# Channels recorded in the run history of the window.
+HISTORY_CHANNELS = ("moon_x", "moon_y") + TELEMETRY_FIELDS[1:]
+# Max memory used by a run history.
+HISTORY_BYTES = 1 << 20                 # bytes
+# Number of resolution tiers.
+HISTORY_TIERS = 4
+# Number of rows of a tier merged into each row of the next tier.
+HISTORY_FACTOR = 8
+# Default max number of rows returned by the state server.
+HISTORY_POINTS = 1000
+
+#######################################
+# Regression harness.
+
+# Golden trajectory file in the resources directory.
+REGRESS_GOLDEN = "golden.json"
+# Length of each regression run.
+REGRESS_DAYS = 28                       # days
+# Number of frames between trajectory samples.
+REGRESS_SAMPLE_FRAMES = 60
+# Moon velocity of the crash scenario (from perigee).
+REGRESS_CRASH_VELY = 12                 # px/s
+# Step size of the fixed-step RK4 runs.
+REGRESS_STEP = 0.05                     # hr
+# Step size of the runs whose frames within the first step are
+# checked against the substep runs.
+REGRESS_FIRST_STEP = 10                 # hr
+# Max distance of the moon from its golden trajectory.
+REGRESS_POS_TOL = 1e-3                  # px
+# Max difference from the golden crash time.
+REGRESS_TIME_TOL = 1e-6                 # s
+# Max relative change of the total energy for each integrator.
+REGRESS_ENERGY_TOL = {
+    "auto": 1e-9,
+    "rk4": 1e-9,
+    "rk4-step": 1e-9,
+    "nbody": 1e-9,
+    "bs": 1e-12}
+# Max fraction by which the steps per second may fall short of the
+# baseline stored with the goldens.
+REGRESS_SPEED_BUDGET = 0.25
+REGRESS_CRASH_SPEED_BUDGET = 0.4
+# Speed measurement: number of rounds, min wall time of each round,
+# and max frames of each run of the case in a round (before the
+# crash of the crash scenario).
+REGRESS_SPEED_ROUNDS = 7
+REGRESS_SPEED_ROUND_TIME = 0.1          # s
+REGRESS_SPEED_FRAMES = 600
+# Size of the reference workload that speeds are measured against.
+REGRESS_REFERENCE_LOOPS = 20000
+REGRESS_REFERENCE_REPEATS = 5
+# Report lines.
+REGRESS_RESULT_STR = "\
+{:<20} {:<5} drift {:9.2e} {:10.0f} steps/s (relative {:.3g})"
+REGRESS_UPDATE_STR = "{:<20} recorded {:10.0f} steps/s"
+REGRESS_SKIP_STR = "{:<20} skipped (requires numpy)"
+REGRESS_FIRST_STEP_STR = "{:<20} {:<5} {:9.2e} px off the substeps"
+REGRESS_SUMMARY_STR = "{} passed, {} failed"
+
+#######################################
+# Quality governor.
+
+# Target physics time per frame (a quarter of the frame interval).
+GOVERNOR_FRAME_TIME = 0.25 / FRAME_RATE     # s
+# Tolerance on the position error of the moon per frame.
+GOVERNOR_ERROR_TOL = 1e-9       # px
+# Bounds of the RK4 substeps per frame, and ratio between levels.
+GOVERNOR_MIN_DIVS = 5
+GOVERNOR_MAX_DIVS = 640
+GOVERNOR_FACTOR = 2
+# Weight of each frame in the smoothed frame time.
+GOVERNOR_SMOOTHING = 0.1
+# Min number of frames at a level before it is lowered.
+GOVERNOR_HOLD = 30
+# Fraction of the tolerance the error must stay within to lower the
+# level without a time constraint.
+GOVERNOR_MARGIN = 0.1
+# Fraction of the target the expected frame time must stay within to
+# raise the level.
+GOVERNOR_HEADROOM = 0.75
+
+#######################################
+# Trajectory cache.
+
+# Max memory used by the cached trajectories of the window.
+CACHE_BYTES = 32 << 20
+# Max differences of the moon state at which an orbit is closed.
+CYCLE_LOC_TOL = 1e-3            # px
+CYCLE_VEL_TOL = 1e-4            # px/s
+
+#######################################
+# Orbital analytics.
+
+# Elements of each orbit (label units: days, km).
+ANALYTICS_FIELDS = (
+    "start", "period", "periapsis", "apoapsis", "semi_major_axis",
+    "eccentricity", "energy_drift", "momentum_drift")
+# Report of a run.
+ANALYTICS_TITLE_STR = "{}:"
+ANALYTICS_HEADER_STR = "\
+orbit   start (d)  period (d)   peri (km)    apo (km)      a (km)        e\
+        dE/E        dL/L"
+ANALYTICS_ORBIT_STR = "\
+{:5d} {:11.3f} {:11.5f} {:11.1f} {:11.1f} {:11.1f} {:8.5f} {:+11.3e} {:+11.3e}"
+ANALYTICS_SUMMARY_STR = "\
+samples: {samples}, days: {duration:.3f}, orbits: {orbits}\n\
+mean period: {period:.5f} days, mean a: {semi_major_axis:.1f} km, \
+mean e: {eccentricity:.5f}\n\
+periapsis: {periapsis:.1f} km, apoapsis: {apoapsis:.1f} km\n\
+energy drift: {energy_drift:.3e}, angular momentum drift: \
+{momentum_drift:.3e}\n\
+crash: {crash_time:.3f} days\n"
+# Crash statistics of several runs.
+ANALYTICS_CRASH_STR = "\
+crashes: {crashed} of {count} runs ({fraction:.1%}), first: {first:.3f}, \
+median: {median:.3f}, mean: {mean:.3f}, last: {last:.3f} days"
+
+#######################################
+# Force models.
+
+# Default scale height of planet atmospheres (drag model).
+FORCE_DRAG_HEIGHT = 10                  # px
+# Default top of planet atmospheres (drag model).
+FORCE_DRAG_CEILING = 2                  # planet radii
 
 #######################################
 # Strings: Error messages.
@@ -137,3 +487,43 @@ Bad window dimensions:\n\
     minheight=MAIN_WIN_MINY - 1, maxheight=MAIN_WIN_MAXY + 1)
 # Error message when image resources cannot be found.
 BADIMGRES_STR = "Cannot load image resources.\n"
+# Message when a bad path history size is requested.
+BADTRAIL_STR = "\
+Bad trail size: must be a non-negative number of vertices.\n"
+# Message when a bad step size is requested.
+BADSTEP_STR = "\
+Bad step size: must be a positive number of hours.\n"
+# Message when a scenario file cannot be used.
+BADSCENARIO_STR = "Bad scenario file {}: {}.\n"
+# Message when a bad telemetry target or format is requested.
+BADTELEMETRY_STR = "\
+Bad telemetry target: use -, unix:<path> or tcp:<host>:<port>.\n"
+BADTELEMETRYFMT_STR = "\
+Bad telemetry format: use ndjson or binary.\n"
+# Message when a bad state server port or rate is requested.
+BADSERVE_STR = "\
+Bad server option: the port must be 0 to 65535 and the rate positive.\n"
+# Message when the golden trajectories cannot be read.
+BADGOLDEN_STR = "\
+Cannot read the golden trajectories {}: {}.\n\
+Record them with 'moonsim --regress-update'.\n"
+# Message when the state server cannot be started.
+BADSERVER_STR = "Cannot start the state server on {}:{}: {}.\n"
+# Message when an unknown integrator is requested.
+BADINTEGRATOR_STR = "\
+Unknown integrator (see 'moonsim -h').\n"
+# Message when a bad headless run time is requested.
+BADRENDERTIME_STR = "\
+Bad render time: must be a positive number of days.\n"
+# Message when an unknown state precision is requested.
+BADPRECISION_STR = "\
+Unknown precision (see 'moonsim -h').\n"
+# Message when too many scenarios are compared.
+BADCOMPARE_STR = "\
+Too many scenarios to compare (at most {}).\n"
+# Message when force models are combined with settings that ignore them.
+BADFORCES_STR = "\
+Force models ({}) cannot be used with {}.\n"
+# Message when a telemetry file cannot be analyzed.
+BADANALYZE_STR = "\
+Cannot analyze telemetry file {}: {}\n"
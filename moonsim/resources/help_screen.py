@@ -30,6 +30,147 @@ OPTIONS\n\
 \n\
         -a, --apogee\n\
                 Begin with the moon at apogee.\n\
+\n\
+        -s, --scenario <file>\n\
+                Load the planets, moons, integrator, force models and\n\
+                output options from a JSON (.json) or TOML (.toml)\n\
+                scenario file (see README.md). Other options\n\
+                override the scenario.\n\
+\n\
+        -r, --render <path>\n\
+                Run the simulation without a window and render it to\n\
+                PNG images. If <path> ends with .png, a single\n\
+                long-exposure image of the whole run is written to it.\n\
+                Otherwise, every frame is written to the directory\n\
+                <path>. Requires numpy.\n\
+\n\
+        -t, --time <days>\n\
+                Length of a rendered run in days. The default is 28.\n\
+\n\
+        --trail <vertices>\n\
+                Keep a simplified history of the whole moon path\n\
+                drawn with at most <vertices> vertices in addition to\n\
+                the most recent path. The default is 0 (no history).\n\
+\n\
+        --profile\n\
+                Display the rolling p50, p95 and max time spent per\n\
+                frame in the simulation update, physics engine and\n\
+                each rendering step.\n\
+\n\
+        --trace <file>\n\
+                Same as --profile, and also write the timing of each\n\
+                call to <file> as Chrome trace-event JSON when the\n\
+                window is closed.\n\
+\n\
+        --integrator <name>\n\
+                Method used to advance the moon. With auto (the\n\
+                default), scenes with a single planet use the exact\n\
+                analytic (Kepler) orbit and other scenes use the\n\
+                fourth-order Runge-Kutta algorithm. With rk4, the\n\
+                Runge-Kutta algorithm is always used. With nbody,\n\
+                the planets move too and all bodies attract each\n\
+                other (requires numpy). With bs, the adaptive\n\
+                Bulirsch-Stoer algorithm is used instead of the\n\
+                Runge-Kutta algorithm, for high-precision reference\n\
+                runs.\n\
+\n\
+        --step <hours>\n\
+                Advance the Runge-Kutta algorithm in fixed steps of\n\
+                <hours> instead of dividing each frame into\n\
+                substeps. The moon is drawn between steps by\n\
+                interpolation, so steps much longer than a frame\n\
+                (e.g., 0.5) still give smooth motion.\n\
+\n\
+        --fixed-divs\n\
+                Always divide each frame into 100 Runge-Kutta\n\
+                substeps. By default, the substeps are adjusted\n\
+                between 5 and 640 to keep the physics within a\n\
+                quarter of the frame time and the position error of\n\
+                the moon within 1e-9 px per frame. The current number\n\
+                is shown by --display.\n\
+\n\
+        --cycles\n\
+                Once a Runge-Kutta orbit closes, i.e., the moon comes\n\
+                back to an earlier state within 1e-3 px and 1e-4\n\
+                px/s at a periapsis or apoapsis, replay the recorded\n\
+                lap instead of computing the following ones.\n\
+\n\
+        --regularize\n\
+                Integrate the Runge-Kutta steps that start within 3\n\
+                planet radii of a planet in Levi-Civita coordinates,\n\
+                which remove the singularity of the force at the\n\
+                planet, so close approaches stay accurate with far\n\
+                fewer steps. Frames close to a planet are divided\n\
+                into 5 substeps, and fixed steps (see --step) get\n\
+                shorter closer to the planet.\n\
+\n\
+        --precision <float32|float64>\n\
+                Advance the additional moons of a scenario all at\n\
+                once with batched Runge-Kutta steps, keeping their\n\
+                states in arrays of the given precision. float32\n\
+                uses less memory and is faster for very large\n\
+                ensembles, at the cost of about 1e-2 px of accuracy.\n\
+                Requires numpy.\n\
+\n\
+        --compare <file>\n\
+                Run the scenario file side by side with the main\n\
+                simulation in a grid of panes, each with its own\n\
+                camera, elapsed time and energy drift. Can be given\n\
+                up to 8 times. The other options apply to all the\n\
+                scenarios unless a scenario sets them.\n\
+\n\
+        --telemetry <target>\n\
+                Stream the time, distance, velocity and energy of the\n\
+                moon every frame to <target>: - for stdout,\n\
+                unix:<path> for a UNIX socket or tcp:<host>:<port>\n\
+                for a TCP socket. The simulation never waits for the\n\
+                reader; if it falls behind, samples are skipped.\n\
+\n\
+        --telemetry-format <name>\n\
+                Format of the telemetry: ndjson (the default), one\n\
+                JSON object per line, or binary, packed little-endian\n\
+                records of a uint64 sequence number and 8 doubles.\n\
+\n\
+        --serve <port>\n\
+                Run a local HTTP and WebSocket server on <port> that\n\
+                sends the simulation state to dashboards and accepts\n\
+                play, pause, toggle, stop and reset commands (see\n\
+                README.md).\n\
+\n\
+        --serve-rate <hz>\n\
+                Rate at which the server sends the state. The default\n\
+                is 10.\n\
+\n\
+        --regress\n\
+                Run the perigee, apogee and crash scenarios with every\n\
+                integrator and check them against the golden\n\
+                trajectories, energy conservation and speed baselines\n\
+                stored in resources/golden.json. Exits with status 1\n\
+                if any case fails.\n\
+\n\
+        --regress-update\n\
+                Record new golden trajectories and speed baselines.\n\
+\n\
+        --analyze <file>\n\
+                Print the period, apsis distances, semi-major axis,\n\
+                eccentricity and energy and angular momentum drift\n\
+                of each orbit recorded in a binary telemetry file,\n\
+                and statistics of the whole run. Can be given\n\
+                several times, followed by crash statistics over\n\
+                all the runs. Requires numpy.\n\
+\n\
+CONTROLS\n\
+        Mouse wheel\n\
+                Zoom the view.\n\
+\n\
+        Right mouse button drag\n\
+                Pan the view.\n\
+\n\
+        F\n\
+                Toggle keeping the view centered on the moon.\n\
+\n\
+        Home\n\
+                Return to the default view.\n\
 \n\
 ARGUMENTS\n\
         [<width> <height>]\n\
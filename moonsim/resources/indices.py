@@ -9,6 +9,30 @@ INIT_VELX =         1006 # Initial x-velocity of moon.
 INIT_VELY =         1007 # Initial y-velocity of moon.
 WIN_WIDTH =         1008 # Main window width.
 WIN_HEIGHT =        1009 # Main window height.
+RENDER_PATH =       1010 # Output path for headless rendering.
+RENDER_TIME =       1011 # Length of headless run (days).
+PATH_HISTORY =      1012 # Max vertices in simplified moon path history.
+PROFILE =           1013 # Display frame timing flag.
+TRACE_PATH =        1014 # Output path for the frame timing trace.
+INTEGRATOR =        1015 # Integrator used to advance the moon.
+STEP_SIZE =         1016 # Fixed RK4 step size (simulation s).
+PLANETS =           1017 # Planets of a scenario as (x, y, vx, vy, mass).
+MOONS =             1018 # Moons of a scenario as (x, y, vx, vy, mass).
+CENTERED =          1019 # Scenario positions are relative to the center.
+TELEMETRY =         1020 # Telemetry target.
+TELEMETRY_FMT =     1021 # Telemetry format.
+SERVE_PORT =        1022 # State server port.
+SERVE_RATE =        1023 # State server update rate.
+REGRESS =           1024 # Run the regression harness.
+REGRESS_UPDATE =    1025 # Record new golden trajectories.
+GOVERNOR =          1026 # Adjust the substeps to the frame budget.
+CYCLES =            1027 # Replay periodic orbits from their first lap.
+PRECISION =         1028 # Precision of the batched companion states.
+REGULARIZE =        1029 # Regularize close planetary approaches.
+COMPARE =           1030 # Scenarios compared side by side.
+NAME =              1031 # Name of a compared scenario.
+ANALYZE =           1032 # Telemetry files to analyze.
+FORCES =            1033 # Force models of the scenario.
 
 # Object identifiers.
 MOON =              2000 # Body of moon.
@@ -48,3 +72,21 @@ ANG =               5003 # Rotational angle for rendering vertices.
 CLR =               5004 # Color list for vertex list.
 NMV =               5005 # Number of vetices.
 
+# Integrators.
+AUTO =              6000 # Analytic orbit when possible, otherwise RK4.
+RK4 =               6001 # Fourth-order Runge-Kutta.
+NBODY =             6002 # RK4 with mutual attraction of all bodies.
+BS =                6003 # Adaptive Bulirsch-Stoer.
+
+# State precisions of the batched engine.
+FLOAT32 =           6300 # Single precision with compensated sums.
+FLOAT64 =           6301 # Double precision.
+
+# Telemetry formats.
+NDJSON =            6200 # Newline-delimited JSON objects.
+BINARY =            6201 # Packed little-endian records.
+
+# Events.
+CRASH =             6100 # Moon hits a planet.
+PERIAPSIS =         6101 # Moon passes closest to a planet.
+APOAPSIS =          6102 # Moon passes furthest from a planet.
@@ -0,0 +1,143 @@
+from pyglet import gl
+from model.engine import Vector, Rect
+from resources import const
+
+class Camera():
+    """Maps simulation (world) coordinates onto the window.
+
+    A world point p is drawn at the window point
+
+        (p - center) * zoom + (width / 2, height / 2)
+
+    so the default camera (centered on the window with zoom 1) draws
+    world coordinates as window pixels.
+    """
+
+    def __init__(self, width, height):
+        """Initialization.
+
+        Args:
+            width (int): Width of the viewport (px).
+            height (int): Height of the viewport (px).
+        """
+        self.width = width
+        self.height = height
+        self.target = None
+        self.reset()
+
+#######################################
+# Methods.
+
+    def reset(self):
+        """Centers the view on the window with no zoom or following."""
+        self.center = Vector(self.width / 2, self.height / 2)
+        self.zoom = 1
+        self.target = None
+
+    def follow(self, target):
+        """Keeps the view centered on a target.
+
+        Args:
+            target (Moon, Planet or Body): Object with a locus member
+                to follow, or None to stop following.
+
+        Returns:
+            Nothing.
+        """
+        self.target = target
+        self.update()
+
+    def update(self):
+        """Re-centers the view on the followed target, if any."""
+        if self.target != None:
+            self.center = Vector(self.target.locus.x, self.target.locus.y)
+
+    def pan(self, dx, dy):
+        """Moves the view by a window displacement.
+
+        Args:
+            dx (float): Window x-displacement (px).
+            dy (float): Window y-displacement (px).
+
+        Returns:
+            Nothing.
+
+        The view moves with the mouse, i.e., the world point under
+        the mouse stays under the mouse. Panning stops following.
+        """
+        self.target = None
+        self.center = self.center - Vector(dx, dy) / self.zoom
+
+    def zoom_at(self, x, y, factor):
+        """Zooms the view about a window point.
+
+        Args:
+            x (float): Window x-coordinate that stays fixed.
+            y (float): Window y-coordinate that stays fixed.
+            factor (float): Zoom multiplier (> 1 zooms in).
+
+        Returns:
+            Nothing.
+
+        The zoom is kept between CAMERA_MIN_ZOOM and CAMERA_MAX_ZOOM.
+        When following a target, the zoom is about the target.
+        """
+        zoom = min(max(self.zoom * factor, const.CAMERA_MIN_ZOOM),
+                   const.CAMERA_MAX_ZOOM)
+        if self.target == None:
+            fixed = self.to_world(x, y)
+            offset = Vector(x - self.width / 2, y - self.height / 2)
+            self.center = fixed - offset / zoom
+        self.zoom = zoom
+
+    def to_world(self, x, y):
+        """Converts a window point to a world point (Vector)."""
+        return Vector(
+            (x - self.width / 2) / self.zoom + self.center.x,
+            (y - self.height / 2) / self.zoom + self.center.y)
+
+    def to_window(self, point):
+        """Converts a world point (Vector) to a window point (Vector)."""
+        return Vector(
+            (point.x - self.center.x) * self.zoom + self.width / 2,
+            (point.y - self.center.y) * self.zoom + self.height / 2)
+
+    def bounds(self):
+        """Returns the visible world region as a Rect."""
+        width = self.width / self.zoom
+        height = self.height / self.zoom
+        return Rect(
+            self.center.x - width / 2, self.center.y - height / 2,
+            width, height)
+
+    def apply(self, x=0, y=0):
+        """Sets the openGL modelview matrix to the camera transform.
+
+        Args:
+            x, y (float): Window position of the lower left corner of
+                the viewport (px).
+
+        Returns:
+            Nothing.
+        """
+        gl.glLoadIdentity()
+        gl.glTranslatef(x + self.width / 2, y + self.height / 2, 0)
+        gl.glScalef(self.zoom, self.zoom, 1)
+        gl.glTranslatef(-self.center.x, -self.center.y, 0)
+
+#######################################
+# Core functions.
+
+def overlaps(rect, x0, y0, x1, y1):
+    """Determines whether a rect overlaps a box.
+
+    Args:
+        rect (Rect): Rectangle.
+        x0, y0 (float): Lower-left corner of the box.
+        x1, y1 (float): Upper-right corner of the box.
+
+    Returns:
+        bool: True if the rect and box overlap.
+    """
+    return (x1 >= rect.x and x0 <= rect.x + rect.width and
+            y1 >= rect.y and y0 <= rect.y + rect.height)
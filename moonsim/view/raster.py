@@ -0,0 +1,336 @@
+import math
+import os
+import queue
+import struct
+import threading
+import zlib
+import numpy as np
+from resources import const
+
+class Rasterizer():
+    """Draws the simulation into an RGBA array without OpenGL.
+
+    The frame is a float32 array of shape (height, width, 4) with
+    channel values in [0, 1]. Row 0 is the top of the image, so
+    simulation y-coordinates are flipped when drawn to match what is
+    seen in the window.
+    """
+
+    def __init__(self, width, height):
+        """Initialization.
+
+        Args:
+            width (int): Width of the frame (px).
+            height (int): Height of the frame (px).
+        """
+        self.width = width
+        self.height = height
+        self.frame = np.empty((height, width, 4), dtype=np.float32)
+        self.exposure = None
+        # OpenGL clamps the clear color to [0, 1], so do the same.
+        self.background = np.empty_like(self.frame)
+        self.background[...] = np.clip(
+            np.array(const.MAIN_WIN_CLEAR_CLR, dtype=np.float32), 0, 1)
+        self.clear()
+
+#######################################
+# Generic methods.
+
+    def clear(self):
+        """Clears the frame to the main window clear color."""
+        np.copyto(self.frame, self.background)
+
+    def render(self, moon, planets, companions=(), batched=None):
+        """Draws a complete frame of the simulation.
+
+        Args:
+            moon (Moon or Body): Moon with path to be drawn.
+            planets (list of Planet or Body): Planets to be drawn.
+            companions (list of Moon or Body): Additional moons with
+                paths to be drawn.
+            batched (tuple): If not None, the (n, 2) positions of the
+                batched moons in flight and crashed (see
+                Ensemble.positions), drawn without paths.
+
+        Returns:
+            numpy.ndarray: The frame member.
+
+        Objects are drawn in the same order as the Viewer paints
+        them, i.e., the path first, then the planets and moon.
+        """
+        self.clear()
+        moons = [moon] + list(companions)
+        for body in moons:
+            self.render_path(body)
+        for planet in planets:
+            self.render_body(planet, const.RASTER_PLANET_CLR)
+        if batched != None:
+            flying, crashed = batched
+            self.render_discs(
+                crashed, const.RASTER_CRASH_RADIUS, const.RASTER_CRASH_CLR)
+            self.render_discs(
+                flying, const.MOON_WIDTH / 2, const.RASTER_MOON_CLR)
+        for body in moons:
+            if body.crashed:
+                self.render_body(
+                    body, const.RASTER_CRASH_CLR, const.RASTER_CRASH_RADIUS)
+            else:
+                self.render_body(body, const.RASTER_MOON_CLR)
+        return self.frame
+
+    def render_body(self, body, color, radius=None):
+        """Draws a body as a filled disc.
+
+        Args:
+            body (Moon, Planet or Body): Object with locus and width
+                members.
+            color (tuple of float): RGBA color of the disc.
+            radius (float): Radius of the disc (px). If None, then
+                half the body width is used.
+
+        Returns:
+            Nothing.
+        """
+        if radius == None:
+            radius = body.width / 2
+        cx = body.locus.x
+        cy = self.height - body.locus.y
+        col0 = max(int(cx - radius), 0)
+        col1 = min(int(cx + radius) + 1, self.width)
+        row0 = max(int(cy - radius), 0)
+        row1 = min(int(cy + radius) + 1, self.height)
+        if col0 >= col1 or row0 >= row1:
+            return
+        rows, cols = np.ogrid[row0:row1, col0:col1]
+        inside = ((cols + 0.5 - cx) ** 2 + (rows + 0.5 - cy) ** 2
+                  <= radius ** 2)
+        coverage = inside.astype(np.float32) * color[3]
+        self.__blend(self.frame[row0:row1, col0:col1], color, coverage)
+
+    def render_discs(self, centers, radius, color):
+        """Draws many discs of the same size and color at once.
+
+        Args:
+            centers (numpy.ndarray): (n, 2) positions of the centers.
+            radius (float): Radius of the discs (px).
+            color (tuple of float): RGBA color of the discs.
+
+        Returns:
+            Nothing.
+
+        The pixels covered are the same as with render_body, but the
+        discs are drawn without a loop over them: each row of each
+        disc marks the start and end of its run of pixels in a
+        difference array, whose running sum along the rows is the
+        coverage. Overlapping discs are blended once.
+        """
+        if len(centers) == 0:
+            return
+        cx = centers[:, 0, np.newaxis]
+        cy = self.height - centers[:, 1, np.newaxis]
+        offsets = np.arange(-math.ceil(radius), math.ceil(radius) + 1)
+        rows = np.floor(cy).astype(np.intp) + offsets
+        half2 = radius ** 2 - (rows + 0.5 - cy) ** 2
+        half = np.sqrt(np.maximum(half2, 0))
+        col0 = np.maximum(np.ceil(cx - half - 0.5).astype(np.intp), 0)
+        col1 = np.minimum(np.floor(cx + half - 0.5).astype(np.intp),
+                          self.width - 1)
+        keep = ((half2 >= 0) & (rows >= 0) & (rows < self.height) &
+                (col0 <= col1))
+        if not keep.any():
+            return
+        rows, col0, col1 = rows[keep], col0[keep], col1[keep]
+        row0, row1 = rows.min(), rows.max() + 1
+        runs = np.zeros((row1 - row0, self.width + 1), dtype=np.int32)
+        np.add.at(runs, (rows - row0, col0), 1)
+        np.add.at(runs, (rows - row0, col1 + 1), -1)
+        inside = np.cumsum(runs[:, :self.width], axis=1) > 0
+        coverage = inside.astype(np.float32) * color[3]
+        self.__blend(self.frame[row0:row1], color, coverage)
+
+    def render_path(self, moon):
+        """Draws the path traveled by the moon.
+
+        Args:
+            moon (Moon or Body): Moon object with path to be drawn.
+
+        Returns:
+            Nothing.
+
+        The path fades to 100% transparency as it gets further from
+        the moon exactly as in Viewer.render_path: vertex x of n has
+        alpha x / n and the alpha is interpolated along each segment.
+        Each segment is sampled at sub-pixel spacing and all samples
+        are drawn at once.
+        """
+        points = np.asarray(moon.path, dtype=np.float64).reshape(-1, 2)
+        num_ver = len(points)
+        if num_ver < 2:
+            return
+        starts = points[:-1]
+        deltas = points[1:] - starts
+        lengths = np.hypot(deltas[:, 0], deltas[:, 1])
+        counts = np.ceil(lengths * 2).astype(np.intp) + 1
+        seg = np.repeat(np.arange(num_ver - 1), counts)
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        t = (np.arange(len(seg)) - first) / np.maximum(counts[seg] - 1, 1)
+        xs = starts[seg, 0] + t * deltas[seg, 0]
+        ys = starts[seg, 1] + t * deltas[seg, 1]
+        alphas = (seg + 1 + t) / num_ver * const.MOON_PATH_CLR[3]
+        cols = np.floor(xs).astype(np.intp)
+        rows = self.height - 1 - np.floor(ys).astype(np.intp)
+        keep = ((cols >= 0) & (cols < self.width) &
+                (rows >= 0) & (rows < self.height))
+        if not keep.any():
+            return
+        cols, rows, alphas = cols[keep], rows[keep], alphas[keep]
+        # Blend only over the bounding box of the path.
+        col0, col1 = cols.min(), cols.max() + 1
+        row0, row1 = rows.min(), rows.max() + 1
+        coverage = np.zeros((row1 - row0, col1 - col0), dtype=np.float32)
+        np.maximum.at(coverage, (rows - row0, cols - col0), alphas)
+        self.__blend(
+            self.frame[row0:row1, col0:col1], const.MOON_PATH_CLR, coverage)
+
+    def expose(self):
+        """Adds the current frame to the long-exposure image.
+
+        Args:
+            None.
+
+        Returns:
+            numpy.ndarray: The long-exposure image.
+
+        The long exposure keeps the brightest value of each channel
+        seen so far, so every moon position and trail is retained.
+        """
+        if self.exposure is None:
+            self.exposure = self.frame.copy()
+        else:
+            np.maximum(self.exposure, self.frame, out=self.exposure)
+        return self.exposure
+
+    def __blend(self, target, color, coverage):
+        """Alpha-blends a solid color over part of the frame.
+
+        Args:
+            target (numpy.ndarray): View of the frame to blend into.
+            color (tuple of float): RGB(A) color to blend.
+            coverage (numpy.ndarray): Per-pixel source alpha.
+
+        Returns:
+            Nothing.
+
+        Uses the same blending as the Viewer, i.e. (SRC_ALPHA,
+        ONE_MINUS_SRC_ALPHA) applied to all four channels.
+        """
+        alpha = coverage[..., np.newaxis]
+        source = np.empty(4, dtype=np.float32)
+        source[:3] = color[:3]
+        source[3] = 1
+        target *= 1 - alpha
+        target += alpha * source
+
+class FrameWriter():
+    """Encodes and writes PNG frames on background threads."""
+
+    def __init__(self, threads=const.RASTER_WRITERS,
+                 queue_size=const.RASTER_QUEUE_SIZE,
+                 level=const.RASTER_PNG_LEVEL):
+        """Initialization.
+
+        Args:
+            threads (int): Number of writer threads.
+            queue_size (int): Max number of frames waiting to be
+                written before write blocks.
+            level (int): zlib compression level.
+        """
+        self.level = level
+        self.__queue = queue.Queue(maxsize=queue_size)
+        self.__errors = list()
+        self.__threads = [
+            threading.Thread(target=self.__work, daemon=True)
+            for x in range(threads)]
+        for thread in self.__threads:
+            thread.start()
+
+    def write(self, path, frame):
+        """Queues a frame to be written as a PNG file.
+
+        Args:
+            path (str): Path of the file to write.
+            frame (numpy.ndarray): Float RGBA frame. It is converted
+                (and so copied) before this method returns, so the
+                caller may reuse it immediately.
+
+        Returns:
+            Nothing.
+        """
+        self.__queue.put((path, to_rgba8(frame)))
+
+    def close(self):
+        """Waits for all queued frames to be written.
+
+        Raises the first error encountered by a writer thread.
+        """
+        for thread in self.__threads:
+            self.__queue.put(None)
+        for thread in self.__threads:
+            thread.join()
+        if self.__errors:
+            raise self.__errors[0]
+
+    def __work(self):
+        """Writer thread loop."""
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+            path, data = item
+            try:
+                write_png(path, data, self.level)
+            except Exception as err:
+                self.__errors.append(err)
+
+#######################################
+# Core functions.
+
+def to_rgba8(frame):
+    """Converts a float RGBA frame to 8-bit channels."""
+    scaled = np.clip(frame, 0, 1)
+    scaled *= 255
+    scaled += 0.5
+    return scaled.astype(np.uint8)
+
+def encode_png(rgba, level=const.RASTER_PNG_LEVEL):
+    """Encodes an 8-bit RGBA array as PNG data.
+
+    Args:
+        rgba (numpy.ndarray): Array of shape (height, width, 4) and
+            dtype uint8.
+        level (int): zlib compression level.
+
+    Returns:
+        bytes: The PNG file contents.
+    """
+    height, width = rgba.shape[:2]
+    # Each scanline is prefixed by its filter type (0, none).
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(height, -1)
+    def chunk(tag, data):
+        return (struct.pack(">I", len(data)) + tag + data +
+                struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff))
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        chunk(b"IHDR", header),
+        chunk(b"IDAT", zlib.compress(raw.tobytes(), level)),
+        chunk(b"IEND", b"")])
+
+def write_png(path, rgba, level=const.RASTER_PNG_LEVEL):
+    """Writes an 8-bit RGBA array to a PNG file."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "wb") as png:
+        png.write(encode_png(rgba, level))
@@ -1,6 +1,7 @@
 import pyglet
 from pyglet import gl
 from model.engine import Vector
+from view.camera import Camera, overlaps
 import resources.indices as ind
 from resources import const
 
@@ -15,8 +16,12 @@ class Viewer():
                 viewer will be managing.
         """
         pyglet.gl.glClearColor(*const.MAIN_WIN_CLEAR_CLR)
+        self.camera = Camera(window.width, window.height)
         self.arrow = {ind.VIS: False}
         self.path = {ind.VIS: False}
+        self.prediction = {ind.VIS: False}
+        self.batched = {ind.VIS: False}
+        self.batched_group = PointGroup(self.camera)
         self.label = pyglet.text.Label(
             font_name=const.MOON_PAR_LBL_FONT,
             color=const.MOON_PAR_LBL_PS_CLR,
@@ -26,17 +31,30 @@ class Viewer():
             anchor_x='left',
             anchor_y='bottom')
         self.show_label = False
+        self.profile_label = pyglet.text.Label(
+            font_name=const.MOON_PAR_LBL_FONT,
+            color=const.PROF_LBL_CLR,
+            font_size=const.MOON_PAR_LBL_SIZE,
+            multiline=True,
+            width=window.width,
+            y=window.height,
+            anchor_x='left',
+            anchor_y='top')
+        self.show_profile = False
 
 #######################################
 # Generic methods.
 
-    def paint(self, window, graphics_batch):
+    def paint(self, window, graphics_batch, ui_batch=None):
         """Paints all graphics given their current rendering.
     
         Args:
             window (pyglet.window.Window): Window being painted.
             graphics_batch (pyglet.graphics.Batch): Graphics batch
-                of objects with draw methods to be painted.
+                of objects with draw methods to be painted in world
+                coordinates, i.e., through the camera.
+            ui_batch (pyglet.graphics.Batch): Graphics batch of
+                objects to be painted in window coordinates.
 
         Returns:
             Nothing.
@@ -53,25 +71,68 @@ class Viewer():
         gl.glEnable(gl.GL_BLEND)
         gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
         gl.glMatrixMode(gl.GL_MODELVIEW)
-        gl.glLoadIdentity()
+        self.camera.apply()
 
         # Draw all the objects.
         if self.arrow[ind.VIS] == True:
+            gl.glPushMatrix()
             gl.glTranslatef(self.arrow[ind.LOC].x, self.arrow[ind.LOC].y, 0)
             gl.glRotatef(self.arrow[ind.ANG], 0, 0, 1)
             pyglet.graphics.draw(self.arrow[ind.NMV], gl.GL_TRIANGLE_FAN,
                 ("v2f", self.arrow[ind.VER]), ("c4f", self.arrow[ind.CLR]))
-            gl.glLoadIdentity()
+            gl.glPopMatrix()
             self.arrow[ind.VIS] = False
+        if self.prediction[ind.VIS] == True:
+            pyglet.graphics.draw(
+                self.prediction[ind.NMV], gl.GL_LINE_STRIP,
+                ("v2f", self.prediction[ind.VER]),
+                ("c4f", self.prediction[ind.CLR]))
+            self.prediction[ind.VIS] = False
         if self.path[ind.VIS] == True:
-            pyglet.graphics.draw(self.path[ind.NMV], gl.GL_LINE_STRIP,
-                ("v2f", self.path[ind.VER]), ("c4f", self.path[ind.CLR]))
-            gl.glLoadIdentity()
+            for num_ver, vertices, colors in zip(
+                self.path[ind.NMV], self.path[ind.VER], self.path[ind.CLR]):
+                pyglet.graphics.draw(num_ver, gl.GL_LINE_STRIP,
+                    ("v2f", vertices), ("c4f", colors))
             self.path[ind.VIS] = False
+        if self.batched[ind.VIS] == True:
+            self.batched_group.set_state()
+            for num_ver, vertices, color in zip(
+                self.batched[ind.NMV], self.batched[ind.VER],
+                self.batched[ind.CLR]):
+                gl.glColor4f(*color)
+                pyglet.graphics.draw(num_ver, gl.GL_POINTS, ("v2f", vertices))
+            gl.glColor4f(1, 1, 1, 1)
+            self.batched_group.unset_state()
+            self.batched[ind.VIS] = False
         graphics_batch.draw()
+        gl.glLoadIdentity()
+        if ui_batch != None:
+            ui_batch.draw()
         if self.show_label:
             self.label.draw()
             self.show_label = False
+        if self.show_profile:
+            self.profile_label.draw()
+            self.show_profile = False
+
+    def cull(self, sprites):
+        """Hides sprites that are outside the camera view.
+
+        Args:
+            sprites (list of pyglet.sprite.Sprite): World objects
+                drawn by the graphics batch.
+
+        Returns:
+            Nothing.
+        """
+        view = self.camera.bounds()
+        for sprite in sprites:
+            visible = overlaps(
+                view, sprite.x, sprite.y,
+                sprite.x + sprite.width, sprite.y + sprite.height)
+            # Setting visible rewrites the vertices of the sprite.
+            if sprite.visible != visible:
+                sprite.visible = visible
 
     def render_arrow(self, moon):
         """Renders the moon velocity arrow for painting.
@@ -105,19 +166,88 @@ class Viewer():
         Sets up the self.path member dictionary with all the data
         required for openGL painting and sets the visibility of the
         path to True. The path is draw such that line segments fade
-        to 100% transparency as they get further from the moon.
+        to 100% transparency as they get further from the moon. Only
+        segments overlapping the camera view are kept, so the path is
+        stored as a list of line strips, one for each visible run of
+        segments.
         """
+        path = moon.path
+        num_ver = len(path) // 2
+        view = self.camera.bounds()
+        strips = list()
+        vertices = list()
         colors = list()
-        num_ver = len(moon.path) // 2
-        for x in range(1, num_ver + 1):
-            colors.extend(const.MOON_PATH_CLR[:3] + (x / num_ver,))
+        for x in range(1, num_ver):
+            x0, y0, x1, y1 = path[2 * x - 2:2 * x + 2]
+            if overlaps(view, min(x0, x1), min(y0, y1),
+                        max(x0, x1), max(y0, y1)):
+                if not vertices:
+                    vertices.extend((x0, y0))
+                    colors.extend(const.MOON_PATH_CLR[:3] + (x / num_ver,))
+                vertices.extend((x1, y1))
+                colors.extend(const.MOON_PATH_CLR[:3] + ((x + 1) / num_ver,))
+            elif vertices:
+                strips.append((vertices, colors))
+                vertices = list()
+                colors = list()
+        if vertices:
+            strips.append((vertices, colors))
         self.path[ind.VIS] = True
-        self.path[ind.VER] = tuple(moon.path)
-        self.path[ind.NMV] = num_ver
-        self.path[ind.CLR] = tuple(colors)
+        self.path[ind.VER] = [tuple(vertices) for vertices, colors in strips]
+        self.path[ind.NMV] = [len(vertices) // 2 for vertices, colors in strips]
+        self.path[ind.CLR] = [tuple(colors) for vertices, colors in strips]
         
+    def render_batched(self, flying, crashed):
+        """Renders the batched moons (see Ensemble) for painting.
+
+        Args:
+            flying (numpy.ndarray): (n, 2) positions of the moons in
+                flight.
+            crashed (numpy.ndarray): (n, 2) positions of the crashed
+                moons.
+
+        Returns:
+            Nothing.
+
+        Sets up the self.batched member dictionary with all the data
+        required for openGL painting and sets the visibility of the
+        moons to True. The moons are drawn as points the size of the
+        moon sprite, with one color per state, so their vertices are
+        copied from the arrays at once instead of moon by moon.
+        """
+        self.batched[ind.VIS] = True
+        self.batched[ind.NMV] = [len(flying), len(crashed)]
+        self.batched[ind.VER] = [
+            flying.ravel().tolist(), crashed.ravel().tolist()]
+        self.batched[ind.CLR] = [
+            const.MOON_BATCH_CLR, const.MOON_BATCH_CRASH_CLR]
+
+    def render_prediction(self, vertices):
+        """Renders the predicted trajectory of the moon for painting.
+
+        Args:
+            vertices (tuple of float): Flat (x0, y0, x1, y1, ...)
+                vertices of the prediction as returned by
+                Predictor.result.
+
+        Returns:
+            Nothing.
+
+        Sets up the self.prediction member dictionary with all the
+        data required for openGL painting and sets the visibility of
+        the prediction to True if there is anything to draw.
+        """
+        num_ver = len(vertices) // 2
+        if num_ver < 2:
+            return
+        self.prediction[ind.VIS] = True
+        self.prediction[ind.NMV] = num_ver
+        self.prediction[ind.VER] = vertices
+        self.prediction[ind.CLR] = const.PREDICT_CLR * num_ver
+
     def render_label(self,
-        energy, moon, fps, state, mode, run_time, origin=Vector(0,0)):
+        energy, moon, fps, state, mode, run_time, origin=Vector(0,0),
+        divs=None):
         """Renders the data label for the simulation parameters.
             
         Args:
@@ -129,6 +259,8 @@ class Viewer():
             run_time (float): Current run time of the simulation (s).
             origin (Vector): Location from which to calculate the
                 radial distance of the moon.
+            divs (int): RK4 substeps per frame chosen by the quality
+                governor, or None if not governed.
 
         Returns:
             Nothing.
@@ -156,7 +288,8 @@ class Viewer():
         self.label.text = const.MOON_PAR_LBL_STRING.format(
             run_days,
             total_energy, kinetic_energy, potential_energy,
-            radial_dist, speed, velx, vely, fps)
+            radial_dist, speed, velx, vely, fps,
+            "-" if divs == None else str(divs))
         self.label.color = {
             ind.RUNNING: const.MOON_PAR_LBL_RUN_CLR,
             ind.PAUSED: const.MOON_PAR_LBL_PS_CLR,
@@ -166,3 +299,84 @@ class Viewer():
         if moon.crashed:
             self.label.color = const.MOON_PAR_LBL_CRASH_CLR
         self.show_label = True
+
+    def render_profile(self, stats):
+        """Renders the frame timing label.
+
+        Args:
+            stats (dict): Section names mapped to (p50, p95, max)
+                time per frame (s) as returned by Profiler.stats.
+
+        Returns:
+            Nothing.
+
+        Sets the visibility of the timing label to True. Times are
+        displayed in milliseconds.
+        """
+        lines = [const.PROF_LBL_HEADER]
+        for name, times in stats.items():
+            lines.append(const.PROF_LBL_STRING.format(
+                name, *[1000 * x for x in times]))
+        self.profile_label.text = "\n".join(lines)
+        self.show_profile = True
+
+class PaneGroup(pyglet.graphics.Group):
+    """Draws its children through a camera, clipped to a viewport.
+
+    The viewport is a region of the window, so that several scenes
+    can be drawn side by side from a single batch, each with its own
+    group and camera.
+    """
+
+    def __init__(self, camera, x, y, parent=None):
+        """Initialization.
+
+        Args:
+            camera (Camera): Camera of the viewport. Its dimensions are
+                the dimensions of the viewport.
+            x, y (int): Window position of the lower left corner of
+                the viewport (px).
+            parent (pyglet.graphics.Group): Parent group.
+        """
+        super().__init__(parent)
+        self.camera = camera
+        self.x = x
+        self.y = y
+
+    def set_state(self):
+        gl.glEnable(gl.GL_SCISSOR_TEST)
+        gl.glScissor(
+            int(self.x), int(self.y),
+            int(self.camera.width), int(self.camera.height))
+        gl.glMatrixMode(gl.GL_MODELVIEW)
+        gl.glPushMatrix()
+        self.camera.apply(self.x, self.y)
+
+    def unset_state(self):
+        gl.glPopMatrix()
+        gl.glDisable(gl.GL_SCISSOR_TEST)
+
+class PointGroup(pyglet.graphics.Group):
+    """Draws points as round discs the size of the moon sprite.
+
+    The size of the points follows the zoom of the camera, so the
+    discs are as large as the moon sprites around them.
+    """
+
+    def __init__(self, camera, parent=None):
+        """Initialization.
+
+        Args:
+            camera (Camera): Camera the points are drawn through.
+            parent (pyglet.graphics.Group): Parent group.
+        """
+        super().__init__(parent)
+        self.camera = camera
+
+    def set_state(self):
+        gl.glEnable(gl.GL_POINT_SMOOTH)
+        gl.glPointSize(max(1, const.MOON_WIDTH * self.camera.zoom))
+
+    def unset_state(self):
+        gl.glPointSize(1)
+        gl.glDisable(gl.GL_POINT_SMOOTH)